@@ -1,15 +1,116 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import List, Optional
 
 class Settings(BaseSettings):
     # MongoDB 配置（連接字串包含資料庫名稱，與 MERN-Todo-List 相同）
     mongodb_uri: str = "mongodb://localhost:27017/kpop_gallery"
     
+    # MongoDB 連線池：每台主機的連線數上下限、閒置連線關閉時間、等待可用連線與各種逾時（毫秒，0 表示不限制）
+    mongo_max_pool_size: int = 100
+    mongo_min_pool_size: int = 0
+    mongo_max_idle_time_ms: int = 0
+    mongo_wait_queue_timeout_ms: int = 0
+    mongo_connect_timeout_ms: int = 20000
+    mongo_socket_timeout_ms: int = 0
+    mongo_server_selection_timeout_ms: int = 5000
+    
+    # 列表與搜尋端點從 secondary 讀取（secondaryPreferred），落後 primary 超過 max staleness 的 secondary 不使用（最少 90 秒）
+    # 寫入後 read_your_writes 秒內，受影響的列表仍從 primary 讀取，使用者看得到自己剛寫入的資料
+    mongo_read_from_secondaries: bool = False
+    mongo_max_staleness_seconds: int = 90
+    mongo_read_your_writes_seconds: float = 10.0
+    
     # Cloudinary 配置
     cloudinary_cloud_name: Optional[str] = None
     cloudinary_api_key: Optional[str] = None
     cloudinary_api_secret: Optional[str] = None
     
+    # 儲存後端：cloudinary 或 local（本機檔案系統）
+    storage_backend: str = "cloudinary"
+    local_storage_dir: str = "storage"
+    # local 後端產生檔案 URL 時使用的 API 對外網址
+    public_base_url: str = "http://localhost:8000"
+    
+    # 直接上傳（客戶端取得簽章參數後直接上傳到儲存空間，不經過 API）：簽章的有效秒數
+    # （Cloudinary 本身最多接受 1 小時內簽署的上傳參數）
+    direct_upload_expires_seconds: int = 900
+    # local 後端簽署直接上傳的密鑰；未設定時每個 process 隨機產生（多 worker 模式必須設定）
+    direct_upload_secret: Optional[str] = None
+    
+    # 可續傳上傳（分段 PATCH）的暫存目錄與上傳階段的有效秒數
+    # （多 worker 模式下所有 worker 要使用同一個目錄）
+    resumable_upload_dir: str = "upload_sessions"
+    resumable_upload_expires_seconds: int = 86400
+    
+    # 內容去重（SHA-256）範圍：star（同一個明星內）、global（跨明星共用檔案，引用計數）、off
+    dedup_scope: str = "star"
+    
+    # 感知雜湊（dHash）Hamming 距離在此範圍內視為近似重複的圖片
+    near_duplicate_distance: int = 6
+    
+    # 衍生圖（縮圖）：寬度與格式（avif、webp），上傳時是否預先產生（eager）
+    image_variant_widths: List[int] = [320, 640, 1280]
+    image_variant_formats: List[str] = ["avif", "webp"]
+    image_eager_variants: bool = True
+    
+    # 上傳前處理（在 process pool 中執行）：轉正、移除 metadata、縮小到最大邊長、重新編碼（webp 或 jpeg）
+    image_preprocess: bool = False
+    preprocess_max_dimension: int = 2560
+    preprocess_format: str = "webp"
+    preprocess_quality: int = 85
+    # 0 表示依 CPU 核心數平均分給每個 worker process
+    preprocess_workers: int = 0
+    
+    # 上傳排程：專用執行緒數（全域並發上限）、每個請求的並發上限、排隊檔案數上限
+    upload_max_workers: int = 8
+    upload_per_request_limit: int = 4
+    upload_max_queued: int = 200
+    
+    # 多 worker 模式：uvicorn --workers 的 process 數（與 uvicorn 相同讀取 WEB_CONCURRENCY）
+    # 每個 worker 各自有 MongoDB 連線池、上傳執行緒池、背景工作 worker 與回應快取
+    web_concurrency: int = 1
+    # 明星搜尋索引最多每隔幾秒確認一次其他 worker 是否寫入過（世代計數器），
+    # 多 worker 模式下新增、改名、刪除的明星最多延遲這麼久才會出現在其他 worker 的搜尋結果
+    star_search_sync_seconds: float = 1.0
+    # 關閉時等待進行中的上傳與背景工作完成的秒數，時間到還沒完成的背景工作放回佇列由其他 worker 接手
+    # （容器平台的終止寬限時間要大於 uvicorn --timeout-graceful-shutdown 加上這個值）
+    shutdown_drain_seconds: float = 15.0
+    
+    # 刪除明星時同時進行的批次刪除數（每批 100 張）
+    star_delete_concurrency: int = 4
+    
+    # 匯出 ZIP：同時從儲存空間下載的圖片數，與已下載、等待寫入 ZIP 的最多圖片數
+    # （每個匯出請求最多佔用約 (EXPORT_READ_AHEAD + 2) 張圖片的記憶體，與圖庫大小無關）
+    export_concurrency: int = 4
+    export_read_ahead: int = 8
+    
+    # 儲存空間與 MongoDB 對帳（清理孤兒檔案）：每次執行最多檢查的檔案數，
+    # 上傳後多久內的檔案不視為孤兒（上傳中、直接上傳還沒 finalize）
+    reconcile_max_files: int = 5000
+    reconcile_grace_seconds: int = 86400
+    
+    # 背景工作佇列：每個 process 的 worker 數、重試次數與指數退避、心跳過期時間、上傳暫存目錄
+    # 與所有 process 中還沒完成的背景上傳暫存檔總大小上限
+    job_workers: int = 2
+    job_max_attempts: int = 5
+    job_retry_base_seconds: float = 2.0
+    job_retry_max_seconds: float = 300.0
+    job_poll_seconds: float = 2.0
+    job_stale_seconds: float = 120.0
+    job_spool_dir: str = "job_spool"
+    job_spool_max_bytes: int = 2 * 1024 * 1024 * 1024
+    
+    # 明星與圖片列表的回應快取（每個 process 各自一份，多個 process 之間依 TTL 過期）
+    response_cache_enabled: bool = True
+    response_cache_ttl_seconds: float = 30.0
+    response_cache_max_entries: int = 1000
+    
+    # /api/health 對 MongoDB ping 的逾時秒數（超過視為未就緒，回應 503）
+    health_check_timeout_seconds: float = 2.0
+    
+    # 啟動時對 router 查詢執行 explain()，有 COLLSCAN 就啟動失敗（診斷用）
+    verify_query_plans: bool = False
+    
     class Config:
         env_file = ".env"
         case_sensitive = False
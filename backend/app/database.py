@@ -1,41 +1,71 @@
-from motor.motor_asyncio import AsyncIOMotorClient
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo.read_preferences import SecondaryPreferred
 from app.config import settings
+from app.indexes import ensure_indexes, verify_query_plans
+from app.metrics import mongo_command_metrics, mongo_pool_metrics
+
+# 連接字串中沒有資料庫名稱時使用的預設值
+DEFAULT_DATABASE_NAME = "KPOP-Gallery"
 
 class Database:
     client: AsyncIOMotorClient = None
+    # 依 client 快取的資料庫物件（primary 與列表用的 secondary）
+    _db_client: AsyncIOMotorClient = None
+    _db: AsyncIOMotorDatabase = None
+    _read_db: AsyncIOMotorDatabase = None
 
 database = Database()
 
+def _optional_ms(value: int):
+    """設定中的 0 表示不限制（pymongo 使用 None）"""
+    return value or None
+
+def client_options() -> dict:
+    """建立 AsyncIOMotorClient 的連線池與逾時設定"""
+    return {
+        "maxPoolSize": settings.mongo_max_pool_size,
+        "minPoolSize": settings.mongo_min_pool_size,
+        "maxIdleTimeMS": _optional_ms(settings.mongo_max_idle_time_ms),
+        "waitQueueTimeoutMS": _optional_ms(settings.mongo_wait_queue_timeout_ms),
+        "connectTimeoutMS": settings.mongo_connect_timeout_ms,
+        "socketTimeoutMS": _optional_ms(settings.mongo_socket_timeout_ms),
+        "serverSelectionTimeoutMS": settings.mongo_server_selection_timeout_ms,
+        # 指令與連線池監聽器（/metrics 與 /api/health/db）
+        "event_listeners": [mongo_command_metrics, mongo_pool_metrics],
+    }
+
 async def connect_to_mongo():
     """連接 MongoDB"""
     # Motor 會自動處理 mongodb+srv:// 的 SSL/TLS
     # 但我們需要確保連接字串格式正確
     uri = settings.mongodb_uri
-    
+
     # 對於 mongodb+srv://，Motor 會自動使用 TLS
     # 如果連接字串中沒有 retryWrites，添加它以確保穩定性
     if uri.startswith("mongodb+srv://") and "retryWrites" not in uri:
         separator = "&" if "?" in uri else "?"
         uri = f"{uri}{separator}retryWrites=true&w=majority"
-    
-    database.client = AsyncIOMotorClient(uri, serverSelectionTimeoutMS=5000)
+
+    database.client = AsyncIOMotorClient(uri, **client_options())
     # 測試連接
     await database.client.admin.command('ping')
     print(f"✅ 已連接到 MongoDB")
 
+    # 建立熱門查詢需要的索引（已存在則略過）
+    db = get_database()
+    await ensure_indexes(db)
+    if settings.verify_query_plans:
+        await verify_query_plans(db)
+
 async def close_mongo_connection():
     """關閉 MongoDB 連接"""
     if database.client:
         database.client.close()
         print("✅ 已關閉 MongoDB 連接")
 
-def get_database():
-    """取得資料庫實例（從連接字串中提取資料庫名稱）"""
-    # 從連接字串中提取資料庫名稱
+def database_name(uri: str) -> str:
+    """從連接字串中提取資料庫名稱"""
     # 格式：mongodb://host:port/db_name 或 mongodb+srv://host/db_name?options
-    uri = settings.mongodb_uri
-    
-    # 解析 URI 以提取資料庫名稱
     try:
         # 移除查詢參數
         uri_without_query = uri.split("?")[0]
@@ -43,12 +73,37 @@ def get_database():
         parts = uri_without_query.split("/")
         # 如果最後一部分是資料庫名稱（不是空字串且不是主機名）
         if len(parts) > 3 and parts[-1]:
-            db_name = parts[-1]
-        else:
-            # 如果沒有指定資料庫名稱，使用預設值
-            db_name = "KPOP-Gallery"
+            return parts[-1]
     except Exception:
-        # 如果解析失敗，使用預設值
-        db_name = "KPOP-Gallery"
-    
-    return database.client[db_name]
\ No newline at end of file
+        pass
+    # 如果沒有指定資料庫名稱或解析失敗，使用預設值
+    return DEFAULT_DATABASE_NAME
+
+def _refresh_handles() -> None:
+    """client 換過（重新連線、測試替換）時重新建立資料庫物件"""
+    db = database.client[database_name(settings.mongodb_uri)]
+    read_db = db
+    if settings.mongo_read_from_secondaries:
+        read_db = db.with_options(
+            read_preference=SecondaryPreferred(max_staleness=settings.mongo_max_staleness_seconds)
+        )
+    database._db_client = database.client
+    database._db = db
+    database._read_db = read_db
+
+def get_database():
+    """取得資料庫實例（所有讀寫都在 primary，連接字串只在連線後解析一次）"""
+    if database._db_client is not database.client:
+        _refresh_handles()
+    return database._db
+
+def get_read_database(recently_written: bool = False):
+    """
+    取得列表 / 搜尋用的資料庫實例
+
+    設定 MONGO_READ_FROM_SECONDARIES 時從 secondary 讀取（落後不超過 max staleness）；
+    recently_written 為 True（受影響的資料剛被這個 process 寫入過）時仍從 primary 讀取
+    """
+    if database._db_client is not database.client:
+        _refresh_handles()
+    return database._db if recently_written else database._read_db
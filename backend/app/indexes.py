@@ -0,0 +1,130 @@
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from bson import ObjectId
+from datetime import datetime
+
+# 索引登錄表：collection 名稱 -> 該 collection 需要的索引
+# 啟動時由 ensure_indexes() 建立，create_indexes 對已存在的同名同定義索引不會重建
+INDEXES = {
+    "images": [
+        # get_star_images 的分頁排序（page 與 cursor 模式）、delete_star 依明星查詢圖片
+        IndexModel(
+            [("star_id", ASCENDING), ("uploaded_at", DESCENDING), ("_id", DESCENDING)],
+            name="star_id_uploaded_at_id"
+        ),
+        # 上傳時的內容去重查詢（同一個明星是否已有相同 SHA-256 的圖片）；
+        # 唯一索引讓同時上傳的相同內容只有一個能寫入（沒有 content_hash 的圖片不在索引中）
+        IndexModel(
+            [("star_id", ASCENDING), ("content_hash", ASCENDING)],
+            name="star_id_content_hash_unique",
+            unique=True,
+            partialFilterExpression={"content_hash": {"$exists": True}}
+        ),
+        # 直接上傳 finalize 時找出已經記錄過的檔案（重送 finalize 不會重複建立圖片）
+        IndexModel([("s3_key", ASCENDING)], name="s3_key"),
+    ],
+    "stars": [
+        # create_star / update_star 的重複名字檢查
+        IndexModel([("name", ASCENDING)], name="name"),
+        # get_stars 依建立時間排序
+        IndexModel([("created_at", DESCENDING)], name="created_at"),
+        # get_stars 依最近上傳（sort=recent）與圖片數（sort=popular）排序
+        IndexModel([("last_uploaded_at", DESCENDING), ("_id", DESCENDING)], name="last_uploaded_at_id"),
+        IndexModel([("image_count", DESCENDING), ("_id", DESCENDING)], name="image_count_id"),
+    ],
+    "jobs": [
+        # worker 認領工作（依 next_run_at 排序）與恢復心跳過期的工作
+        IndexModel([("status", ASCENDING), ("next_run_at", ASCENDING)], name="status_next_run_at"),
+        # enqueue_once：同一類型的單一工作（待執行 / 執行中）同時只能有一個
+        # （sparse：沒有 singleton 欄位的一般工作與已結束的工作不在索引中）
+        IndexModel([("singleton", ASCENDING)], name="singleton", unique=True, sparse=True),
+    ],
+    "assets": [
+        # 對帳刪除孤兒檔案時一併刪除沒有圖片引用的 asset 記錄
+        IndexModel([("s3_key", ASCENDING)], name="s3_key"),
+    ],
+    "upload_sessions": [
+        # 清理過期的可續傳上傳階段
+        IndexModel([("expires_at", ASCENDING)], name="expires_at"),
+    ],
+}
+
+# 已被取代的索引：collection 名稱 -> 索引名稱，啟動時存在就刪除
+OBSOLETE_INDEXES = {
+    # 改為 star_id_content_hash_unique
+    "images": ["star_id_content_hash"],
+}
+
+async def ensure_indexes(db) -> None:
+    """依照 INDEXES 建立所有索引並刪除已被取代的索引（可重複執行）"""
+    for collection_name, indexes in INDEXES.items():
+        await db[collection_name].create_indexes(indexes)
+    for collection_name, names in OBSOLETE_INDEXES.items():
+        existing = await db[collection_name].index_information()
+        for name in names:
+            if name in existing:
+                await db[collection_name].drop_index(name)
+    print(f"✅ 已建立索引（{sum(len(i) for i in INDEXES.values())} 個）")
+
+def router_queries(db) -> dict:
+    """
+    各 router 熱門查詢的代表形狀，供 verify_query_plans() 做 explain()
+
+    查詢條件的值不重要，重要的是欄位、運算子與排序要和 router 中一致
+    """
+    star_id = ObjectId()
+    now = datetime.utcnow()
+    image_sort = [("uploaded_at", -1), ("_id", -1)]
+    return {
+        "get_star_images (page)": db.images.find({"star_id": star_id}).sort(image_sort).skip(20).limit(21),
+        "get_star_images (cursor)": db.images.find({
+            "star_id": star_id,
+            "$or": [
+                {"uploaded_at": {"$lt": now}},
+                {"uploaded_at": now, "_id": {"$lt": ObjectId()}}
+            ]
+        }).sort(image_sort).limit(21),
+        "prepare_image (dedup)": db.images.find({"star_id": star_id, "content_hash": "0" * 64}).limit(1),
+        "delete_star (images)": db.images.find({"star_id": star_id}),
+        "reconcile_storage (images)": db.images.find(
+            {"s3_key": {"$gt": "kpop_gallery/stars/", "$lte": "kpop_gallery/stars/~"}}, {"s3_key": 1, "_id": 0}
+        ).sort("s3_key", 1),
+        "export_star_images": db.images.find({"star_id": star_id}, {"s3_key": 1}).sort(image_sort),
+        "finalize_direct_uploads (recorded)": db.images.find({"s3_key": {"$in": ["key"]}}),
+        "get_stars": db.stars.find({}).sort("created_at", -1).limit(1000),
+        "get_stars (search)": db.stars.find({"_id": {"$in": [star_id]}}).sort("created_at", -1).limit(1000),
+        "get_stars (recent)": db.stars.find({}).sort([("last_uploaded_at", -1), ("_id", -1)]).limit(1000),
+        "get_stars (popular)": db.stars.find({}).sort([("image_count", -1), ("_id", -1)]).limit(1000),
+        "delete_image (next cover)": db.images.find({"star_id": star_id}).sort(image_sort).limit(1),
+        "job_service (claim)": db.jobs.find({"status": "queued", "next_run_at": {"$lte": now}}).sort("next_run_at", 1).limit(1),
+        "upload_session_service (sweep)": db.upload_sessions.find({"expires_at": {"$lt": now}}, {"_id": 1}),
+        "create_star (duplicate check)": db.stars.find({"name": "name"}).limit(1),
+        "update_star (duplicate check)": db.stars.find({"name": "name", "_id": {"$ne": star_id}}).limit(1),
+    }
+
+def _plan_stages(plan: dict):
+    """遞迴列出查詢計畫中的所有 stage"""
+    if not isinstance(plan, dict):
+        return
+    if "stage" in plan:
+        yield plan["stage"]
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            yield from _plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+
+async def verify_query_plans(db) -> None:
+    """
+    對每個 router 查詢執行 explain()，任何一個退化成 COLLSCAN 就直接失敗
+
+    在設定 VERIFY_QUERY_PLANS=true 時於啟動階段執行
+    """
+    collscans = []
+    for name, cursor in router_queries(db).items():
+        explain = await cursor.explain()
+        winning_plan = explain["queryPlanner"]["winningPlan"]
+        if "COLLSCAN" in _plan_stages(winning_plan):
+            collscans.append(name)
+    if collscans:
+        raise RuntimeError(f"以下查詢沒有使用索引（COLLSCAN）：{', '.join(collscans)}")
+    print("✅ 所有 router 查詢都有使用索引")
@@ -1,22 +1,63 @@
-from fastapi import FastAPI
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from app.database import connect_to_mongo, close_mongo_connection
-from app.routers import images, stars
+from app.config import settings
+from app.database import database, connect_to_mongo, close_mongo_connection, get_database
+from app.metrics import MetricsMiddleware, mark_process_dead, metrics_response, mongo_pool_metrics
+from app.services.star_search_service import star_search_service
+from app.services.upload_scheduler import upload_scheduler
+from app.services.preprocess_service import preprocess_service
+from app.services.image_metadata_service import image_metadata_service
+from app.services.job_service import job_service
+from app.services.response_cache import response_cache
+from app.services import star_summary_service
+from app.routers import files, images, jobs, stars, uploads
 
-app = FastAPI(
-    title="KPOP Gallery API",
-    version="1.0.0"
-)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    每個 worker process 的啟動與關閉
 
-@app.on_event("startup")
-async def startup_event():
+    多 worker 模式（uvicorn --workers / WEB_CONCURRENCY）下每個 process 各自執行一次，
+    各自擁有 MongoDB 連線池、上傳執行緒池、前處理 process pool 與背景工作 worker；
+    記憶體內的明星搜尋索引與感知雜湊索引以 MongoDB 中的世代計數器在 worker 之間同步
+    """
     # 啟動時連接 MongoDB
     await connect_to_mongo()
+    # 建立明星名字搜尋索引
+    await star_search_service.load(get_database())
+    # 啟動背景工作 worker（並恢復上次中斷的工作）
+    await job_service.start(get_database())
+    # 升級前建立的明星還沒有統計欄位時，排入一次背景重新計算（多個 worker 同時啟動也只排入一次）
+    if await star_summary_service.needs_repair(get_database()):
+        await job_service.enqueue_once(get_database(), "repair_star_summaries", {"star_ids": None})
+
+    yield
 
-@app.on_event("shutdown")
-async def shutdown_event():
+    # 關閉：uvicorn 已停止接受新連線並等待進行中的請求結束
+    # 不再接受新的上傳與背景工作，進行中的最多再等 SHUTDOWN_DRAIN_SECONDS；
+    # 時間到還沒完成的背景工作放回佇列，由其他 worker 或重新啟動後的 worker 接手
+    deadline = time.monotonic() + settings.shutdown_drain_seconds
+    await job_service.stop(settings.shutdown_drain_seconds)
+    drained = await upload_scheduler.drain(max(0.0, deadline - time.monotonic()))
+    # 上傳請求結束後可能還有擷取版面資訊的批次在執行緒池中（呼叫端已取消）
+    drained = await image_metadata_service.drain(max(0.0, deadline - time.monotonic())) and drained
+    if not drained:
+        print("⚠️  關閉時仍有上傳未完成，將被中斷")
     # 關閉時斷開連接
     await close_mongo_connection()
+    # 關閉上傳執行緒池與前處理的 process pool
+    upload_scheduler.shutdown()
+    preprocess_service.shutdown()
+    mark_process_dead()
+
+app = FastAPI(
+    title="KPOP Gallery API",
+    version="1.0.0",
+    lifespan=lifespan
+)
 
 # CORS 設定 - 允許所有來源（與 MERN-Todo-List 專案相同）
 app.add_middleware(
@@ -25,11 +66,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # 讓前端可以讀取分頁游標、快取驗證碼與可續傳上傳的位置
+    expose_headers=["X-Next-Cursor", "ETag", "Location", "Upload-Offset", "Upload-Length", "Upload-Expires"],
 )
 
+# 每個路由的延遲與狀態碼（放在最外層，CORS 的 preflight 也會被記錄）
+app.add_middleware(MetricsMiddleware)
+
 # 註冊路由
 app.include_router(stars.router)
 app.include_router(images.router)
+app.include_router(files.router)
+app.include_router(jobs.router)
+app.include_router(uploads.router)
 
 @app.get("/")
 async def root():
@@ -37,5 +86,42 @@ async def root():
 
 @app.get("/api/health")
 async def health_check():
+    """就緒檢查：在逾時內 ping 得到 MongoDB 才回應 ok，否則（或正在關閉時）回應 503"""
+    if upload_scheduler.draining:
+        raise HTTPException(status_code=503, detail="服務正在關閉")
+    if database.client is None:
+        raise HTTPException(status_code=503, detail="資料庫尚未連線")
+    try:
+        await asyncio.wait_for(get_database().command("ping"), settings.health_check_timeout_seconds)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="資料庫連線逾時")
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"資料庫無法連線: {str(e)}")
     return {"status": "ok"}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus 指標"""
+    return metrics_response()
+
+@app.get("/api/health/uploads")
+async def upload_scheduler_stats():
+    """上傳排程器的佇列深度與等待時間，以及前處理各階段的平均耗時"""
+    return {**upload_scheduler.stats(), "preprocess": preprocess_service.stats()}
+
+
+@app.get("/api/health/cache")
+async def response_cache_stats():
+    """回應快取的命中率與筆數"""
+    return response_cache.stats()
+
+@app.get("/api/health/db")
+async def database_pool_stats():
+    """MongoDB 連線池的連線數與取得連線的等待時間，以及讀取偏好設定"""
+    return {
+        "pools": mongo_pool_metrics.stats(),
+        "max_pool_size": settings.mongo_max_pool_size,
+        "min_pool_size": settings.mongo_min_pool_size,
+        "read_from_secondaries": settings.mongo_read_from_secondaries,
+        "max_staleness_seconds": settings.mongo_max_staleness_seconds,
+    }
@@ -0,0 +1,266 @@
+"""
+Prometheus 指標
+
+- HTTP：每個路由（路徑樣板，例如 /api/stars/{star_id}）的延遲 histogram、請求數與進行中的請求數
+- MongoDB：pymongo CommandListener 記錄每個指令的延遲，依 collection 與指令名稱分類；
+  ConnectionPoolListener 記錄每台主機的連線數、使用中的連線數與取得連線的等待時間
+- 儲存後端：上傳 / 刪除 / 下載的延遲、錯誤數與上傳的位元組數（由各儲存後端呼叫）
+- 上傳執行緒池：排隊中的工作數、上傳排程器的排隊與執行中檔案數（抓取時才讀取）
+
+GET /metrics 輸出 Prometheus 文字格式。多 worker 模式下設定 PROMETHEUS_MULTIPROC_DIR，
+每個 worker 把數值寫到該目錄，/metrics 合併所有 worker 的數值（抓取時才讀取的上傳執行緒池指標只有單一 process 模式才有）
+"""
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Tuple
+
+from fastapi import Response
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+from pymongo import monitoring
+
+from app.services.upload_scheduler import upload_scheduler
+
+# MongoDB 與儲存後端的延遲比 HTTP 請求短，使用較細的 bucket
+MONGO_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+STORAGE_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "HTTP 請求延遲", ["method", "route"]
+)
+http_requests = Counter(
+    "http_requests_total", "HTTP 請求數", ["method", "route", "status"]
+)
+http_requests_in_progress = Gauge(
+    "http_requests_in_progress", "進行中的 HTTP 請求數", ["method"], multiprocess_mode="livesum"
+)
+
+mongo_command_duration = Histogram(
+    "mongodb_command_duration_seconds", "MongoDB 指令延遲", ["collection", "command"], buckets=MONGO_BUCKETS
+)
+mongo_command_failures = Counter(
+    "mongodb_command_failures_total", "MongoDB 指令失敗數", ["collection", "command"]
+)
+
+mongo_pool_connections = Gauge(
+    "mongodb_pool_connections", "MongoDB 連線池的連線數（state=open 全部、in_use 使用中）", ["address", "state"],
+    multiprocess_mode="livesum"
+)
+mongo_pool_checkout_wait = Histogram(
+    "mongodb_pool_checkout_wait_seconds", "從連線池取得連線的等待時間", ["address"], buckets=MONGO_BUCKETS
+)
+mongo_pool_checkout_failures = Counter(
+    "mongodb_pool_checkout_failures_total", "無法從連線池取得連線的次數", ["address", "reason"]
+)
+
+storage_operation_duration = Histogram(
+    "storage_operation_duration_seconds", "儲存後端操作延遲", ["backend", "operation"], buckets=STORAGE_BUCKETS
+)
+storage_operation_errors = Counter(
+    "storage_operation_errors_total", "儲存後端操作失敗數", ["backend", "operation"]
+)
+storage_upload_bytes = Counter(
+    "storage_upload_bytes_total", "上傳到儲存後端的位元組數", ["backend"]
+)
+
+upload_executor_queue_depth = Gauge(
+    "upload_executor_queue_depth", "上傳執行緒池中排隊等待執行緒的工作數"
+)
+upload_executor_queue_depth.set_function(upload_scheduler.queue_depth)
+upload_scheduler_queued = Gauge("upload_scheduler_queued_files", "上傳排程器中排隊的檔案數")
+upload_scheduler_queued.set_function(lambda: upload_scheduler.stats()["queued"])
+upload_scheduler_running = Gauge("upload_scheduler_running_files", "上傳排程器中上傳中的檔案數")
+upload_scheduler_running.set_function(lambda: upload_scheduler.stats()["running"])
+
+class MetricsMiddleware:
+    """
+    記錄每個 HTTP 請求的延遲與狀態碼（純 ASGI middleware，不包裝 request / response 物件）
+
+    路由標籤使用路徑樣板而不是實際路徑，star_id 等參數不會讓標籤無限增加；
+    沒有對應路由的請求（404）都記在 "unmatched"
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+        in_progress = http_requests_in_progress.labels(method)
+        in_progress.inc()
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            in_progress.dec()
+            # 路由比對後 FastAPI 會把對應的 route 放進 scope
+            route = scope.get("route")
+            route_label = getattr(route, "path", "unmatched")
+            http_request_duration.labels(method, route_label).observe(time.perf_counter() - started)
+            http_requests.labels(method, route_label, str(status)).inc()
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """
+    pymongo 指令監聽器
+
+    成功 / 失敗事件只帶有指令名稱，collection 要從開始事件的指令內容取得，
+    以 (連線, request_id) 暫存到結束事件
+    """
+
+    def __init__(self):
+        self._collections: Dict[Tuple, str] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        target = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            target = event.command.get("collection")
+        # 沒有 collection 的指令（ping、hello 等）以資料庫名稱代替
+        collection = target if isinstance(target, str) else event.database_name
+        self._collections[(event.connection_id, event.request_id)] = collection
+
+    def _collection(self, event) -> str:
+        return self._collections.pop((event.connection_id, event.request_id), "unknown")
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        mongo_command_duration.labels(self._collection(event), event.command_name).observe(
+            event.duration_micros / 1_000_000
+        )
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        collection = self._collection(event)
+        mongo_command_duration.labels(collection, event.command_name).observe(event.duration_micros / 1_000_000)
+        mongo_command_failures.labels(collection, event.command_name).inc()
+
+def _address(address) -> str:
+    host, port = address
+    return f"{host}:{port}"
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    """
+    pymongo 連線池監聽器
+
+    除了 Prometheus 指標，也保留每台主機的統計，由 /api/health/db 回傳
+    """
+
+    def __init__(self):
+        self._pools: Dict[str, dict] = {}
+
+    def _pool(self, address) -> Tuple[str, dict]:
+        key = _address(address)
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = self._pools[key] = {
+                "open": 0, "in_use": 0, "checkouts": 0, "checkout_failures": 0,
+                "total_wait": 0.0, "max_wait": 0.0, "cleared": 0,
+            }
+        return key, pool
+
+    def _set_gauges(self, key: str, pool: dict) -> None:
+        mongo_pool_connections.labels(key, "open").set(pool["open"])
+        mongo_pool_connections.labels(key, "in_use").set(pool["in_use"])
+
+    def pool_created(self, event) -> None:
+        self._pool(event.address)
+
+    def pool_ready(self, event) -> None:
+        pass
+
+    def pool_cleared(self, event) -> None:
+        self._pool(event.address)[1]["cleared"] += 1
+
+    def pool_closed(self, event) -> None:
+        key = _address(event.address)
+        self._pools.pop(key, None)
+        mongo_pool_connections.labels(key, "open").set(0)
+        mongo_pool_connections.labels(key, "in_use").set(0)
+
+    def connection_created(self, event) -> None:
+        key, pool = self._pool(event.address)
+        pool["open"] += 1
+        self._set_gauges(key, pool)
+
+    def connection_ready(self, event) -> None:
+        pass
+
+    def connection_closed(self, event) -> None:
+        key, pool = self._pool(event.address)
+        pool["open"] = max(0, pool["open"] - 1)
+        self._set_gauges(key, pool)
+
+    def connection_check_out_started(self, event) -> None:
+        pass
+
+    def connection_check_out_failed(self, event) -> None:
+        key, pool = self._pool(event.address)
+        pool["checkout_failures"] += 1
+        mongo_pool_checkout_failures.labels(key, str(event.reason)).inc()
+
+    def connection_checked_out(self, event) -> None:
+        key, pool = self._pool(event.address)
+        pool["in_use"] += 1
+        pool["checkouts"] += 1
+        wait = event.duration or 0.0
+        pool["total_wait"] += wait
+        pool["max_wait"] = max(pool["max_wait"], wait)
+        mongo_pool_checkout_wait.labels(key).observe(wait)
+        self._set_gauges(key, pool)
+
+    def connection_checked_in(self, event) -> None:
+        key, pool = self._pool(event.address)
+        pool["in_use"] = max(0, pool["in_use"] - 1)
+        self._set_gauges(key, pool)
+
+    def stats(self) -> dict:
+        """每台主機的連線數、使用中的連線數與取得連線的平均 / 最長等待時間"""
+        return {
+            key: {
+                "open": pool["open"],
+                "in_use": pool["in_use"],
+                "checkouts": pool["checkouts"],
+                "checkout_failures": pool["checkout_failures"],
+                "cleared": pool["cleared"],
+                "avg_wait_ms": round(pool["total_wait"] / pool["checkouts"] * 1000, 3) if pool["checkouts"] else 0.0,
+                "max_wait_ms": round(pool["max_wait"] * 1000, 3),
+            }
+            for key, pool in self._pools.items()
+        }
+
+@contextmanager
+def track_storage(backend: str, operation: str) -> Iterator[None]:
+    """記錄一次儲存後端操作的耗時，拋出例外時同時計入失敗數"""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        storage_operation_errors.labels(backend, operation).inc()
+        raise
+    finally:
+        storage_operation_duration.labels(backend, operation).observe(time.perf_counter() - started)
+
+def metrics_response() -> Response:
+    """Prometheus 文字格式的所有指標（多 worker 模式下合併所有 worker）"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+def mark_process_dead() -> None:
+    """worker 結束時移除它的 livesum gauge 數值（多 worker 模式）"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(os.getpid())
+
+# 建立全域實例（建立 MongoDB 連線時註冊）
+mongo_command_metrics = MongoCommandMetrics()
+mongo_pool_metrics = MongoPoolMetrics()
@@ -1,4 +1,14 @@
-from .star import StarCreate, StarUpdate, StarResponse
-from .image import ImageResponse
+from .star import StarCreate, StarUpdate, StarCover, StarResponse
+from .image import (
+    ImageVariant, ImageResponse, SimilarImageResponse,
+    DirectUploadFile, DirectUploadRequest, DirectUploadTicket, DirectUploadResult, DirectUploadFinalize,
+    BatchUploadResult, BatchUploadResponse
+)
+from .job import JobFileStatus, JobResponse
+from .upload_session import UploadSessionCreate, UploadSessionResponse
 
-__all__ = ["StarCreate", "StarUpdate", "StarResponse","ImageResponse"]
\ No newline at end of file
+__all__ = ["StarCreate", "StarUpdate", "StarCover", "StarResponse","ImageVariant", "ImageResponse", "SimilarImageResponse",
+           "DirectUploadFile", "DirectUploadRequest", "DirectUploadTicket", "DirectUploadResult", "DirectUploadFinalize",
+           "BatchUploadResult", "BatchUploadResponse",
+           "JobFileStatus", "JobResponse",
+           "UploadSessionCreate", "UploadSessionResponse"]
\ No newline at end of file
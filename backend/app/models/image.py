@@ -1,6 +1,13 @@
 from datetime import datetime
 from pydantic import BaseModel
 from bson import ObjectId
+from typing import Any, Dict, List, Optional
+
+class ImageVariant(BaseModel):
+    # 衍生圖（縮圖）：最大寬度、格式（avif、webp）與 URL
+    width: int
+    format: str
+    url: str
 
 class ImageResponse(BaseModel):
     id: str
@@ -10,7 +17,58 @@ class ImageResponse(BaseModel):
     file_size: int
     mime_type: str
     uploaded_at: datetime
+    variants: List[ImageVariant] = []
+    # 格式 -> srcset 字串（"url 320w, url 640w"），可直接用在 <source srcset>
+    srcset: Dict[str, str] = {}
+    # 版面資訊（上傳時擷取）：前端在圖片下載前就能預留空間、顯示主色或 blurhash 佔位圖
+    width: Optional[int] = None
+    height: Optional[int] = None
+    aspect_ratio: Optional[float] = None
+    dominant_color: Optional[str] = None
+    blurhash: Optional[str] = None
 
     class Config:
         json_encoders = {ObjectId: str}
 
+class SimilarImageResponse(ImageResponse):
+    # 與查詢圖片的感知雜湊 Hamming 距離（0 = 幾乎相同）
+    distance: int
+
+class DirectUploadFile(BaseModel):
+    # 客戶端要直接上傳的檔案（大小由客戶端申報，finalize 時以儲存空間回傳的大小為準）
+    filename: str
+    content_type: str
+    file_size: int
+
+class DirectUploadRequest(BaseModel):
+    files: List[DirectUploadFile]
+
+class DirectUploadTicket(BaseModel):
+    # 客戶端以 multipart POST 到 upload_url，fields 原樣帶上，檔案放在 "file" 欄位
+    filename: str
+    public_id: str
+    upload_url: str
+    fields: Dict[str, str]
+    expires_at: datetime
+
+class DirectUploadResult(BaseModel):
+    filename: str
+    # 儲存空間對直接上傳的回應（原樣轉交，由後端驗證簽章）
+    result: Dict[str, Any]
+
+class DirectUploadFinalize(BaseModel):
+    files: List[DirectUploadResult]
+
+class BatchUploadResult(BaseModel):
+    filename: str
+    # ok：已建立（或與既有圖片內容相同）/ rejected：檔案本身不符合，重送也不會成功 / failed：伺服器或儲存空間錯誤，可以重送
+    status: str
+    image: Optional[ImageResponse] = None
+    error: Optional[str] = None
+
+class BatchUploadResponse(BaseModel):
+    # 順序與上傳的檔案相同
+    results: List[BatchUploadResult]
+    succeeded: int
+    rejected: int
+    failed: int
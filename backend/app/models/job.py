@@ -0,0 +1,26 @@
+from datetime import datetime
+from typing import List, Optional
+from pydantic import BaseModel
+from bson import ObjectId
+
+class JobFileStatus(BaseModel):
+    filename: str
+    # pending / succeeded / failed
+    status: str
+    image_id: Optional[str] = None
+    error: Optional[str] = None
+
+class JobResponse(BaseModel):
+    id: str
+    type: str
+    # queued / running / succeeded / failed
+    status: str
+    attempts: int
+    progress: dict
+    files: Optional[List[JobFileStatus]] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        json_encoders = {ObjectId: str}
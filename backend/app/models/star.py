@@ -1,6 +1,8 @@
 from datetime import datetime
 from pydantic import BaseModel
 from bson import ObjectId
+from typing import List, Optional
+from app.models.image import ImageVariant
 
 class StarCreate(BaseModel):
     name: str
@@ -8,10 +10,20 @@ class StarCreate(BaseModel):
 class StarUpdate(BaseModel):
     name: str
 
+class StarCover(BaseModel):
+    id: str
+    s3_url: str
+    variants: List[ImageVariant] = []
+
 class StarResponse(BaseModel):
     id: str
     name: str
     created_at: datetime
+    # 統計欄位（上傳與刪除圖片時更新，不需要另外查詢圖片）
+    image_count: int = 0
+    total_bytes: int = 0
+    last_uploaded_at: Optional[datetime] = None
+    cover_image: Optional[StarCover] = None
 
     class Config:
         json_encoders = {ObjectId: str}
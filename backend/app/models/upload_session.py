@@ -0,0 +1,26 @@
+from datetime import datetime
+from typing import Optional
+from pydantic import BaseModel
+from bson import ObjectId
+
+class UploadSessionCreate(BaseModel):
+    filename: str
+    content_type: str
+    # 檔案總大小（bytes），收到這麼多內容後才能 finalize
+    size: int
+
+class UploadSessionResponse(BaseModel):
+    id: str
+    star_id: str
+    filename: str
+    content_type: str
+    size: int
+    # 目前已收到的大小，續傳時從這裡開始
+    offset: int
+    # uploading / finalizing / completed
+    status: str
+    image_id: Optional[str] = None
+    expires_at: datetime
+
+    class Config:
+        json_encoders = {ObjectId: str}
@@ -1,4 +1,3 @@
-from . import images, stars
-
-__all__ = ["images", "stars"]
+from . import files, images, jobs, stars, uploads
 
+__all__ = ["files", "images", "jobs", "stars", "uploads"]
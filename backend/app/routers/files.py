@@ -0,0 +1,71 @@
+from fastapi import APIRouter, File, Form, HTTPException, Request, Response, UploadFile, status
+from fastapi.responses import FileResponse
+import os
+from app.services.storage import storage_service
+from app.services.local_storage_service import LocalStorageService
+from app.services.storage_backend import FileTooLargeError
+from app.routers.images import MAX_FILE_SIZE
+
+router = APIRouter(prefix="/api/files", tags=["files"])
+
+@router.post("/direct-upload", status_code=status.HTTP_201_CREATED)
+async def direct_upload(
+    public_id: str = Form(...),
+    expires_at: int = Form(...),
+    signature: str = Form(...),
+    file: UploadFile = File(...)
+):
+    """
+    本機後端的直接上傳（模擬 Cloudinary 的 signed upload，只在 STORAGE_BACKEND=local 時可用）
+
+    參數由 POST /api/stars/{star_id}/images/direct-uploads 簽署；
+    回應原樣交給 POST /api/stars/{star_id}/images/direct-uploads/finalize
+    """
+    if not isinstance(storage_service, LocalStorageService):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="不支援直接上傳")
+    
+    if not storage_service.verify_upload_params(public_id, expires_at, signature):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="上傳簽章無效或已過期")
+    
+    try:
+        return await storage_service.receive_direct_upload(file.file, public_id, MAX_FILE_SIZE)
+    except FileExistsError:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="這組上傳參數已經使用過")
+    except FileTooLargeError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="檔案超過 10MB 限制")
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+@router.get("/{public_id:path}")
+async def get_file(public_id: str, request: Request):
+    """
+    下載本機儲存的圖片（只在 STORAGE_BACKEND=local 時可用）
+
+    - 使用 FileResponse：伺服器支援 http.response.pathsend 時由伺服器直接送出檔案（zero-copy），
+      否則以固定大小的區塊讀取，不會整個讀進記憶體
+    - 支援 HTTP Range / If-Range（影片式的分段下載、續傳）
+    - 強 ETag，If-None-Match 相符時回應 304
+    """
+    if not isinstance(storage_service, LocalStorageService):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="檔案不存在")
+    
+    try:
+        path = storage_service.path_for(public_id)
+        stat_result = os.stat(path)
+    except (ValueError, FileNotFoundError):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="檔案不存在")
+    
+    etag = storage_service.etag_for(public_id, stat_result)
+    # public_id 每次上傳都不同，內容不會變，可以永久快取
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    return FileResponse(
+        path,
+        media_type=storage_service.content_type_for(path),
+        headers=headers,
+        stat_result=stat_result
+    )
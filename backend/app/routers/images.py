@@ -1,11 +1,37 @@
-from fastapi import APIRouter, HTTPException, status, UploadFile, File
-from typing import List
+from fastapi import APIRouter, HTTPException, status, UploadFile, File, Request, Query
+from fastapi.responses import StreamingResponse
+from starlette.datastructures import Headers
+from typing import List, Optional
+from urllib.parse import quote
 import asyncio
-from app.database import get_database
-from app.services.cloudinary_service import cloudinary_service
-from app.models.image import ImageResponse
+import base64
+import io
+import json
+import os
+import shutil
+import time
+import uuid
+from app.config import settings
+from app.database import get_database, get_read_database
+from app.services import dedup_service, reconcile_service, star_summary_service
+from app.services.phash_service import phash_service, compute_phash
+from app.services.preprocess_service import preprocess_service
+from app.services.image_metadata_service import image_metadata_service
+from app.services.storage import storage_service
+from app.services.storage_backend import FileTooLargeError, StorageDeleteError, UPLOAD_CHUNK_SIZE
+from app.services.upload_scheduler import upload_scheduler, UploadQueueFullError, UploadSchedulerDrainingError
+from app.services.job_service import job_service, JobContext, JobRetryError, JOB_QUEUED, JOB_RUNNING
+from app.services.export_service import stream_star_zip
+from app.services.response_cache import response_cache, cached_json_response
+from app.routers.jobs import job_accepted_response
+from app.serialization import FastJSONResponse
+from app.models.image import (
+    ImageResponse, SimilarImageResponse, DirectUploadRequest, DirectUploadTicket, DirectUploadFinalize,
+    BatchUploadResponse
+)
 from bson import ObjectId
 from datetime import datetime
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 
 router = APIRouter(prefix="/api/stars", tags=["images"])
 
@@ -20,77 +46,240 @@ def validate_image_file(file: UploadFile) -> None:
             detail=f"不支援的檔案類型。支援的類型：{', '.join(ALLOWED_IMAGE_TYPES)}"
         )
 
+# 讀取路徑只取回應需要的欄位（不讀 s3_key、content_hash、phash 等內部欄位）
+IMAGE_PROJECTION = {
+    "star_id": 1,
+    "s3_url": 1,
+    "filename": 1,
+    "file_size": 1,
+    "mime_type": 1,
+    "uploaded_at": 1,
+    "variants": 1,
+    "width": 1,
+    "height": 1,
+    "aspect_ratio": 1,
+    "dominant_color": 1,
+    "blurhash": 1
+}
+
+# 上傳時擷取的版面資訊欄位（見 image_metadata_service）
+IMAGE_METADATA_FIELDS = ("width", "height", "aspect_ratio", "dominant_color", "blurhash")
+
+def srcset_for(variants: List[dict]) -> dict:
+    """衍生圖依格式組成 srcset 字串，例如 {"webp": "url 320w, url 640w"}"""
+    srcset = {}
+    for variant in variants:
+        entry = f"{variant['url']} {variant['width']}w"
+        srcset[variant["format"]] = f"{srcset[variant['format']]}, {entry}" if variant["format"] in srcset else entry
+    return srcset
+
+def image_to_row(image: dict) -> dict:
+    """MongoDB 圖片文件轉成回應用的 dict（欄位與 ImageResponse 相同，不建立模型）"""
+    variants = image.get("variants", [])
+    return {
+        "id": str(image["_id"]),
+        "star_id": str(image["star_id"]),
+        "s3_url": image["s3_url"],
+        "filename": image["filename"],
+        "file_size": image["file_size"],
+        "mime_type": image["mime_type"],
+        "uploaded_at": image["uploaded_at"],
+        "variants": variants,
+        "srcset": srcset_for(variants),
+        **{field: image.get(field) for field in IMAGE_METADATA_FIELDS}
+    }
+
+def image_to_response(image: dict) -> ImageResponse:
+    """MongoDB 圖片文件轉成 ImageResponse"""
+    return ImageResponse(**image_to_row(image))
+
+def validate_upload(file: UploadFile) -> int:
+    """驗證檔案類型與大小（不需要任何遠端 I/O），回傳檔案大小"""
+    # 驗證檔案類型
+    validate_image_file(file)
+    
+    # 取得檔案大小（multipart 解析時已存入暫存檔，seek 到結尾即可，不需要讀進記憶體）
+    file.file.seek(0, io.SEEK_END)
+    file_size = file.file.tell()
+    file.file.seek(0)
+    
+    # 驗證檔案大小（在開始上傳之前就擋下）
+    if file_size > MAX_FILE_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"檔案 {file.filename} 超過 10MB 限制"
+        )
+    return file_size
+
 async def process_single_file(
     file: UploadFile,
     star_id: str,
-    db
+    db,
+    reject_near_duplicates: bool = False
 ) -> ImageResponse:
     """
     處理單個檔案的上傳（並發處理用）
     
     這個函數會被並發執行，所以每個檔案的上傳不會互相阻塞
     """
-    # 驗證檔案類型
-    validate_image_file(file)
+    image_dict = await prepare_image(file, star_id, db, reject_near_duplicates)
+    if "_id" in image_dict:
+        # 與既有圖片內容相同
+        return image_to_response(image_dict)
     
-    # 讀取檔案內容
-    file_content = await file.read()
+    # 儲存圖片資訊到 MongoDB（也是 I/O 操作，可以並發）
+    try:
+        result = await db.images.insert_one(image_dict)
+    except DuplicateKeyError:
+        # 相同內容的檔案同時上傳（同一個請求中重複的檔案或並發的請求），去重檢查都沒有找到對方：
+        # (star_id, content_hash) 的唯一索引只讓一個寫入，這裡改用先寫入的圖片並釋放這次上傳的檔案
+        existing = await find_duplicate(db, star_id, image_dict)
+        await _discard_uploaded(db, [image_dict])
+        if existing is None:
+            raise
+        return image_to_response(existing)
+    image_dict["_id"] = result.inserted_id
+    await phash_service.add(db, star_id, result.inserted_id, image_dict.get("phash"))
+    await star_summary_service.record_upload(db, star_id, image_dict)
+    response_cache.invalidate("stars", f"star:{star_id}", f"images:{star_id}")
     
-    # 驗證檔案大小
-    if len(file_content) > MAX_FILE_SIZE:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"檔案 {file.filename} 超過 10MB 限制"
-        )
+    return image_to_response(image_dict)
+
+async def find_duplicate(db, star_id: str, image_dict: dict) -> Optional[dict]:
+    """同一個明星中與 image_dict 內容相同、已經寫入的圖片"""
+    if not image_dict.get("content_hash"):
+        return None
+    return await db.images.find_one({"star_id": ObjectId(star_id), "content_hash": image_dict["content_hash"]})
+
+async def prepare_image(
+    file: UploadFile,
+    star_id: str,
+    db,
+    reject_near_duplicates: bool = False
+) -> dict:
+    """
+    驗證、去重、前處理並上傳到儲存空間，回傳要寫入 MongoDB 的圖片文件（還沒有 _id）
+
+    同一個明星已經有相同內容的圖片時，直接回傳既有的圖片文件（有 _id），不會上傳
+    """
+    file_size = validate_upload(file)
     
-    # 生成 Cloudinary public_id
-    public_id = cloudinary_service.generate_public_id(
-        star_id=star_id,
-        filename=file.filename
-    )
+    # 計算內容的 SHA-256（從暫存檔逐塊讀取），用來判斷是否為重複上傳
+    # DEDUP_SCOPE=off 時不記錄（(star_id, content_hash) 有唯一索引，相同內容的圖片不能都帶雜湊）
+    content_hash = None
+    if settings.dedup_scope != "off":
+        content_hash = await dedup_service.compute_sha256(file.file)
+        # 同一個明星已經有相同內容的圖片：直接回傳既有的圖片，不再上傳
+        existing = await db.images.find_one({"star_id": ObjectId(star_id), "content_hash": content_hash})
+        if existing:
+            return existing
     
-    # 上傳到 Cloudinary（這裡是 I/O 操作，並發時可以同時進行多個）
-    try:
-        image_url = await cloudinary_service.upload_file(
-            file_content=file_content,
-            public_id=public_id,
-            content_type=file.content_type
+    # 前處理（IMAGE_PREPROCESS=true）：轉正、移除 metadata、縮小並重新編碼，
+    # 之後的步驟與儲存空間使用處理後的檔案；去重仍以原始內容的 SHA-256 判斷
+    file_obj = file.file
+    content_type = file.content_type
+    if preprocess_service.enabled:
+        processed = await preprocess_service.preprocess(file.file, file.content_type)
+        if processed.changed:
+            file_obj = io.BytesIO(processed.data)
+            content_type = processed.content_type
+            file_size = len(processed.data)
+    
+    # 計算感知雜湊（縮放、重新壓縮過的同一張圖片雜湊值會很接近）
+    phash = await compute_phash(file_obj)
+    # 寬高、長寬比、主色與 blurhash（同一個請求的檔案合併成一批在執行緒池中處理）
+    metadata = await image_metadata_service.extract(file_obj)
+    if reject_near_duplicates and phash:
+        similar = await phash_service.find_similar(
+            db, star_id, phash, settings.near_duplicate_distance, limit=1
         )
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"上傳失敗: {str(e)}"
+        if similar:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"檔案 {file.filename} 與既有圖片 {similar[0][0]} 近似重複"
+            )
+    
+    # 其他明星已經上傳過相同內容（global 模式）：共用同一個檔案，引用次數 +1
+    asset = None
+    if settings.dedup_scope == "global":
+        asset = await dedup_service.acquire_asset(db, content_hash)
+    
+    if asset:
+        public_id, image_url = asset["s3_key"], asset["s3_url"]
+    else:
+        # 生成 public_id
+        public_id = storage_service.generate_public_id(
+            star_id=star_id,
+            filename=file.filename
         )
+        
+        # 上傳到儲存空間（這裡是 I/O 操作，並發時可以同時進行多個）
+        # 直接從暫存檔逐塊串流上傳，上傳途中超過大小限制也會立即中止
+        try:
+            image_url = await storage_service.upload_file(
+                file_obj=file_obj,
+                public_id=public_id,
+                content_type=content_type,
+                max_size=MAX_FILE_SIZE
+            )
+        except FileTooLargeError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"檔案 {file.filename} 超過 10MB 限制"
+            )
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"上傳失敗: {str(e)}"
+            )
+        
+        if settings.dedup_scope == "global":
+            public_id, image_url = await dedup_service.register_asset(db, content_hash, public_id, image_url)
     
-    # 儲存圖片資訊到 MongoDB（也是 I/O 操作，可以並發）
     image_dict = {
         "star_id": ObjectId(star_id),
         "s3_key": public_id,
         "s3_url": image_url,
         "filename": file.filename,
-        "file_size": len(file_content),
-        "mime_type": file.content_type,
-        "uploaded_at": datetime.utcnow()
+        "file_size": file_size,
+        "mime_type": content_type,
+        "uploaded_at": datetime.utcnow(),
+        # 縮圖等衍生圖的 URL（依設定的寬度與格式），前端依 viewport 選擇要下載的大小
+        "variants": storage_service.variants_for(public_id)
     }
+    if content_hash:
+        image_dict["content_hash"] = content_hash
+    if phash:
+        image_dict["phash"] = phash
+    if metadata:
+        image_dict.update(metadata)
     
-    result = await db.images.insert_one(image_dict)
-    image_dict["_id"] = result.inserted_id
-    image_dict["id"] = str(result.inserted_id)
-    
-    return ImageResponse(
-        id=image_dict["id"],
-        star_id=star_id,
-        s3_url=image_url,
-        filename=file.filename,
-        file_size=len(file_content),
-        mime_type=file.content_type,
-        uploaded_at=image_dict["uploaded_at"]
-    )
+    return image_dict
+
+def reserve_upload_batch(size: int):
+    """向上傳排程器登記 size 個檔案；佇列已滿回應 429、服務關閉中回應 503（都帶 Retry-After）"""
+    try:
+        return upload_scheduler.batch(size)
+    except UploadQueueFullError as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="上傳佇列已滿，請稍後再試",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except UploadSchedulerDrainingError:
+        # 這個 worker 正在關閉，重試時會由其他 worker（或重新啟動後的 worker）處理
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="服務正在重新啟動，請稍後再試",
+            headers={"Retry-After": "1"}
+        )
 
 @router.post("/{star_id}/images/upload", response_model=List[ImageResponse], status_code=status.HTTP_201_CREATED)
 async def upload_images(
     star_id: str,
-    files: List[UploadFile] = File(...)
+    files: List[UploadFile] = File(...),
+    reject_near_duplicates: bool = False,
+    background: bool = False
 ):
     """
     上傳圖片到指定明星（並發版本）
@@ -108,6 +297,15 @@ async def upload_images(
     - 前端使用 FormData，所有檔案用同一個 key 'files'
     - 後端用 List[UploadFile] 接收所有檔案
     - 然後用 asyncio.gather() 並發處理
+    
+    並發上限：
+    - 由 upload_scheduler 控制，全域與每個請求各有上限，多個請求輪流取得名額
+    - 排隊的檔案超過上限時回應 429，並在 Retry-After 告訴前端何時重試
+    
+    reject_near_duplicates=true 時，與該明星既有圖片近似重複（縮放、重新壓縮）的檔案回應 409
+    
+    background=true 時：檔案先存到工作暫存目錄，立即回應 202 與工作內容，
+    由背景 worker 上傳，進度（每個檔案的狀態）可由 GET /api/jobs/{job_id} 查詢
     """
     db = get_database()
     
@@ -119,62 +317,627 @@ async def upload_images(
             detail="明星不存在"
         )
     
-    # 並發處理所有檔案
-    # asyncio.gather 會同時執行所有任務，等待全部完成
-    upload_tasks = [
-        process_single_file(file, star_id, db)
-        for file in files
-    ]
+    # 背景模式：交給工作佇列處理，不佔住這個 HTTP 請求（佇列已滿時同樣回應 429）
+    if background:
+        await reserve_background_upload(db, files)
+        job = await enqueue_upload_job(db, star_id, files, reject_near_duplicates)
+        return job_accepted_response(job)
+    
+    # 向上傳排程器登記這批檔案，佇列已滿就直接拒絕，不無限制地排隊
+    batch = reserve_upload_batch(len(files))
     
-    # 使用 asyncio.gather 並發執行所有上傳任務
-    # 如果某個檔案失敗，會拋出異常（可以選擇部分成功，見下方註解）
+    async with batch:
+        # 並發處理所有檔案
+        # 每個檔案要先從排程器拿到名額才會開始上傳（全域與每個請求都有並發上限）
+        upload_tasks = [
+            batch.run(process_single_file, file, star_id, db, reject_near_duplicates)
+            for file in files
+        ]
+        
+        # 使用 asyncio.gather 並發執行所有上傳任務
+        # 如果某個檔案失敗，會拋出異常（需要部分成功時使用 POST /{star_id}/images/upload/batch）
+        try:
+            uploaded_images = await asyncio.gather(*upload_tasks)
+            return list(uploaded_images)
+        except HTTPException:
+            # 重新拋出 HTTPException
+            raise
+        except Exception as e:
+            # 處理其他異常
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"上傳過程中發生錯誤: {str(e)}"
+            )
+
+# 批次上傳每個檔案的結果
+UPLOAD_OK = "ok"
+UPLOAD_REJECTED = "rejected"
+UPLOAD_FAILED = "failed"
+
+# MongoDB 的重複鍵錯誤碼（BulkWriteError 的 writeErrors 中）
+DUPLICATE_KEY_ERROR = 11000
+
+def _upload_error(e: Exception) -> tuple:
+    """例外轉成 (狀態, 原因)：4xx 是檔案本身的問題（rejected），其他是可以重送的錯誤（failed）"""
+    if isinstance(e, HTTPException):
+        return (UPLOAD_REJECTED if e.status_code < 500 else UPLOAD_FAILED), str(e.detail)
+    return UPLOAD_FAILED, f"上傳失敗: {str(e)}"
+
+async def _insert_images(db, images: List[dict]) -> tuple:
+    """
+    一次寫入多張圖片（insert_many，不依序），回傳 (寫入成功的 _id, 因為內容重複而沒有寫入的 _id)
+
+    部分失敗時由 BulkWriteError 得知失敗的文件（重複鍵表示並發的請求已經寫入相同內容的圖片）；
+    連線錯誤等無法確定結果時，查詢哪些已經寫入
+    """
+    for image_dict in images:
+        image_dict["_id"] = ObjectId()
+    ids = [image_dict["_id"] for image_dict in images]
     try:
-        uploaded_images = await asyncio.gather(*upload_tasks)
-        return list(uploaded_images)
-    except HTTPException:
-        # 重新拋出 HTTPException
-        raise
+        await db.images.insert_many(images, ordered=False)
+        return set(ids), set()
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        failed = {images[error["index"]]["_id"] for error in errors}
+        duplicated = {images[error["index"]]["_id"] for error in errors if error.get("code") == DUPLICATE_KEY_ERROR}
+        return set(ids) - failed, duplicated
     except Exception as e:
-        # 處理其他異常
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"上傳過程中發生錯誤: {str(e)}"
-        )
+        print(f"⚠️  批次寫入圖片失敗，確認已寫入的記錄: {e}")
+        cursor = db.images.find({"_id": {"$in": ids}}, {"_id": 1})
+        return {image["_id"] async for image in cursor}, set()
 
-@router.get("/{star_id}/images", response_model=List[ImageResponse])
-async def get_star_images(
+async def _discard_uploaded(db, images: List[dict]) -> None:
+    """補償：刪除已上傳但沒有寫入記錄的檔案（共用的檔案只減少引用次數）"""
+    if not images:
+        return
+    s3_keys = await dedup_service.release_assets(db, images)
+    if s3_keys:
+        try:
+            await storage_service.delete_files(s3_keys)
+        except StorageDeleteError as e:
+            # 留下的孤兒檔案由儲存空間對帳清理
+            print(f"⚠️  {len(e.failed)} 個沒有寫入記錄的檔案刪除失敗: {e.failed}")
+            return
+        print(f"🧹 已刪除 {len(s3_keys)} 個沒有寫入記錄的檔案")
+
+@router.post("/{star_id}/images/upload/batch", response_model=BatchUploadResponse)
+async def upload_images_batch(
     star_id: str,
-    page: int = 1,
-    limit: int = 20
+    files: List[UploadFile] = File(...),
+    reject_near_duplicates: bool = False
 ):
-    """取得指定明星的圖片列表（支援分頁）"""
+    """
+    批次上傳（部分成功）：每個檔案各自回報結果，一個檔案失敗不影響其他檔案
+
+    - 開始任何遠端 I/O 之前先驗證所有檔案的類型與大小，不符合的直接標記為 rejected
+    - 其餘檔案並發上傳到儲存空間（與 upload_images 相同的排程器名額），成功的記錄以一次 insert_many 寫入
+    - 記錄寫入失敗的檔案會從儲存空間刪除（補償），回報為 failed
+    - 同一批中內容相同的檔案只保留一張，其他指向同一張圖片
+
+    客戶端只需要重送 failed 的檔案；rejected 的檔案重送也不會成功
+    """
+    db = get_database()
+    
+    if not await db.stars.find_one({"_id": ObjectId(star_id)}, {"_id": 1}):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="明星不存在"
+        )
+    
+    results = [{"filename": file.filename, "status": UPLOAD_OK, "image": None, "error": None} for file in files]
+    
+    # 先驗證所有檔案（只讀本機暫存檔）
+    accepted = []
+    for index, file in enumerate(files):
+        try:
+            validate_upload(file)
+            accepted.append(index)
+        except HTTPException as e:
+            results[index].update({"status": UPLOAD_REJECTED, "error": str(e.detail)})
+    
+    prepared = {}
+    if accepted:
+        async with reserve_upload_batch(len(accepted)) as batch:
+            outcomes = await asyncio.gather(
+                *(batch.run(prepare_image, files[index], star_id, db, reject_near_duplicates) for index in accepted),
+                return_exceptions=True
+            )
+        for index, outcome in zip(accepted, outcomes):
+            if isinstance(outcome, asyncio.CancelledError):
+                raise outcome
+            if isinstance(outcome, BaseException):
+                state, error = _upload_error(outcome)
+                results[index].update({"status": state, "error": error})
+            else:
+                prepared[index] = outcome
+    
+    # 同一批中內容相同的新檔案：只寫入第一個，其他的副本刪除
+    new_images = {}
+    first_by_hash = {}
+    duplicates = {}
+    for index, image_dict in prepared.items():
+        if "_id" in image_dict:
+            continue
+        content_hash = image_dict.get("content_hash")
+        if settings.dedup_scope != "off" and content_hash in first_by_hash:
+            duplicates[index] = first_by_hash[content_hash]
+        else:
+            first_by_hash[content_hash] = index
+            new_images[index] = image_dict
+    discarded = [prepared[index] for index in duplicates]
+    
+    if new_images:
+        inserted_ids, duplicated_ids = await _insert_images(db, list(new_images.values()))
+        inserted = []
+        for index, image_dict in new_images.items():
+            if image_dict["_id"] in inserted_ids:
+                inserted.append(image_dict)
+                await phash_service.add(db, star_id, image_dict["_id"], image_dict.get("phash"))
+                continue
+            # 並發的請求已經寫入相同內容的圖片：改用那張圖片，這次上傳的檔案刪除
+            existing = await find_duplicate(db, star_id, image_dict) if image_dict["_id"] in duplicated_ids else None
+            discarded.append(image_dict)
+            if existing is not None:
+                prepared[index] = existing
+            else:
+                del prepared[index]
+                results[index].update({"status": UPLOAD_FAILED, "error": "寫入資料庫失敗"})
+        if inserted:
+            await star_summary_service.record_bulk_upload(db, star_id, inserted)
+            response_cache.invalidate("stars", f"star:{star_id}", f"images:{star_id}")
+    
+    for index, first in duplicates.items():
+        if first in prepared:
+            prepared[index] = prepared[first]
+        else:
+            del prepared[index]
+            results[index].update({"status": UPLOAD_FAILED, "error": "寫入資料庫失敗"})
+    
+    await _discard_uploaded(db, discarded)
+    
+    for index, image_dict in prepared.items():
+        results[index]["image"] = image_to_response(image_dict)
+    
+    return {
+        "results": results,
+        "succeeded": sum(1 for result in results if result["status"] == UPLOAD_OK),
+        "rejected": sum(1 for result in results if result["status"] == UPLOAD_REJECTED),
+        "failed": sum(1 for result in results if result["status"] == UPLOAD_FAILED)
+    }
+
+async def reserve_background_upload(db, files: List[UploadFile]) -> None:
+    """
+    背景上傳的背壓（與 reserve_upload_batch 相同回應 429 + Retry-After、關閉中回應 503）
+
+    以所有 process 中還沒完成的背景上傳工作計算：檔案數不超過 UPLOAD_MAX_QUEUED、
+    暫存檔總大小不超過 JOB_SPOOL_MAX_BYTES，暫存目錄的磁碟用量有上限。
+    同時進來的請求可能一起通過檢查，上限是近似值
+    """
+    if upload_scheduler.draining:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="服務正在重新啟動，請稍後再試",
+            headers={"Retry-After": "1"}
+        )
+    incoming_bytes = 0
+    for file in files:
+        file.file.seek(0, io.SEEK_END)
+        incoming_bytes += file.file.tell()
+        file.file.seek(0)
+    
+    pending = await db.jobs.aggregate([
+        {"$match": {"type": "upload_images", "status": {"$in": [JOB_QUEUED, JOB_RUNNING]}}},
+        {"$group": {"_id": None, "files": {"$sum": "$progress.total"}, "bytes": {"$sum": "$params.spool_bytes"}}}
+    ]).to_list(length=1)
+    pending_files = pending[0]["files"] if pending else 0
+    pending_bytes = pending[0]["bytes"] if pending else 0
+    if (pending_files + len(files) > settings.upload_max_queued
+            or pending_bytes + incoming_bytes > settings.job_spool_max_bytes):
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="背景上傳佇列已滿，請稍後再試",
+            headers={"Retry-After": str(upload_scheduler.estimate_wait(pending_files))}
+        )
+
+def _spool_file_sync(source, path: str) -> None:
+    source.seek(0)
+    with open(path, "wb") as out:
+        shutil.copyfileobj(source, out, UPLOAD_CHUNK_SIZE)
+
+async def enqueue_upload_job(db, star_id: str, files: List[UploadFile], reject_near_duplicates: bool) -> dict:
+    """
+    建立背景上傳工作
+
+    請求結束後 UploadFile 的暫存檔會被關閉，所以先把檔案複製到 JOB_SPOOL_DIR，
+    worker（包括重新啟動後接手的 worker）再從這裡讀取
+    """
+    spool_dir = os.path.join(settings.job_spool_dir, uuid.uuid4().hex)
+    await asyncio.to_thread(os.makedirs, spool_dir, exist_ok=True)
+    job_files = []
+    spool_bytes = 0
+    for index, file in enumerate(files):
+        path = os.path.join(spool_dir, str(index))
+        await asyncio.to_thread(_spool_file_sync, file.file, path)
+        spool_bytes += await asyncio.to_thread(os.path.getsize, path)
+        job_files.append({
+            "filename": file.filename,
+            "content_type": file.content_type,
+            "path": path,
+            "status": "pending"
+        })
+    
+    return await job_service.enqueue(
+        db,
+        "upload_images",
+        # spool_bytes：暫存檔總大小（reserve_background_upload 計算磁碟用量）
+        {"star_id": star_id, "reject_near_duplicates": reject_near_duplicates, "spool_dir": spool_dir,
+         "spool_bytes": spool_bytes},
+        extra={"files": job_files, "progress": {"total": len(job_files), "succeeded": 0, "failed": 0}}
+    )
+
+async def run_upload_job(context: JobContext) -> None:
+    """
+    背景上傳工作
+
+    每個檔案的結果都會寫回工作文件；重試時只處理還沒成功、且可以重試的檔案
+    （驗證失敗這類 4xx 錯誤不會重試）
+
+    暫存檔在工作不會再執行時刪除：正常結束，或最後一次嘗試以任何錯誤結束；
+    還會重試或服務關閉（工作放回佇列）時保留
+    """
+    params = context.job["params"]
+    last_attempt = context.job["attempts"] >= context.job.get("max_attempts", settings.job_max_attempts)
+    cleanup = True
+    try:
+        await _process_upload_job(context, last_attempt)
+    except asyncio.CancelledError:
+        cleanup = False
+        raise
+    except Exception:
+        cleanup = last_attempt
+        raise
+    finally:
+        if cleanup:
+            await asyncio.to_thread(shutil.rmtree, params["spool_dir"], True)
+
+async def _process_upload_job(context: JobContext, last_attempt: bool) -> None:
+    db = get_database()
+    job = context.job
+    params = job["params"]
+    star_id = params["star_id"]
+    files = job["files"]
+    
+    if not await db.stars.find_one({"_id": ObjectId(star_id)}):
+        for index, entry in enumerate(files):
+            if entry["status"] != "succeeded":
+                files[index].update({"status": "failed", "error": "明星不存在", "retryable": False})
+        await _finish_upload_job(context, files)
+        return
+    
+    todo = [
+        index for index, entry in enumerate(files)
+        if entry["status"] == "pending" or (entry["status"] == "failed" and entry.get("retryable"))
+    ]
+    
+    async def process(index: int, batch) -> None:
+        entry = files[index]
+        try:
+            with open(entry["path"], "rb") as f:
+                upload = UploadFile(
+                    f,
+                    filename=entry["filename"],
+                    headers=Headers({"content-type": entry["content_type"] or ""})
+                )
+                image = await batch.run(process_single_file, upload, star_id, db, params["reject_near_duplicates"])
+            entry.update({"status": "succeeded", "image_id": image.id, "error": None, "retryable": False})
+        except HTTPException as e:
+            entry.update({"status": "failed", "error": str(e.detail), "retryable": e.status_code >= 500})
+        except Exception as e:
+            entry.update({"status": "failed", "error": str(e), "retryable": True})
+        await context.update({
+            f"files.{index}": entry,
+            "progress": _upload_progress(files)
+        })
+    
+    async with upload_scheduler.batch(len(todo)) as batch:
+        await asyncio.gather(*(process(index, batch) for index in todo))
+    
+    retryable = [entry for entry in files if entry["status"] == "failed" and entry.get("retryable")]
+    if retryable and not last_attempt:
+        raise JobRetryError(f"{len(retryable)} 個檔案上傳失敗，稍後重試")
+    await _finish_upload_job(context, files)
+
+def _upload_progress(files: List[dict]) -> dict:
+    return {
+        "total": len(files),
+        "succeeded": sum(1 for entry in files if entry["status"] == "succeeded"),
+        "failed": sum(1 for entry in files if entry["status"] == "failed")
+    }
+
+async def _finish_upload_job(context: JobContext, files: List[dict]) -> None:
+    """工作結束（不再重試）：寫入最終進度（暫存檔由 run_upload_job 刪除）"""
+    await context.update({"files": files, "progress": _upload_progress(files)})
+
+job_service.register_handler("upload_images", run_upload_job)
+
+# 一次可以申請的直接上傳數量
+DIRECT_UPLOAD_MAX_FILES = 100
+
+def _require_direct_upload() -> None:
+    if not storage_service.supports_direct_upload:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="目前的儲存後端不支援直接上傳"
+        )
+
+@router.post("/{star_id}/images/direct-uploads", response_model=List[DirectUploadTicket])
+async def create_direct_uploads(star_id: str, request_data: DirectUploadRequest):
+    """
+    申請直接上傳：每個檔案回傳一組簽署過、短時間有效的上傳參數
+
+    客戶端把檔案直接上傳到儲存空間（不經過 API），再把儲存空間的回應交給
+    POST /{star_id}/images/direct-uploads/finalize 一次記錄所有圖片。
+    public_id 沿用 generate_public_id 的格式，簽進參數中，客戶端無法更改
+    """
+    _require_direct_upload()
+    if not request_data.files or len(request_data.files) > DIRECT_UPLOAD_MAX_FILES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"一次可以申請 1 到 {DIRECT_UPLOAD_MAX_FILES} 個檔案"
+        )
+    for file in request_data.files:
+        if file.content_type not in ALLOWED_IMAGE_TYPES:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"不支援的檔案類型。支援的類型：{', '.join(ALLOWED_IMAGE_TYPES)}"
+            )
+        if file.file_size > MAX_FILE_SIZE:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"檔案 {file.filename} 超過 10MB 限制"
+            )
+    
     db = get_database()
+    if not await db.stars.find_one({"_id": ObjectId(star_id)}, {"_id": 1}):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="明星不存在"
+        )
     
+    expires_at = int(time.time()) + settings.direct_upload_expires_seconds
+    expires = datetime.utcfromtimestamp(expires_at)
+    tickets = []
+    for file in request_data.files:
+        public_id = storage_service.generate_public_id(star_id=star_id, filename=file.filename)
+        try:
+            upload = storage_service.create_direct_upload(public_id, expires_at)
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"無法建立上傳參數: {str(e)}"
+            )
+        tickets.append({"filename": file.filename, "public_id": public_id, "expires_at": expires, **upload})
+    return tickets
+
+@router.post(
+    "/{star_id}/images/direct-uploads/finalize",
+    response_model=List[ImageResponse],
+    status_code=status.HTTP_201_CREATED
+)
+async def finalize_direct_uploads(star_id: str, request_data: DirectUploadFinalize):
+    """
+    記錄直接上傳完成的圖片
+
+    - 每個檔案都要通過儲存後端的簽章驗證，且 public_id 必須在這個明星的路徑下
+    - 所有新圖片以一次 insert_many 寫入，明星統計與快取也只更新一次
+    - 已經記錄過的檔案（重送 finalize）直接回傳既有的圖片，不會重複建立
+
+    直接上傳的檔案不經過 API，沒有內容去重與感知雜湊；主色與 blurhash 由
+    scripts/backfill_image_metadata 補上
+    """
+    _require_direct_upload()
+    if not request_data.files or len(request_data.files) > DIRECT_UPLOAD_MAX_FILES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"一次可以記錄 1 到 {DIRECT_UPLOAD_MAX_FILES} 個檔案"
+        )
+    
+    db = get_database()
+    if not await db.stars.find_one({"_id": ObjectId(star_id)}, {"_id": 1}):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="明星不存在"
+        )
+    
+    # 先驗證全部檔案，有任何一個無效就整批拒絕（不寫入任何圖片）
+    prefix = storage_service.public_id_prefix(star_id)
+    verified = []
+    uploads = await asyncio.gather(*(storage_service.verify_direct_upload(file.result) for file in request_data.files))
+    for file, upload in zip(request_data.files, uploads):
+        if upload is None or not upload["public_id"].startswith(prefix):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"檔案 {file.filename} 的上傳結果驗證失敗"
+            )
+        if upload["file_size"] > MAX_FILE_SIZE or upload["mime_type"] not in ALLOWED_IMAGE_TYPES:
+            # 直接上傳無法在上傳前擋下，不符合限制的檔案從儲存空間刪除
+            await storage_service.delete_file(upload["public_id"])
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"檔案 {file.filename} 超過 10MB 限制或不是支援的圖片類型"
+            )
+        verified.append((file.filename, upload))
+    
+    public_ids = [upload["public_id"] for _, upload in verified]
+    recorded = {
+        image["s3_key"]: image
+        async for image in db.images.find({"s3_key": {"$in": public_ids}, "star_id": ObjectId(star_id)})
+    }
+    
+    now = datetime.utcnow()
+    new_images = []
+    for filename, upload in verified:
+        if upload["public_id"] in recorded:
+            continue
+        image_dict = {
+            "star_id": ObjectId(star_id),
+            "s3_key": upload["public_id"],
+            "s3_url": upload["url"],
+            "filename": filename,
+            "file_size": upload["file_size"],
+            "mime_type": upload["mime_type"],
+            "uploaded_at": now,
+            "variants": storage_service.variants_for(upload["public_id"])
+        }
+        if upload["width"] and upload["height"]:
+            image_dict.update({
+                "width": upload["width"],
+                "height": upload["height"],
+                "aspect_ratio": round(upload["width"] / upload["height"], 4)
+            })
+        new_images.append(image_dict)
+        # 同一個請求中重複的檔案只記錄一次
+        recorded[upload["public_id"]] = image_dict
+    
+    if new_images:
+        result = await db.images.insert_many(new_images)
+        for image_dict, image_id in zip(new_images, result.inserted_ids):
+            image_dict["_id"] = image_id
+        await star_summary_service.record_bulk_upload(db, star_id, new_images)
+        response_cache.invalidate("stars", f"star:{star_id}", f"images:{star_id}")
+    
+    return [image_to_response(recorded[public_id]) for public_id in dict.fromkeys(public_ids)]
+
+def encode_cursor(image: dict) -> str:
+    """
+    將最後一筆圖片的 (uploaded_at, _id) 編碼成不透明的分頁游標
+
+    前端只需要原樣回傳，不需要理解內容
+    """
+    payload = json.dumps({
+        "t": image["uploaded_at"].isoformat(),
+        "id": str(image["_id"])
+    }, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple:
+    """解析分頁游標，回傳 (uploaded_at, ObjectId)"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(payload["t"]), ObjectId(payload["id"])
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="無效的分頁游標"
+        )
+
+async def load_star_images(
+    db,
+    star_id: str,
+    page: int = 1,
+    limit: int = 20,
+    cursor: Optional[str] = None
+) -> tuple:
+    """
+    查詢一頁圖片，回傳 (圖片 dict 列表, 下一頁的游標或 None)
+
+    只投影回應需要的欄位，每一筆直接轉成 dict，由呼叫端一次序列化
+    """
     # 驗證明星是否存在
-    star = await db.stars.find_one({"_id": ObjectId(star_id)})
+    star = await db.stars.find_one({"_id": ObjectId(star_id)}, {"_id": 1})
     if not star:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="明星不存在"
         )
     
-    # 計算跳過數量
-    skip = (page - 1) * limit
+    query = {"star_id": ObjectId(star_id)}
     
-    # 查詢圖片
-    cursor = db.images.find({"star_id": ObjectId(star_id)}).sort("uploaded_at", -1).skip(skip).limit(limit)
+    if cursor:
+        # keyset 分頁：只取排在游標之後的圖片，不需要 skip
+        last_uploaded_at, last_id = decode_cursor(cursor)
+        query["$or"] = [
+            {"uploaded_at": {"$lt": last_uploaded_at}},
+            {"uploaded_at": last_uploaded_at, "_id": {"$lt": last_id}}
+        ]
+        skip = 0
+    else:
+        # 計算跳過數量
+        skip = (page - 1) * limit
     
-    images = await cursor.to_list(length=limit)
+    # 查詢圖片（多取一筆用來判斷是否還有下一頁）
+    # 以 _id 作為同一時間上傳的圖片的次要排序，讓游標位置唯一
+    cursor_obj = (
+        db.images.find(query, IMAGE_PROJECTION)
+        .sort([("uploaded_at", -1), ("_id", -1)])
+        .skip(skip)
+        .limit(limit + 1)
+    )
+    
+    images = await cursor_obj.to_list(length=limit + 1)
+    
+    next_cursor = None
+    if len(images) > limit:
+        images = images[:limit]
+        next_cursor = encode_cursor(images[-1])
+    
+    return [image_to_row(img) for img in images], next_cursor
+
+@router.get("/{star_id}/images", response_model=List[ImageResponse])
+async def get_star_images(
+    star_id: str,
+    request: Request,
+    page: int = 1,
+    limit: int = 20,
+    cursor: Optional[str] = None
+):
+    """
+    取得指定明星的圖片列表（支援分頁）
+
+    兩種分頁模式：
+    - page：傳統的 skip/limit 分頁（保留向下相容），越後面的頁數越慢，
+      因為 MongoDB 仍需逐筆走過被跳過的文件
+    - cursor：keyset 分頁，以 (uploaded_at, _id) 作為位置，
+      每一頁的成本都相同，與翻到多深無關
+
+    兩種模式都會在還有下一頁時回傳 X-Next-Cursor header，
+    前端把它當作下一次請求的 cursor 參數即可
+
+    回應經過快取（上傳或刪除圖片時清除），帶 If-None-Match 且內容未變時回應 304；
+    設定 MONGO_READ_FROM_SECONDARIES 時從 secondary 讀取（剛上傳或刪除過時仍從 primary 讀取）
+    """
+    async def load():
+        db = get_read_database(response_cache.recently_written(f"images:{star_id}"))
+        images, next_cursor = await load_star_images(db, star_id, page, limit, cursor)
+        return images, ({"X-Next-Cursor": next_cursor} if next_cursor else {})
     
-    return [ImageResponse(
-        id=str(img["_id"]),
-        star_id=str(img["star_id"]),
-        s3_url=img["s3_url"],
-        filename=img["filename"],
-        file_size=img["file_size"],
-        mime_type=img["mime_type"],
-        uploaded_at=img["uploaded_at"]
-    ) for img in images]
+    key = f"images:{star_id}:page={page}:cursor={cursor}:limit={limit}"
+    return await cached_json_response(request, key, [f"images:{star_id}"], load)
+
+@router.get("/{star_id}/images/export")
+async def export_star_images(star_id: str):
+    """
+    下載明星的所有圖片（ZIP）
+
+    ZIP 邊產生邊送出，伺服器不暫存整個壓縮檔，記憶體用量與圖庫大小無關（見 export_service）；
+    回應開始後才失敗的圖片會略過，並列在 ZIP 中的失敗清單
+    """
+    db = get_read_database(response_cache.recently_written(f"images:{star_id}"))
+    star = await db.stars.find_one({"_id": ObjectId(star_id)}, {"name": 1})
+    if not star:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="明星不存在"
+        )
+    
+    # 明星名字可能包含非 ASCII 字元，以 filename* 提供 UTF-8 檔名
+    disposition = f'attachment; filename="star-{star_id}.zip"; filename*=UTF-8\'\'{quote(star["name"])}.zip'
+    return StreamingResponse(
+        stream_star_zip(db, star_id),
+        media_type="application/zip",
+        headers={"Content-Disposition": disposition, "Cache-Control": "no-store"}
+    )
 
 @router.delete("/images/{image_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_image(image_id: str):
@@ -190,20 +953,69 @@ async def delete_image(image_id: str):
             detail="圖片不存在"
         )
     
-    # 從 Cloudinary 刪除檔案
-    await cloudinary_service.delete_file(image["s3_key"])
+    # 共用的檔案（內容去重）只在最後一個引用被刪除時才從儲存空間刪除
+    s3_keys = await dedup_service.release_assets(db, [image])
     
     # 從 MongoDB 刪除記錄
     await db.images.delete_one({"_id": ObjectId(image_id)})
+    await phash_service.remove(db, image["star_id"], image_id)
+    star_id = str(image["star_id"])
+    await star_summary_service.record_delete(db, star_id, image)
+    response_cache.invalidate("stars", f"star:{star_id}", f"images:{star_id}")
+    
+    # 從儲存空間刪除檔案
+    for s3_key in s3_keys:
+        await storage_service.delete_file(s3_key)
     
     return None
 
+async def run_reconcile_storage_job(context: JobContext) -> None:
+    """背景對帳：每處理一頁就更新一次報告（progress）"""
+    params = context.job["params"]
+    
+    async def progress(report: dict) -> None:
+        await context.update({"progress": report})
+    
+    await reconcile_service.reconcile_storage(
+        get_database(), params["dry_run"], params["relink"], params.get("max_files"), progress
+    )
+
+job_service.register_handler("reconcile_storage", run_reconcile_storage_job)
+
+@router.post("/images/reconcile", status_code=status.HTTP_202_ACCEPTED)
+async def reconcile_storage(
+    dry_run: bool = True,
+    relink: bool = False,
+    max_files: Optional[int] = Query(None, ge=1)
+):
+    """
+    儲存空間與圖片記錄對帳，清理沒有記錄的孤兒檔案（背景工作）
+
+    每次從上次的位置繼續，最多檢查 max_files（預設 RECONCILE_MAX_FILES）個檔案（見 reconcile_service）；
+    預設 dry_run=true 只產生報告（GET /api/jobs/{job_id} 的 progress），
+    dry_run=false 時刪除孤兒檔案，relink=true 時所屬明星還在的檔案改為重新建立圖片記錄；
+    儲存後端不支援列出檔案時回應 501
+    """
+    if not storage_service.supports_listing:
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail="目前的儲存後端不支援列出檔案，無法對帳"
+        )
+    db = get_database()
+    job = await job_service.enqueue(
+        db,
+        "reconcile_storage",
+        {"dry_run": dry_run, "relink": relink, "max_files": max_files},
+        extra={"progress": {}}
+    )
+    return job_accepted_response(job)
+
 @router.get("/images/{image_id}", response_model=ImageResponse)
 async def get_image(image_id: str):
     """取得單一圖片詳情"""
     db = get_database()
     
-    image = await db.images.find_one({"_id": ObjectId(image_id)})
+    image = await db.images.find_one({"_id": ObjectId(image_id)}, IMAGE_PROJECTION)
     
     if not image:
         raise HTTPException(
@@ -211,13 +1023,41 @@ async def get_image(image_id: str):
             detail="圖片不存在"
         )
     
-    return ImageResponse(
-        id=str(image["_id"]),
-        star_id=str(image["star_id"]),
-        s3_url=image["s3_url"],
-        filename=image["filename"],
-        file_size=image["file_size"],
-        mime_type=image["mime_type"],
-        uploaded_at=image["uploaded_at"]
-    )
+    return FastJSONResponse(image_to_row(image))
 
+@router.get("/{star_id}/images/{image_id}/similar", response_model=List[SimilarImageResponse])
+async def get_similar_images(
+    star_id: str,
+    image_id: str,
+    max_distance: int = Query(10, ge=0, le=64),
+    limit: int = Query(20, ge=1, le=100)
+):
+    """
+    找出同一個明星中與指定圖片相似（近似重複）的圖片
+
+    以感知雜湊（dHash）的 Hamming 距離比對，距離越小越相似，結果依距離排序
+    """
+    db = get_database()
+    
+    image = await db.images.find_one({"_id": ObjectId(image_id), "star_id": ObjectId(star_id)})
+    if not image:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="圖片不存在"
+        )
+    if not image.get("phash"):
+        return []
+    
+    similar = await phash_service.find_similar(
+        db, star_id, image["phash"], max_distance, limit, exclude=image_id
+    )
+    if not similar:
+        return []
+    
+    distances = dict(similar)
+    images = await db.images.find(
+        {"_id": {"$in": [ObjectId(i) for i in distances]}}, IMAGE_PROJECTION
+    ).to_list(length=limit)
+    results = [{**image_to_row(img), "distance": distances[str(img["_id"])]} for img in images]
+    results.sort(key=lambda result: result["distance"])
+    return FastJSONResponse(results)
@@ -0,0 +1,45 @@
+from fastapi import APIRouter, HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from bson import ObjectId
+from app.database import get_database
+from app.models.job import JobResponse
+from app.services.job_service import job_service
+
+router = APIRouter(prefix="/api/jobs", tags=["jobs"])
+
+def job_to_response(job: dict) -> JobResponse:
+    """MongoDB 工作文件轉成 JobResponse"""
+    return JobResponse(
+        id=str(job["_id"]),
+        type=job["type"],
+        status=job["status"],
+        attempts=job["attempts"],
+        progress=job.get("progress", {}),
+        files=job.get("files"),
+        error=job.get("error"),
+        created_at=job["created_at"],
+        updated_at=job["updated_at"]
+    )
+
+def job_accepted_response(job: dict) -> JSONResponse:
+    """202 Accepted：回傳工作內容，Location 指向狀態查詢 API"""
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content=jsonable_encoder(job_to_response(job)),
+        headers={"Location": f"/api/jobs/{job['_id']}"}
+    )
+
+@router.get("/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    """查詢背景工作的狀態與每個檔案的進度"""
+    db = get_database()
+    
+    job = await job_service.get(db, job_id) if ObjectId.is_valid(job_id) else None
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="工作不存在"
+        )
+    
+    return job_to_response(job)
@@ -1,33 +1,81 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, HTTPException, status, Query, Request
 from typing import List, Optional
-import asyncio
-from app.database import get_database
+from app.database import get_database, get_read_database
 from app.models.star import StarCreate, StarUpdate, StarResponse
-from app.services.cloudinary_service import cloudinary_service
+from app.services.phash_service import phash_service
+from app.services.star_deletion_service import delete_star_images
+from app.services import star_summary_service
+from app.services.job_service import job_service, JobContext
+from app.routers.jobs import job_accepted_response
+from app.services.star_search_service import star_search_service
+from app.services.response_cache import response_cache, cached_json_response
+from app.serialization import FastJSONResponse
 from bson import ObjectId
 from datetime import datetime
 
 router = APIRouter(prefix="/api/stars", tags=["stars"])
 
+# 讀取路徑只取回應需要的欄位
+STAR_PROJECTION = {
+    "name": 1,
+    "created_at": 1,
+    "image_count": 1,
+    "total_bytes": 1,
+    "last_uploaded_at": 1,
+    "cover_image": 1
+}
+
+# get_stars 的排序方式：created（建立時間）、recent（最近上傳）、popular（圖片數）
+STAR_SORTS = {
+    "created": [("created_at", -1)],
+    "recent": [("last_uploaded_at", -1), ("_id", -1)],
+    "popular": [("image_count", -1), ("_id", -1)]
+}
+
+def star_to_row(star: dict) -> dict:
+    """MongoDB 明星文件轉成回應用的 dict（欄位與 StarResponse 相同，不建立模型）"""
+    return {
+        "id": str(star["_id"]),
+        "name": star["name"],
+        "created_at": star["created_at"],
+        "image_count": star.get("image_count", 0),
+        "total_bytes": star.get("total_bytes", 0),
+        "last_uploaded_at": star.get("last_uploaded_at"),
+        "cover_image": star.get("cover_image")
+    }
+
 @router.get("", response_model=List[StarResponse])
-async def get_stars(search: Optional[str] = None):
-    """取得所有明星列表（支援搜尋）"""
-    db = get_database()
-    
-    query = {}
-    
-    # 如果有搜尋關鍵字，加入搜尋條件
-    if search:
-        query["name"] = {"$regex": search, "$options": "i"}  # 不區分大小寫
-    
-    cursor = db.stars.find(query).sort("created_at", -1)
-    stars = await cursor.to_list(length=1000)  # 最多 1000 筆
+async def get_stars(
+    request: Request,
+    search: Optional[str] = None,
+    sort: str = Query("created", pattern="^(created|recent|popular)$")
+):
+    """
+    取得所有明星列表（支援搜尋與排序）
+
+    每個明星都帶有圖片數、總大小、最後上傳時間與封面圖片，一次查詢即可顯示列表，
+    不需要再逐一查詢每個明星的圖片
+
+    回應經過快取（新增、改名、刪除明星時清除），帶 If-None-Match 且內容未變時回應 304；
+    設定 MONGO_READ_FROM_SECONDARIES 時從 secondary 讀取（剛寫入過時仍從 primary 讀取）
+    """
+    async def load():
+        db = get_read_database(response_cache.recently_written("stars"))
+        
+        query = {}
+        
+        # 如果有搜尋關鍵字，從記憶體內的搜尋索引找出相符的明星（不區分大小寫）
+        if search:
+            await star_search_service.refresh(get_database())
+            star_ids = star_search_service.search(search, limit=1000)
+            query["_id"] = {"$in": [ObjectId(star_id) for star_id in star_ids]}
+        
+        cursor = db.stars.find(query, STAR_PROJECTION).sort(STAR_SORTS[sort])
+        stars = await cursor.to_list(length=1000)  # 最多 1000 筆
+        
+        return [star_to_row(star) for star in stars], {}
     
-    return [StarResponse(
-        id=str(star["_id"]),
-        name=star["name"],
-        created_at=star["created_at"]
-    ) for star in stars]
+    return await cached_json_response(request, f"stars:search={search or ''}:sort={sort}", ["stars"], load)
 
 @router.post("", response_model=StarResponse, status_code=status.HTTP_201_CREATED)
 async def create_star(star_data: StarCreate):
@@ -45,37 +93,53 @@ async def create_star(star_data: StarCreate):
     # 建立新明星
     star_dict = {
         "name": star_data.name,
-        "created_at": datetime.utcnow()
+        "created_at": datetime.utcnow(),
+        **star_summary_service.EMPTY_SUMMARY
     }
     
     result = await db.stars.insert_one(star_dict)
     star_dict["_id"] = result.inserted_id
-    star_dict["id"] = str(result.inserted_id)
+    star_search_service.add(str(result.inserted_id), star_dict["name"], star_dict["created_at"])
+    await star_search_service.publish(db)
+    response_cache.invalidate("stars")
     
-    return StarResponse(
-        id=star_dict["id"],
-        name=star_dict["name"],
-        created_at=star_dict["created_at"]
-    )
+    return StarResponse(**star_to_row(star_dict))
+
+@router.get("/suggest", response_model=List[StarResponse])
+async def suggest_stars(
+    q: str,
+    limit: int = Query(10, ge=1, le=50)
+):
+    """
+    搜尋建議（typeahead）
+
+    直接由記憶體內的搜尋索引回應，MongoDB 只用來確認其他 worker 是否寫入過（世代計數器）；
+    前綴相符的結果排在前面，其次是子字串相符
+    """
+    await star_search_service.refresh(get_database())
+    results = []
+    for star_id in star_search_service.search(q, limit=limit):
+        name, created_at = star_search_service.get(star_id)
+        results.append({"id": star_id, "name": name, "created_at": created_at})
+    return FastJSONResponse(results)
 
 @router.get("/{star_id}", response_model=StarResponse)
-async def get_star(star_id: str):
-    """取得明星詳情"""
-    db = get_database()
-    
-    star = await db.stars.find_one({"_id": ObjectId(star_id)})
+async def get_star(star_id: str, request: Request):
+    """取得明星詳情（經過快取，改名或刪除時清除）"""
+    async def load():
+        db = get_database()
+        
+        star = await db.stars.find_one({"_id": ObjectId(star_id)}, STAR_PROJECTION)
+        
+        if not star:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="明星不存在"
+            )
+        
+        return star_to_row(star), {}
     
-    if not star:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="明星不存在"
-        )
-    
-    return StarResponse(
-        id=str(star["_id"]),
-        name=star["name"],
-        created_at=star["created_at"]
-    )
+    return await cached_json_response(request, f"star:{star_id}", [f"star:{star_id}"], load)
 
 @router.put("/{star_id}", response_model=StarResponse)
 async def update_star(star_id: str, star_data: StarUpdate):
@@ -106,36 +170,76 @@ async def update_star(star_id: str, star_data: StarUpdate):
         {"_id": ObjectId(star_id)},
         {"$set": {"name": star_data.name}}
     )
+    star_search_service.update(star_id, star_data.name)
+    await star_search_service.publish(db)
+    response_cache.invalidate("stars", f"star:{star_id}")
     
-    updated_star = await db.stars.find_one({"_id": ObjectId(star_id)})
+    updated_star = await db.stars.find_one({"_id": ObjectId(star_id)}, STAR_PROJECTION)
     
-    return StarResponse(
-        id=str(updated_star["_id"]),
-        name=updated_star["name"],
-        created_at=updated_star["created_at"]
-    )
+    return StarResponse(**star_to_row(updated_star))
 
-async def delete_single_image(s3_key: str):
-    """
-    刪除單個圖片（並發處理用）
+async def delete_star_fully(db, star_id: str, on_progress=None) -> None:
+    """逐批刪除明星的所有圖片後刪除明星本身（同步與背景模式共用）"""
+    # 標記為刪除中（中斷後可以辨識並重新執行）
+    await db.stars.update_one({"_id": ObjectId(star_id)}, {"$set": {"deleting": True}})
+    
+    # 逐批刪除儲存空間的檔案與 MongoDB 的圖片記錄
+    await delete_star_images(db, star_id, on_progress)
+    
+    # 刪除明星
+    await db.stars.delete_one({"_id": ObjectId(star_id)})
+    star_search_service.remove(star_id)
+    await star_search_service.publish(db)
+    await phash_service.drop_star(db, star_id)
+    response_cache.invalidate("stars", f"star:{star_id}", f"images:{star_id}")
+
+async def run_delete_star_job(context: JobContext) -> None:
+    """背景刪除明星工作（中斷或失敗後重試會從剩下的圖片繼續）"""
+    db = get_database()
+    
+    async def on_progress(deleted: int) -> None:
+        await context.update({"progress.deleted_images": deleted})
     
-    這個函數會被並發執行，所以每個圖片的刪除不會互相阻塞
+    await delete_star_fully(db, context.job["params"]["star_id"], on_progress)
+
+job_service.register_handler("delete_star", run_delete_star_job)
+
+async def run_repair_star_summaries_job(context: JobContext) -> None:
+    """背景重新計算明星統計欄位（可重複執行）"""
+    updated = await star_summary_service.repair_summaries(get_database(), context.job["params"].get("star_ids"))
+    response_cache.clear()
+    await context.update({"progress.updated_stars": updated})
+
+job_service.register_handler("repair_star_summaries", run_repair_star_summaries_job)
+
+@router.post("/summaries/repair", status_code=status.HTTP_202_ACCEPTED)
+async def repair_star_summaries(star_id: Optional[List[str]] = Query(None)):
     """
-    await cloudinary_service.delete_file(s3_key)
+    從圖片記錄重新計算明星的圖片數、總大小、最後上傳時間與封面（背景工作）
+
+    正常情況下統計欄位由上傳與刪除即時更新，這個端點用來修復中斷或手動修改資料造成的偏差；
+    不指定 star_id 時修復所有明星
+    """
+    db = get_database()
+    job = await job_service.enqueue(db, "repair_star_summaries", {"star_ids": star_id}, extra={"progress": {"updated_stars": 0}})
+    return job_accepted_response(job)
 
 @router.delete("/{star_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_star(star_id: str):
+async def delete_star(star_id: str, background: bool = False):
     """
     刪除明星（同時刪除該明星的所有圖片）
     
     改進說明：
-    - 原本：使用 for loop 順序處理，一個圖片刪除完才刪除下一個
-    - 現在：使用 asyncio.gather 並發處理，多個圖片同時刪除
+    - 原本：一次讀出所有圖片（最多 10000 筆），每張圖片一個刪除請求同時送出
+    - 現在：用只投影 s3_key 的 cursor 逐批讀取，每批 100 張用儲存後端的批次刪除，
+      同時進行的批次數有上限（STAR_DELETE_CONCURRENCY），MongoDB 記錄也逐批刪除
     
-    效能提升：
-    - 假設刪除 10 張圖片，每張需要 1 秒
-    - 原本：1 + 1 + 1 + ... = 10 秒
-    - 現在：約 1 秒（最慢的那個圖片的時間）
+    效果：
+    - 記憶體用量固定，不受圖片數量影響，超過 10000 張也不會留下孤兒檔案
+    - 不會一次打出大量請求觸發儲存服務的速率限制
+    - 中途中斷時明星會保留 deleting 標記，再呼叫一次 DELETE 會從剩下的圖片繼續
+    
+    background=true 時回應 202 與工作內容，圖片很多時不會卡住 HTTP 請求
     """
     db = get_database()
     
@@ -147,21 +251,12 @@ async def delete_star(star_id: str):
             detail="明星不存在"
         )
     
-    # 取得該明星的所有圖片
-    images = await db.images.find({"star_id": ObjectId(star_id)}).to_list(length=10000)
-    
-    # 從 Cloudinary 刪除所有圖片（並發刪除）
-    delete_tasks = [
-        delete_single_image(image["s3_key"])
-        for image in images
-    ]
-    await asyncio.gather(*delete_tasks)
-    
-    # 從 MongoDB 刪除所有圖片記錄
-    await db.images.delete_many({"star_id": ObjectId(star_id)})
+    # 背景模式：立即回應 202，由背景 worker 刪除，進度可由 GET /api/jobs/{job_id} 查詢
+    if background:
+        await db.stars.update_one({"_id": ObjectId(star_id)}, {"$set": {"deleting": True}})
+        job = await job_service.enqueue(db, "delete_star", {"star_id": star_id}, extra={"progress": {"deleted_images": 0}})
+        return job_accepted_response(job)
     
-    # 刪除明星
-    await db.stars.delete_one({"_id": ObjectId(star_id)})
+    await delete_star_fully(db, star_id)
     
     return None
-
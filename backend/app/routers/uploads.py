@@ -0,0 +1,222 @@
+from fastapi import APIRouter, HTTPException, Request, Response, UploadFile, status
+from starlette.datastructures import Headers
+from starlette.requests import ClientDisconnect
+from email.utils import format_datetime
+from datetime import timezone
+from bson import ObjectId
+from app.database import get_database
+from app.models.image import ImageResponse
+from app.models.upload_session import UploadSessionCreate, UploadSessionResponse
+from app.routers.images import (
+    ALLOWED_IMAGE_TYPES, IMAGE_PROJECTION, MAX_FILE_SIZE, image_to_response, process_single_file, reserve_upload_batch
+)
+from app.services.upload_session_service import (
+    upload_session_service, SESSION_COMPLETED, SESSION_UPLOADING,
+    UploadBusyError, UploadNotWritableError, UploadOffsetMismatchError, UploadTooLargeError
+)
+
+router = APIRouter(prefix="/api/stars", tags=["uploads"])
+
+def session_to_response(session: dict) -> UploadSessionResponse:
+    return UploadSessionResponse(
+        id=str(session["_id"]),
+        star_id=str(session["star_id"]),
+        filename=session["filename"],
+        content_type=session["content_type"],
+        size=session["size"],
+        offset=upload_session_service.offset_of(session),
+        status=session["status"],
+        image_id=session.get("image_id"),
+        expires_at=session["expires_at"]
+    )
+
+def session_headers(session: dict, offset: int = None) -> dict:
+    """tus 風格的位置標頭：目前位置、總大小與到期時間"""
+    if offset is None:
+        offset = upload_session_service.offset_of(session)
+    return {
+        "Upload-Offset": str(offset),
+        "Upload-Length": str(session["size"]),
+        "Upload-Expires": format_datetime(session["expires_at"].replace(tzinfo=timezone.utc), usegmt=True),
+        "Cache-Control": "no-store",
+    }
+
+async def get_session_or_404(db, star_id: str, upload_id: str) -> dict:
+    session = await upload_session_service.get(db, star_id, upload_id)
+    if not session:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="上傳階段不存在或已過期"
+        )
+    return session
+
+@router.post("/{star_id}/uploads", response_model=UploadSessionResponse, status_code=status.HTTP_201_CREATED)
+async def create_upload_session(star_id: str, request_data: UploadSessionCreate, response: Response):
+    """
+    建立可續傳上傳階段
+
+    之後以 PATCH /api/stars/{star_id}/uploads/{upload_id}（Upload-Offset 標頭 + 原始內容）分段上傳，
+    連線中斷時以 HEAD 取得已收到的位置後從那裡續傳，全部收到後 POST .../finalize 建立圖片
+    """
+    if request_data.content_type not in ALLOWED_IMAGE_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"不支援的檔案類型。支援的類型：{', '.join(ALLOWED_IMAGE_TYPES)}"
+        )
+    if request_data.size <= 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="檔案大小必須大於 0"
+        )
+    if request_data.size > MAX_FILE_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"檔案 {request_data.filename} 超過 10MB 限制"
+        )
+
+    db = get_database()
+    if not await db.stars.find_one({"_id": ObjectId(star_id)}, {"_id": 1}):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="明星不存在"
+        )
+
+    session = await upload_session_service.create(
+        db, star_id, request_data.filename, request_data.content_type, request_data.size
+    )
+    response.headers.update(session_headers(session, 0))
+    response.headers["Location"] = f"{router.prefix}/{star_id}/uploads/{session['_id']}"
+    return session_to_response(session)
+
+@router.head("/{star_id}/uploads/{upload_id}")
+async def get_upload_offset(star_id: str, upload_id: str):
+    """取得目前已收到的位置（Upload-Offset 標頭），續傳時從這裡開始"""
+    session = await get_session_or_404(get_database(), star_id, upload_id)
+    return Response(status_code=status.HTTP_200_OK, headers=session_headers(session))
+
+@router.get("/{star_id}/uploads/{upload_id}", response_model=UploadSessionResponse)
+async def get_upload_session(star_id: str, upload_id: str, response: Response):
+    """取得上傳階段的狀態"""
+    session = await get_session_or_404(get_database(), star_id, upload_id)
+    response.headers.update(session_headers(session))
+    return session_to_response(session)
+
+@router.patch("/{star_id}/uploads/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def append_upload_chunk(star_id: str, upload_id: str, request: Request):
+    """
+    從 Upload-Offset 標頭指定的位置附加內容（請求內容就是檔案的原始位元組，不是 multipart）
+
+    內容直接串流寫入暫存檔，不讀進記憶體；Upload-Offset 與已收到的大小不同、
+    或同一個上傳正在被另一個請求寫入時回應 409，回應的 Upload-Offset 標頭是新的位置
+    """
+    try:
+        offset = int(request.headers["Upload-Offset"])
+    except (KeyError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="缺少或無效的 Upload-Offset 標頭"
+        )
+
+    db = get_database()
+    session = await get_session_or_404(db, star_id, upload_id)
+    if session["status"] != SESSION_UPLOADING:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="上傳已經完成或正在處理中",
+            headers=session_headers(session)
+        )
+
+    try:
+        new_offset = await upload_session_service.append(db, session, offset, request.stream())
+    except UploadOffsetMismatchError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Upload-Offset 不符，{e}",
+            headers=session_headers(session, e.offset)
+        )
+    except UploadBusyError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e),
+            headers=session_headers(session)
+        )
+    except UploadNotWritableError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
+    except UploadTooLargeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+            detail=str(e),
+            headers=session_headers(session)
+        )
+    except ClientDisconnect:
+        # 已寫入的部分保留，客戶端重新連線後以 HEAD 取得位置續傳（這個回應不會被收到）
+        return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+    return Response(status_code=status.HTTP_204_NO_CONTENT, headers=session_headers(session, new_offset))
+
+@router.post(
+    "/{star_id}/uploads/{upload_id}/finalize",
+    response_model=ImageResponse,
+    status_code=status.HTTP_201_CREATED
+)
+async def finalize_upload_session(star_id: str, upload_id: str):
+    """
+    全部內容收到後建立圖片
+
+    暫存檔交給和一般上傳相同的流程（排程器名額、去重、前處理、上傳到儲存空間、寫入資料庫），
+    完成後刪除暫存檔；重送 finalize 回傳同一張圖片
+    """
+    db = get_database()
+    session = await get_session_or_404(db, star_id, upload_id)
+
+    if session["status"] == SESSION_COMPLETED:
+        image = await db.images.find_one({"_id": ObjectId(session["image_id"])}, IMAGE_PROJECTION)
+        if not image:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="圖片不存在"
+            )
+        return image_to_response(image)
+
+    offset = upload_session_service.offset_of(session)
+    if offset != session["size"]:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"檔案尚未上傳完成（{offset} / {session['size']} bytes）",
+            headers=session_headers(session, offset)
+        )
+
+    # 先登記排程器名額，佇列已滿時不會把上傳階段標記為處理中
+    batch = reserve_upload_batch(1)
+    async with batch:
+        if not await upload_session_service.claim_finalize(db, session):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="這個上傳正在處理中"
+            )
+        try:
+            with open(upload_session_service.path_for(session), "rb") as f:
+                upload = UploadFile(
+                    f,
+                    filename=session["filename"],
+                    headers=Headers({"content-type": session["content_type"]})
+                )
+                image = await batch.run(process_single_file, upload, star_id, db)
+        except BaseException:
+            # 失敗時保留暫存檔，客戶端可以重新 finalize
+            await upload_session_service.release_finalize(db, session)
+            raise
+
+    await upload_session_service.complete(db, session, image.id)
+    return image
+
+@router.delete("/{star_id}/uploads/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_upload_session(star_id: str, upload_id: str):
+    """取消上傳並刪除已收到的內容（已完成的上傳只刪除上傳階段，圖片保留）"""
+    db = get_database()
+    session = await get_session_or_404(db, star_id, upload_id)
+    await upload_session_service.delete(db, session)
+    return None
@@ -0,0 +1,30 @@
+"""
+讀取路徑的 JSON 序列化
+
+列表端點直接把 MongoDB 文件轉成 dict，再用 orjson 一次序列化：
+不需要每一筆建立 Pydantic 模型、驗證，再由 FastAPI 重新編碼一次。
+datetime 由 orjson 直接輸出（格式與 Pydantic 相同），ObjectId 轉成字串
+"""
+from bson import ObjectId
+from fastapi import Response
+from pydantic import BaseModel
+from typing import Any
+import orjson
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    raise TypeError(f"無法序列化的型別：{type(obj).__name__}")
+
+def dumps(content: Any) -> bytes:
+    """序列化成 JSON bytes（支援 datetime、ObjectId 與 Pydantic 模型）"""
+    return orjson.dumps(content, default=_default)
+
+class FastJSONResponse(Response):
+    """以 dumps() 序列化的 JSON 回應（內容不經過 response_model 驗證）"""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -1,10 +1,45 @@
 import cloudinary
+import cloudinary.api
+import cloudinary.exceptions
+import cloudinary.search
 import cloudinary.uploader
+import cloudinary.utils
 from app.config import settings
+from app.metrics import storage_upload_bytes, track_storage
+from app.services.storage_backend import (
+    StorageBackend, FileTooLargeError, InvalidListCursorError, StorageDeleteError, UPLOAD_CHUNK_SIZE
+)
+from app.services.upload_scheduler import upload_scheduler
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple
+from datetime import datetime
+import urllib3
 import uuid
 import asyncio
+import functools
+import io
+import json
+
+# Admin API 的 delete_resources 一次最多 100 個 public_id
+DELETE_BATCH_SIZE = 100
+
+# Search API 每頁最多回傳的數量
+LIST_PAGE_SIZE = 500
+
+# 直接上傳允許的格式（簽進上傳參數，客戶端無法改成其他格式）與對應的 MIME type
+DIRECT_UPLOAD_FORMATS = {
+    "jpg": "image/jpeg",
+    "png": "image/png",
+    "gif": "image/gif",
+    "webp": "image/webp",
+}
+
+# 直接上傳參數的到期時間（Unix 時間）存在檔案 context 中的 key
+DIRECT_UPLOAD_EXPIRES_CONTEXT = "upload_expires_at"
+
+class CloudinaryService(StorageBackend):
+    supports_direct_upload = True
+    supports_listing = True
 
-class CloudinaryService:
     def __init__(self):
         """初始化 Cloudinary 客戶端"""
         if not settings.cloudinary_cloud_name or not settings.cloudinary_api_key or not settings.cloudinary_api_secret:
@@ -17,58 +52,179 @@ class CloudinaryService:
                 api_secret=settings.cloudinary_api_secret
             )
             self.configured = True
+        # 串流上傳用的 HTTP 連線池（與 Cloudinary SDK 相同的憑證設定）
+        self._http = urllib3.PoolManager(**cloudinary.CERT_KWARGS)
     
-    def generate_public_id(self, star_id: str, filename: str) -> str:
-        """生成 Cloudinary public_id（路徑）"""
-        # 格式：kpop_gallery/stars/{star_id}/{uuid}
-        unique_id = str(uuid.uuid4())
-        # 移除檔案副檔名，Cloudinary 會自動處理
-        name_without_ext = filename.rsplit('.', 1)[0] if '.' in filename else filename
-        safe_name = name_without_ext.replace(' ', '_').replace('/', '_')
-        public_id = f"kpop_gallery/stars/{star_id}/{unique_id}_{safe_name}"
-        return public_id
-    
-    def _upload_file_sync(self, file_content: bytes, public_id: str, content_type: str) -> str:
+    def _iter_multipart(self, params: dict, file_obj: BinaryIO, filename: str, content_type: str,
+                        boundary: str, max_size: Optional[int]) -> Iterator[bytes]:
+        """
+        逐塊產生 multipart/form-data 請求內容
+
+        檔案內容每次只讀 UPLOAD_CHUNK_SIZE，超過 max_size 時立即中止上傳
+        """
+        for key, value in params.items():
+            yield (
+                f'--{boundary}\r\nContent-Disposition: form-data; name="{key}"\r\n\r\n{value}\r\n'
+            ).encode()
+        yield (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n'
+        ).encode()
+        sent = 0
+        while True:
+            chunk = file_obj.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            sent += len(chunk)
+            if max_size is not None and sent > max_size:
+                raise FileTooLargeError(f"檔案超過 {max_size} bytes 限制")
+            yield chunk
+        yield f"\r\n--{boundary}--\r\n".encode()
+
+    def _upload_file_sync(self, file_obj: BinaryIO, public_id: str, content_type: str,
+                          max_size: Optional[int] = None) -> str:
         """
         同步上傳檔案到 Cloudinary（內部方法）
         這個方法會在執行緒池中執行，不會阻塞事件循環
+
+        Cloudinary SDK 的 uploader.upload 會先把整個檔案讀進記憶體再組成 multipart 內容，
+        這裡改為直接呼叫 Upload API，從檔案物件（UploadFile 的暫存檔）逐塊串流上傳，
+        每個請求佔用的記憶體固定為一個 chunk 的大小
         """
         if not self.configured:
             raise Exception("Cloudinary 未配置，請設定環境變數")
         
         try:
-            # 將 bytes 轉換為檔案格式
-            import io
-            file_obj = io.BytesIO(file_content)
+            # 取得檔案大小（暫存檔可以直接 seek，不需要讀取內容）
+            file_obj.seek(0, io.SEEK_END)
+            file_size = file_obj.tell()
+            file_obj.seek(0)
+            if max_size is not None and file_size > max_size:
+                raise FileTooLargeError(f"檔案超過 {max_size} bytes 限制")
             
-            # 上傳到 Cloudinary（同步操作）
-            result = cloudinary.uploader.upload(
-                file_obj,
-                public_id=public_id,
-                resource_type="image",
-                overwrite=True,
-                use_filename=False
+            # 簽署上傳參數（與 uploader.upload 相同的參數）
+            params = self._signed_upload_params({"public_id": public_id, "overwrite": True, "use_filename": False})
+            
+            boundary = uuid.uuid4().hex
+            filename = public_id.rsplit("/", 1)[-1]
+            # 先算出 multipart 的長度，讓請求帶 Content-Length 而不是 chunked
+            envelope_size = sum(
+                len(part) for part in self._iter_multipart(params, io.BytesIO(), filename, content_type, boundary, None)
             )
             
+            with track_storage("cloudinary", "upload"):
+                response = self._http.request(
+                    "POST",
+                    cloudinary.utils.cloudinary_api_url("upload", resource_type="image"),
+                    body=self._iter_multipart(params, file_obj, filename, content_type, boundary, max_size),
+                    headers={
+                        "Content-Type": f"multipart/form-data; boundary={boundary}",
+                        "Content-Length": str(envelope_size + file_size),
+                        "User-Agent": cloudinary.get_user_agent()
+                    }
+                )
+                result = json.loads(response.data.decode("utf-8"))
+                if "error" in result:
+                    raise Exception(result["error"].get("message", result["error"]))
+            storage_upload_bytes.labels("cloudinary").inc(file_size)
+            
             # 返回公開 URL（優先使用 secure_url）
             return result.get("secure_url") or result.get("url")
+        except FileTooLargeError:
+            raise
         except Exception as e:
             raise Exception(f"上傳檔案到 Cloudinary 失敗: {str(e)}")
     
-    async def upload_file(self, file_content: bytes, public_id: str, content_type: str) -> str:
+    def _signed_upload_params(self, options: dict) -> dict:
+        """簽署 Upload API 參數（含時間戳記，Cloudinary 只接受 1 小時內簽署的參數）"""
+        if settings.image_eager_variants:
+            # 上傳後由 Cloudinary 在背景產生衍生圖，第一次瀏覽不必等待即時轉換
+            options = {**options, "eager": self._variant_transformations(), "eager_async": True}
+        params = cloudinary.utils.build_upload_params(**options)
+        return cloudinary.utils.sign_request(cloudinary.utils.cleanup_params(params), {})
+
+    def create_direct_upload(self, public_id: str, expires_at: int) -> dict:
+        """
+        客戶端直接上傳到 Cloudinary 的簽章參數
+
+        public_id 與允許的格式都簽進參數，客戶端無法改成其他路徑或上傳非圖片檔案；
+        不允許覆寫，同一組參數不能拿來取代已上傳的檔案。
+        Cloudinary 的簽章在 timestamp 之後約 1 小時內都有效，到期時間另外簽進 context，
+        finalize 時以檔案的建立時間檢查
+        """
+        if not self.configured:
+            raise Exception("Cloudinary 未配置，請設定環境變數")
+        params = self._signed_upload_params({
+            "public_id": public_id,
+            "overwrite": False,
+            "allowed_formats": list(DIRECT_UPLOAD_FORMATS),
+            "context": {DIRECT_UPLOAD_EXPIRES_CONTEXT: expires_at}
+        })
+        return {"upload_url": cloudinary.utils.cloudinary_api_url("upload", resource_type="image"), "fields": params}
+
+    async def verify_direct_upload(self, result: dict) -> Optional[dict]:
+        """
+        以 Cloudinary 回應的簽章（public_id + version）確認檔案確實由 Cloudinary 收下
+
+        簽章不包含大小、格式與寬高，這些資訊改由 Admin API 向 Cloudinary 查詢，不採用客戶端送來的值；
+        超過上傳參數到期時間才上傳的檔案會被刪除並視為驗證失敗
+        """
+        if not self.configured:
+            return None
+        try:
+            public_id, version, signature = result["public_id"], result["version"], result["signature"]
+            if not cloudinary.utils.verify_api_response_signature(public_id, version, signature):
+                return None
+        except (KeyError, TypeError, ValueError):
+            return None
+
+        def _resource_sync():
+            with track_storage("cloudinary", "resource"):
+                return cloudinary.api.resource(public_id, resource_type="image")
+
+        try:
+            resource = await asyncio.to_thread(_resource_sync)
+        except cloudinary.exceptions.NotFound:
+            return None
+        if str(resource.get("version")) != str(version):
+            return None
+
+        try:
+            expires_at = int(resource.get("context", {}).get("custom", {})[DIRECT_UPLOAD_EXPIRES_CONTEXT])
+            created_at = datetime.strptime(resource["created_at"], "%Y-%m-%dT%H:%M:%SZ")
+        except (KeyError, TypeError, ValueError):
+            expires_at, created_at = None, None
+        if expires_at is None or created_at > datetime.utcfromtimestamp(expires_at):
+            print(f"⚠️  直接上傳的檔案 {public_id} 在上傳參數過期後才上傳，已刪除")
+            await self.delete_file(public_id)
+            return None
+
+        return {
+            "public_id": public_id,
+            "url": resource.get("secure_url") or self.get_file_url(public_id),
+            "file_size": int(resource["bytes"]),
+            "mime_type": DIRECT_UPLOAD_FORMATS.get(resource.get("format"), f"image/{resource.get('format')}"),
+            "width": resource.get("width"),
+            "height": resource.get("height"),
+        }
+
+    async def upload_file(self, file_obj: BinaryIO, public_id: str, content_type: str,
+                          max_size: Optional[int] = None) -> str:
         """
         非同步上傳檔案到 Cloudinary
         
-        使用 asyncio.to_thread() 將同步的 Cloudinary 上傳放到執行緒池中執行
-        這樣可以讓多個上傳任務真正並發執行
+        將同步的 Cloudinary 上傳放到上傳排程器專用的執行緒池中執行
+        這樣可以讓多個上傳任務真正並發執行，也不會佔滿預設執行緒池
+        
+        file_obj 是可讀取的檔案物件（例如 UploadFile.file），會被逐塊串流上傳，
+        不會整個讀進記憶體
         """
         # 將同步的 Cloudinary 上傳放到執行緒池中執行
         # 這樣不會阻塞事件循環，多個上傳可以真正並發
-        return await asyncio.to_thread(
-            self._upload_file_sync,
-            file_content,
-            public_id,
-            content_type
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            upload_scheduler.executor,
+            functools.partial(self._upload_file_sync, file_obj, public_id, content_type, max_size)
         )
     
     async def delete_file(self, public_id: str) -> bool:
@@ -80,7 +236,8 @@ class CloudinaryService:
         try:
             # 將同步的刪除操作放到執行緒池中執行
             def _delete_sync():
-                result = cloudinary.uploader.destroy(public_id, resource_type="image")
+                with track_storage("cloudinary", "delete"):
+                    result = cloudinary.uploader.destroy(public_id, resource_type="image")
                 return result.get("result") == "ok"
             
             return await asyncio.to_thread(_delete_sync)
@@ -88,11 +245,114 @@ class CloudinaryService:
             print(f"刪除 Cloudinary 檔案失敗: {str(e)}")
             return False
     
+    async def delete_files(self, public_ids: Iterable[str]) -> int:
+        """
+        批次刪除檔案（Admin API delete_resources，每次最多 100 個）
+
+        回傳成功刪除的數量；某一批失敗不影響其他批次，全部處理完後以 StorageDeleteError
+        回報失敗的 public_id（回應中不是 deleted / not_found 的也算失敗）
+        """
+        public_ids = list(public_ids)
+        if not self.configured:
+            print("⚠️  Cloudinary 未配置，無法刪除檔案")
+            raise StorageDeleteError(public_ids, 0)
+        
+        def _delete_batch_sync(batch):
+            with track_storage("cloudinary", "delete_batch"):
+                result = cloudinary.api.delete_resources(batch, resource_type="image")
+            return result.get("deleted", {})
+        
+        deleted = 0
+        failed = []
+        for start in range(0, len(public_ids), DELETE_BATCH_SIZE):
+            batch = public_ids[start:start + DELETE_BATCH_SIZE]
+            try:
+                statuses = await asyncio.to_thread(_delete_batch_sync, batch)
+            except Exception as e:
+                print(f"批次刪除 Cloudinary 檔案失敗: {str(e)}")
+                failed.extend(batch)
+                continue
+            deleted += sum(1 for public_id in batch if statuses.get(public_id) == "deleted")
+            failed.extend(public_id for public_id in batch if statuses.get(public_id) not in ("deleted", "not_found"))
+        if failed:
+            raise StorageDeleteError(failed, deleted)
+        return deleted
+    
     def get_file_url(self, public_id: str) -> str:
         """取得檔案 URL（使用 public_id）"""
         if not self.configured:
             return ""
         return cloudinary.CloudinaryImage(public_id).build_url()
+    
+    async def list_files(self, prefix: str, cursor: Optional[str] = None,
+                         limit: int = LIST_PAGE_SIZE) -> Tuple[List[dict], Optional[str]]:
+        """以 Search API 列出資料夾（含子資料夾）中的圖片，依 public_id 排序"""
+        if not self.configured:
+            raise Exception("Cloudinary 未配置，請設定環境變數")
+        
+        def _list_sync():
+            search = (
+                cloudinary.search.Search()
+                .expression(f"resource_type:image AND folder:{prefix.rstrip('/')}/*")
+                .sort_by("public_id", "asc")
+                .max_results(min(limit, LIST_PAGE_SIZE))
+            )
+            if cursor:
+                search = search.next_cursor(cursor)
+            with track_storage("cloudinary", "list"):
+                try:
+                    return search.execute()
+                except cloudinary.exceptions.BadRequest as e:
+                    if cursor:
+                        raise InvalidListCursorError(str(e))
+                    raise
+        
+        result = await asyncio.to_thread(_list_sync)
+        files = [
+            {
+                "public_id": resource["public_id"],
+                "bytes": resource.get("bytes", 0),
+                "mime_type": DIRECT_UPLOAD_FORMATS.get(resource.get("format"), f"image/{resource.get('format')}"),
+                "width": resource.get("width"),
+                "height": resource.get("height"),
+                "created_at": datetime.strptime(resource["created_at"], "%Y-%m-%dT%H:%M:%SZ"),
+            }
+            for resource in result.get("resources", [])
+        ]
+        return files, result.get("next_cursor")
+    
+    async def read_file(self, public_id: str) -> bytes:
+        """下載原始檔案"""
+        if not self.configured:
+            raise Exception("Cloudinary 未配置，請設定環境變數")
+        
+        def _read_sync():
+            with track_storage("cloudinary", "read"):
+                response = self._http.request("GET", cloudinary.utils.cloudinary_url(public_id, secure=True)[0])
+                if response.status != 200:
+                    raise Exception(f"下載 Cloudinary 檔案失敗: HTTP {response.status}")
+            return response.data
+        
+        return await asyncio.to_thread(_read_sync)
+    
+    @staticmethod
+    def _transformation(width: int, fmt: str) -> dict:
+        """衍生圖的轉換參數（eager 與 URL 使用相同參數，才會對應到同一個衍生圖）"""
+        return {"width": width, "crop": "limit", "quality": "auto", "fetch_format": fmt}
+    
+    def _variant_transformations(self) -> List[dict]:
+        return [
+            self._transformation(width, fmt)
+            for fmt in settings.image_variant_formats
+            for width in settings.image_variant_widths
+        ]
+    
+    def variant_url(self, public_id: str, width: int, fmt: str) -> Optional[str]:
+        """Cloudinary 轉換 URL（最大寬度 width、自動品質、指定格式）"""
+        if not self.configured:
+            return None
+        url, _ = cloudinary.utils.cloudinary_url(public_id, secure=True, **self._transformation(width, fmt))
+        return url
 
 # 建立全域實例
 cloudinary_service = CloudinaryService()
@@ -0,0 +1,103 @@
+from app.services.storage import storage_service
+from app.services.storage_backend import UPLOAD_CHUNK_SIZE
+from app.services.upload_scheduler import upload_scheduler
+from collections import Counter
+from datetime import datetime
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+from typing import BinaryIO, List, Optional, Tuple
+import asyncio
+import hashlib
+
+def _sha256_sync(file_obj: BinaryIO) -> str:
+    """逐塊讀取暫存檔計算 SHA-256（不會整個讀進記憶體），讀完後倒回開頭"""
+    file_obj.seek(0)
+    digest = hashlib.sha256()
+    while True:
+        chunk = file_obj.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        digest.update(chunk)
+    file_obj.seek(0)
+    return digest.hexdigest()
+
+async def compute_sha256(file_obj: BinaryIO) -> str:
+    """在上傳執行緒池中計算檔案的 SHA-256"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(upload_scheduler.executor, _sha256_sync, file_obj)
+
+async def acquire_asset(db, content_hash: str) -> Optional[dict]:
+    """
+    相同內容的檔案已經在儲存空間中時，增加引用次數並回傳 asset 記錄
+
+    assets collection：_id 為內容的 SHA-256，記錄共用的 s3_key / s3_url 與 ref_count
+    """
+    return await db.assets.find_one_and_update(
+        {"_id": content_hash},
+        {"$inc": {"ref_count": 1}}
+    )
+
+async def register_asset(db, content_hash: str, s3_key: str, s3_url: str) -> Tuple[str, str]:
+    """
+    登記剛上傳的檔案，回傳實際要使用的 (s3_key, s3_url)
+
+    兩個請求同時上傳相同內容時，只有一個能登記成功；
+    另一個改用已登記的檔案，並刪除自己剛上傳的副本
+    """
+    try:
+        await db.assets.insert_one({
+            "_id": content_hash,
+            "s3_key": s3_key,
+            "s3_url": s3_url,
+            "ref_count": 1,
+            "created_at": datetime.utcnow()
+        })
+        return s3_key, s3_url
+    except DuplicateKeyError:
+        asset = await acquire_asset(db, content_hash)
+        if asset is None:
+            # 對方剛好又被刪除了，重新登記自己的檔案
+            return await register_asset(db, content_hash, s3_key, s3_url)
+        await storage_service.delete_file(s3_key)
+        return asset["s3_key"], asset["s3_url"]
+
+async def release_assets(db, images: List[dict]) -> List[str]:
+    """
+    刪除圖片記錄前呼叫：減少引用次數，回傳可以從儲存空間刪除的 s3_key
+
+    - 沒有 content_hash 或沒有 asset 記錄的圖片（未共用）：直接刪除
+    - 有 asset 記錄但 s3_key 不是共用檔案的圖片（DEDUP_SCOPE=star 時上傳的自己的檔案）：直接刪除，不影響引用次數
+    - 共用的檔案：引用次數歸零才刪除
+    """
+    candidates = {img["content_hash"] for img in images if img.get("content_hash")}
+    asset_keys = {}
+    if candidates:
+        cursor = db.assets.find({"_id": {"$in": list(candidates)}}, {"_id": 1, "s3_key": 1})
+        asset_keys = {asset["_id"]: asset["s3_key"] async for asset in cursor}
+
+    hashes = Counter()
+    s3_keys = []
+    for img in images:
+        content_hash = img.get("content_hash")
+        if content_hash in asset_keys and img["s3_key"] == asset_keys[content_hash]:
+            hashes[content_hash] += 1
+        else:
+            s3_keys.append(img["s3_key"])
+    shared = set(hashes)
+    if not shared:
+        return s3_keys
+
+    await db.assets.bulk_write([
+        UpdateOne({"_id": content_hash}, {"$inc": {"ref_count": -hashes[content_hash]}})
+        for content_hash in shared
+    ], ordered=False)
+    released = await db.assets.find(
+        {"_id": {"$in": list(shared)}, "ref_count": {"$lte": 0}},
+        {"s3_key": 1}
+    ).to_list(length=None)
+    for asset in released:
+        # 只在引用次數仍為 0 時才刪除（同時間可能有新的上傳又引用了這個檔案）
+        result = await db.assets.delete_one({"_id": asset["_id"], "ref_count": {"$lte": 0}})
+        if result.deleted_count:
+            s3_keys.append(asset["s3_key"])
+    return s3_keys
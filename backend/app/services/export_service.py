@@ -0,0 +1,169 @@
+"""
+明星圖庫的 ZIP 匯出（串流）
+
+- 圖片列表從 MongoDB cursor 逐批讀取，不一次載入
+- 圖片內容由儲存後端下載，同時下載的數量（EXPORT_CONCURRENCY）與已下載、等待寫入的數量
+  （EXPORT_READ_AHEAD）都有上限，依原本的順序寫入 ZIP
+- ZIP 以不可 seek 的方式產生（data descriptor），每寫完一個檔案就把產生的位元組送出，
+  不暫存整個壓縮檔；客戶端讀得慢時送出會等待，下載也會跟著停下來
+
+圖片本身已經壓縮過，ZIP 中的檔案不再壓縮（ZIP_STORED），超過 4GB 時自動使用 ZIP64。
+隨圖庫大小增加的只有每個檔案的中央目錄資料（檔名、CRC、位置，每個檔案數百 bytes），圖片內容不會累積
+"""
+import asyncio
+import os
+import zipfile
+from datetime import datetime
+from typing import AsyncIterator, List, Set
+from bson import ObjectId
+from app.config import settings
+from app.services.storage import storage_service
+
+# 匯出只需要的欄位
+EXPORT_PROJECTION = {"s3_key": 1, "filename": 1, "mime_type": 1, "uploaded_at": 1}
+
+# 檔名的副檔名與實際格式不符時（例如前處理轉成 WebP）補上正確的副檔名
+_EXTENSIONS = {
+    "image/jpeg": (".jpg", ".jpeg"),
+    "image/jpg": (".jpg", ".jpeg"),
+    "image/png": (".png",),
+    "image/gif": (".gif",),
+    "image/webp": (".webp",),
+    "image/avif": (".avif",),
+}
+
+# 有圖片下載失敗時，在 ZIP 最後加上這個檔案列出失敗的圖片
+FAILURES_FILENAME = "下載失敗的圖片.txt"
+
+class _ZipSink:
+    """
+    zipfile 的寫入目的地：收集寫入的位元組，由匯出產生器取出後送出
+
+    沒有 seek / tell，zipfile 會改用 data descriptor，不需要回頭修改 local header
+    """
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> List[bytes]:
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+def entry_name(image: dict, used: Set[str]) -> str:
+    """ZIP 中的檔名：移除路徑、補上正確的副檔名，重複的檔名加上 (2)、(3)…"""
+    name = os.path.basename((image.get("filename") or "").replace("\\", "/")).strip() or "image"
+    stem, ext = os.path.splitext(name)
+    expected = _EXTENSIONS.get(image.get("mime_type"))
+    if expected and ext.lower() not in expected:
+        stem, ext = name, expected[0]
+    candidate = f"{stem}{ext}"
+    counter = 2
+    while candidate.lower() in used:
+        candidate = f"{stem} ({counter}){ext}"
+        counter += 1
+    used.add(candidate.lower())
+    return candidate
+
+def _date_time(value) -> tuple:
+    # ZIP 的時間戳記不能早於 1980 年
+    if not isinstance(value, datetime) or value.year < 1980:
+        value = datetime(1980, 1, 1)
+    return value.timetuple()[:6]
+
+def _write_entry(zf: zipfile.ZipFile, name: str, data: bytes, uploaded_at) -> None:
+    """寫入一個檔案（在執行緒中執行，CRC 計算不佔用 event loop）"""
+    info = zipfile.ZipInfo(name, date_time=_date_time(uploaded_at))
+    info.compress_type = zipfile.ZIP_STORED
+    info.file_size = len(data)
+    with zf.open(info, "w") as dest:
+        dest.write(data)
+
+def _discard(task: asyncio.Task) -> None:
+    """取消不再需要的下載（已經失敗的取出例外，避免 "exception was never retrieved" 警告）"""
+    if not task.done():
+        task.cancel()
+    elif not task.cancelled():
+        task.exception()
+
+async def stream_star_zip(db, star_id: str, concurrency: int = None, read_ahead: int = None) -> AsyncIterator[bytes]:
+    """
+    依圖片列表的順序（最新的在前）產生 ZIP 的位元組
+
+    同時在記憶體中的圖片最多 read_ahead + 2 張（排隊中、正在放入佇列、正在寫入各一份）；
+    下載失敗的圖片略過，最後在 ZIP 中附上失敗清單
+    """
+    concurrency = max(1, concurrency or settings.export_concurrency)
+    read_ahead = max(1, read_ahead or settings.export_read_ahead)
+    semaphore = asyncio.Semaphore(concurrency)
+    # (圖片, 下載中的 task)；None 表示結束，例外表示讀取圖片列表失敗
+    pending: asyncio.Queue = asyncio.Queue(maxsize=read_ahead)
+
+    async def fetch(image: dict) -> bytes:
+        async with semaphore:
+            return await storage_service.read_file(image["s3_key"])
+
+    async def produce() -> None:
+        try:
+            cursor = db.images.find({"star_id": ObjectId(star_id)}, EXPORT_PROJECTION).sort(
+                [("uploaded_at", -1), ("_id", -1)]
+            )
+            async for image in cursor:
+                task = asyncio.create_task(fetch(image))
+                try:
+                    await pending.put((image, task))
+                except asyncio.CancelledError:
+                    task.cancel()
+                    raise
+        except Exception as e:
+            await pending.put(e)
+        else:
+            await pending.put(None)
+
+    sink = _ZipSink()
+    zf = zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED, allowZip64=True)
+    producer = asyncio.create_task(produce())
+    used: Set[str] = set()
+    failures: List[str] = []
+    exported = 0
+    try:
+        while True:
+            item = await pending.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            image, task = item
+            try:
+                data = await task
+            except Exception as e:
+                failures.append(f"{image.get('filename')} ({image['_id']}): {e}")
+                continue
+            await asyncio.to_thread(_write_entry, zf, entry_name(image, used), data, image.get("uploaded_at"))
+            del data
+            exported += 1
+            for chunk in sink.drain():
+                yield chunk
+
+        if failures:
+            print(f"⚠️  匯出明星 {star_id} 時有 {len(failures)} 張圖片下載失敗")
+            report = ("\n".join(failures) + "\n").encode("utf-8")
+            await asyncio.to_thread(_write_entry, zf, FAILURES_FILENAME, report, datetime.utcnow())
+        # 寫入中央目錄
+        await asyncio.to_thread(zf.close)
+        for chunk in sink.drain():
+            yield chunk
+        print(f"✅ 已匯出明星 {star_id} 的 {exported} 張圖片")
+    finally:
+        # 客戶端中斷或發生錯誤時停止讀取列表並取消還在下載的圖片
+        producer.cancel()
+        while not pending.empty():
+            item = pending.get_nowait()
+            if isinstance(item, tuple):
+                _discard(item[1])
@@ -0,0 +1,187 @@
+from app.services.upload_scheduler import upload_scheduler
+from PIL import Image
+from typing import BinaryIO, List, Optional, Set, Tuple
+import asyncio
+import math
+import numpy as np
+
+# blurhash 的分量數（橫 x 直）與計算用的縮圖大小
+BLURHASH_COMPONENTS = (4, 3)
+THUMBNAIL_SIZE = 32
+
+# 合併成一批的等待時間（秒）與每批最多檔案數
+BATCH_WINDOW_SECONDS = 0.005
+MAX_BATCH_SIZE = 16
+
+_BASE83 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+
+# EXIF Orientation -> 轉正需要的變換（5~8 會旋轉 90 度，顯示時寬高互換）
+_ORIENTATION_TRANSPOSES = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+def _base83(value: int, length: int) -> str:
+    return "".join(_BASE83[(value // 83 ** (length - i)) % 83] for i in range(1, length + 1))
+
+def _srgb_to_linear(pixels: np.ndarray) -> np.ndarray:
+    values = pixels.astype(np.float64) / 255
+    return np.where(values <= 0.04045, values / 12.92, ((values + 0.055) / 1.055) ** 2.4)
+
+def _linear_to_srgb(value: float) -> int:
+    value = min(max(value, 0.0), 1.0)
+    if value <= 0.0031308:
+        return int(value * 12.92 * 255 + 0.5)
+    return int((1.055 * value ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+def encode_blurhash(pixels: np.ndarray, components_x: int, components_y: int) -> str:
+    """
+    blurhash 編碼（https://blurha.sh 的演算法）
+
+    pixels 為 (高, 寬, 3) 的 uint8 RGB 陣列；以 numpy 一次計算每個分量的 DCT 係數
+    """
+    height, width = pixels.shape[:2]
+    linear = _srgb_to_linear(pixels)
+    xs = np.arange(width)
+    ys = np.arange(height)
+    factors = []
+    for j in range(components_y):
+        for i in range(components_x):
+            basis = np.cos(np.pi * j * ys / height)[:, None] * np.cos(np.pi * i * xs / width)[None, :]
+            normalisation = 1 if i == 0 and j == 0 else 2
+            factors.append(normalisation * np.tensordot(basis, linear, axes=([0, 1], [0, 1])) / (width * height))
+
+    dc, ac = factors[0], factors[1:]
+    result = _base83((components_x - 1) + (components_y - 1) * 9, 1)
+    if ac:
+        max_ac = max(float(np.abs(factor).max()) for factor in ac)
+        quantised_max = min(max(int(math.floor(max_ac * 166 - 0.5)), 0), 82)
+        max_value = (quantised_max + 1) / 166
+        result += _base83(quantised_max, 1)
+    else:
+        max_value = 1.0
+        result += _base83(0, 1)
+
+    r, g, b = (_linear_to_srgb(float(value)) for value in dc)
+    result += _base83((r << 16) + (g << 8) + b, 4)
+
+    for factor in ac:
+        quantised = [
+            min(max(int(math.floor(math.copysign(abs(value / max_value) ** 0.5, value) * 9 + 9.5)), 0), 18)
+            for value in factor
+        ]
+        result += _base83(quantised[0] * 19 * 19 + quantised[1] * 19 + quantised[2], 2)
+    return result
+
+def _dominant_color(thumbnail: Image.Image) -> str:
+    """縮圖量化成 5 色後出現最多的顏色（#rrggbb）"""
+    quantized = thumbnail.quantize(colors=5, method=Image.Quantize.MEDIANCUT)
+    palette = quantized.getpalette()
+    count, index = max(quantized.getcolors())
+    r, g, b = palette[index * 3:index * 3 + 3]
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+def _extract_sync(file_obj: BinaryIO) -> Optional[dict]:
+    """
+    讀取寬高（依 EXIF 方向）、長寬比、主色與 blurhash；無法解碼時回傳 None
+
+    JPEG 以 draft 模式直接解碼成小圖，不需要解碼完整解析度；讀完後倒回開頭
+    """
+    file_obj.seek(0)
+    try:
+        with Image.open(file_obj) as image:
+            width, height = image.size
+            transpose = _ORIENTATION_TRANSPOSES.get(image.getexif().get(0x0112))
+            if transpose in (Image.Transpose.TRANSPOSE, Image.Transpose.ROTATE_270,
+                             Image.Transpose.TRANSVERSE, Image.Transpose.ROTATE_90):
+                width, height = height, width
+            image.draft("RGB", (THUMBNAIL_SIZE * 2, THUMBNAIL_SIZE * 2))
+            thumbnail = image.convert("RGB")
+            thumbnail.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.Resampling.BILINEAR)
+            if transpose is not None:
+                thumbnail = thumbnail.transpose(transpose)
+    except Exception:
+        return None
+    finally:
+        file_obj.seek(0)
+    return {
+        "width": width,
+        "height": height,
+        "aspect_ratio": round(width / height, 4) if height else None,
+        "dominant_color": _dominant_color(thumbnail),
+        "blurhash": encode_blurhash(np.asarray(thumbnail), *BLURHASH_COMPONENTS)
+    }
+
+def _extract_batch_sync(file_objs: List[BinaryIO]) -> List[Optional[dict]]:
+    return [_extract_sync(file_obj) for file_obj in file_objs]
+
+class ImageMetadataService:
+    """
+    上傳時擷取圖片的版面資訊（寬高、長寬比、主色、blurhash），讓前端在圖片下載前就能排版
+
+    同一個請求的多個檔案會並發呼叫 extract()，BATCH_WINDOW_SECONDS 內送進來的檔案合併成一批
+    （最多 MAX_BATCH_SIZE 個），在上傳執行緒池中一次處理，減少執行緒切換的次數。
+    處理中的批次保留參照（避免 task 被回收），關閉時以 drain() 等待完成
+    """
+
+    def __init__(self):
+        self._pending: List[Tuple[BinaryIO, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def extract(self, file_obj: BinaryIO) -> Optional[dict]:
+        """擷取一個檔案的版面資訊，無法解碼時回傳 None"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((file_obj, future))
+        if len(self._pending) >= MAX_BATCH_SIZE:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(BATCH_WINDOW_SECONDS, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._run_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def drain(self, timeout: float) -> bool:
+        """等待處理中的批次完成（最多 timeout 秒），回傳是否全部完成"""
+        if self._pending:
+            self._flush()
+        if not self._tasks:
+            return True
+        _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        return not pending
+
+    async def _run_batch(self, batch: List[Tuple[BinaryIO, asyncio.Future]]) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(
+                upload_scheduler.executor, _extract_batch_sync, [file_obj for file_obj, _ in batch]
+            )
+        except asyncio.CancelledError:
+            for _, future in batch:
+                future.cancel()
+            raise
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+# 建立全域實例
+image_metadata_service = ImageMetadataService()
@@ -0,0 +1,27 @@
+"""
+記憶體內索引的跨 process 同步（世代計數器）
+
+明星搜尋索引與感知雜湊索引存在每個 worker process 的記憶體中，只有處理寫入請求的 process
+會直接更新自己的索引。每次寫入後把 MongoDB 中對應的計數器加一，其他 process 讀到的計數器
+與自己載入時不同，就重新從 MongoDB 載入。
+
+寫入 MongoDB 之後才加計數器，所以看到新計數器的 process 重新載入時一定讀得到那次寫入
+"""
+from pymongo import ReturnDocument
+
+COLLECTION = "index_generations"
+
+async def current(db, key: str) -> int:
+    """目前的世代（從未寫入過時為 0）"""
+    doc = await db[COLLECTION].find_one({"_id": key}, {"generation": 1})
+    return doc["generation"] if doc else 0
+
+async def bump(db, key: str) -> int:
+    """寫入後把世代加一，回傳新的世代"""
+    doc = await db[COLLECTION].find_one_and_update(
+        {"_id": key},
+        {"$inc": {"generation": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return doc["generation"]
@@ -0,0 +1,218 @@
+from app.config import settings
+from bson import ObjectId
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from typing import Awaitable, Callable, Dict, List, Optional
+import asyncio
+import uuid
+
+# 工作狀態
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+class JobRetryError(Exception):
+    """工作的一部分失敗但可以重試（例如儲存服務暫時無法連線）"""
+    pass
+
+class JobContext:
+    """傳給工作處理函式，用來回報進度"""
+
+    def __init__(self, db, job: dict):
+        self.db = db
+        self.job = job
+        self.job_id = job["_id"]
+
+    async def update(self, fields: dict) -> None:
+        """更新工作文件的欄位（例如 progress、files.{i}.status），同時更新心跳時間"""
+        now = datetime.utcnow()
+        await self.db.jobs.update_one(
+            {"_id": self.job_id},
+            {"$set": {**fields, "updated_at": now, "heartbeat_at": now}}
+        )
+
+JobHandler = Callable[[JobContext], Awaitable[None]]
+
+class JobService:
+    """
+    背景工作佇列
+
+    - 工作存在 MongoDB 的 jobs collection，多個 process 共用同一個佇列，
+      用 find_one_and_update 原子地認領工作，不會被重複執行
+    - 每個 process 有 JOB_WORKERS 個 worker（asyncio task）
+    - 失敗時以指數退避重試（JOB_RETRY_BASE_SECONDS * 2^(attempts-1)，最多 JOB_MAX_ATTEMPTS 次）
+    - 執行中的工作會定期更新心跳，重新啟動後心跳過期的工作會被放回佇列
+    - 工作類型由 router 以 register_handler() 登記處理函式
+    """
+
+    def __init__(self):
+        self._handlers: Dict[str, JobHandler] = {}
+        self._workers: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self.worker_id = uuid.uuid4().hex[:12]
+        self.db = None
+
+    def register_handler(self, job_type: str, handler: JobHandler) -> None:
+        self._handlers[job_type] = handler
+
+    async def enqueue(self, db, job_type: str, params: dict, extra: Optional[dict] = None) -> dict:
+        """建立工作並喚醒 worker，回傳工作文件"""
+        now = datetime.utcnow()
+        job = {
+            "type": job_type,
+            "status": JOB_QUEUED,
+            "params": params,
+            "progress": {},
+            "attempts": 0,
+            "max_attempts": settings.job_max_attempts,
+            "next_run_at": now,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+            **(extra or {})
+        }
+        result = await db.jobs.insert_one(job)
+        job["_id"] = result.inserted_id
+        self._wakeup.set()
+        return job
+
+    async def enqueue_once(self, db, job_type: str, params: dict) -> None:
+        """
+        佇列中沒有同類型的待執行 / 執行中工作時才建立（多個 worker process 同時啟動時只排入一次）
+
+        工作帶有 singleton 欄位（值為工作類型），由 jobs 的 partial unique index 保證同時只有一個；
+        工作結束（成功或不再重試的失敗）時移除這個欄位，之後可以再排入
+        """
+        if await db.jobs.find_one({"type": job_type, "status": {"$in": [JOB_QUEUED, JOB_RUNNING]}}, {"_id": 1}):
+            return
+        try:
+            await self.enqueue(db, job_type, params, extra={"singleton": job_type})
+        except DuplicateKeyError:
+            # 另一個 process 剛好同時排入
+            pass
+
+    async def get(self, db, job_id: str) -> Optional[dict]:
+        return await db.jobs.find_one({"_id": ObjectId(job_id)})
+
+    async def start(self, db) -> None:
+        """啟動 worker（在 app 啟動時呼叫）"""
+        self.db = db
+        self._stopping = False
+        await self.recover_stale_jobs()
+        self._workers = [
+            asyncio.create_task(self._worker(index))
+            for index in range(settings.job_workers)
+        ]
+        print(f"✅ 已啟動背景工作 worker（{settings.job_workers} 個）")
+
+    async def stop(self, timeout: float = 0) -> None:
+        """
+        停止 worker：不再認領新的工作，執行中的工作最多再等 timeout 秒
+
+        時間到還沒完成的工作會被中斷並放回佇列，之後由任一 process 接手
+        """
+        self._stopping = True
+        self._wakeup.set()
+        if self._workers and timeout > 0:
+            await asyncio.wait(self._workers, timeout=timeout)
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def recover_stale_jobs(self) -> int:
+        """把心跳過期的執行中工作放回佇列（process 當掉或被強制結束時留下的）"""
+        now = datetime.utcnow()
+        result = await self.db.jobs.update_many(
+            {"status": JOB_RUNNING, "heartbeat_at": {"$lt": now - timedelta(seconds=settings.job_stale_seconds)}},
+            {"$set": {"status": JOB_QUEUED, "next_run_at": now, "updated_at": now}}
+        )
+        if result.modified_count:
+            print(f"♻️  已恢復 {result.modified_count} 個中斷的背景工作")
+        return result.modified_count
+
+    async def _claim(self) -> Optional[dict]:
+        now = datetime.utcnow()
+        return await self.db.jobs.find_one_and_update(
+            {"status": JOB_QUEUED, "next_run_at": {"$lte": now}},
+            {
+                "$set": {"status": JOB_RUNNING, "locked_by": self.worker_id, "heartbeat_at": now, "updated_at": now},
+                "$inc": {"attempts": 1}
+            },
+            sort=[("next_run_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _worker(self, index: int) -> None:
+        while not self._stopping:
+            try:
+                job = await self._claim()
+            except Exception as e:
+                print(f"背景工作認領失敗: {str(e)}")
+                job = None
+            if job is None:
+                if index == 0:
+                    await self.recover_stale_jobs()
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=settings.job_poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    async def _heartbeat(self, job_id) -> None:
+        interval = max(1, settings.job_stale_seconds / 4)
+        while True:
+            await asyncio.sleep(interval)
+            await self.db.jobs.update_one({"_id": job_id}, {"$set": {"heartbeat_at": datetime.utcnow()}})
+
+    async def _run(self, job: dict) -> None:
+        handler = self._handlers.get(job["type"])
+        context = JobContext(self.db, job)
+        heartbeat = asyncio.create_task(self._heartbeat(job["_id"]))
+        try:
+            if handler is None:
+                raise Exception(f"未知的工作類型: {job['type']}")
+            await handler(context)
+        except asyncio.CancelledError:
+            # 服務關閉：放回佇列，不計入重試次數
+            now = datetime.utcnow()
+            await self.db.jobs.update_one(
+                {"_id": job["_id"]},
+                {"$set": {"status": JOB_QUEUED, "next_run_at": now, "updated_at": now}, "$inc": {"attempts": -1}}
+            )
+            raise
+        except Exception as e:
+            await self._fail(job, e)
+        else:
+            now = datetime.utcnow()
+            await self.db.jobs.update_one(
+                {"_id": job["_id"]},
+                {
+                    "$set": {"status": JOB_SUCCEEDED, "error": None, "finished_at": now, "updated_at": now},
+                    "$unset": {"singleton": ""}
+                }
+            )
+        finally:
+            heartbeat.cancel()
+
+    async def _fail(self, job: dict, error: Exception) -> None:
+        """失敗：還有重試次數就以指數退避放回佇列，否則標記為失敗"""
+        now = datetime.utcnow()
+        attempts = job["attempts"]
+        if attempts < job.get("max_attempts", settings.job_max_attempts):
+            delay = min(settings.job_retry_base_seconds * 2 ** (attempts - 1), settings.job_retry_max_seconds)
+            update = {"status": JOB_QUEUED, "next_run_at": now + timedelta(seconds=delay)}
+        else:
+            update = {"status": JOB_FAILED, "finished_at": now}
+        update = {"$set": {**update, "error": str(error), "updated_at": now}}
+        if update["$set"]["status"] == JOB_FAILED:
+            update["$unset"] = {"singleton": ""}
+        await self.db.jobs.update_one({"_id": job["_id"]}, update)
+
+# 建立全域實例
+job_service = JobService()
@@ -0,0 +1,321 @@
+from app.config import settings
+from app.services.storage_backend import StorageBackend, FileTooLargeError, StorageDeleteError, UPLOAD_CHUNK_SIZE
+from app.services.upload_scheduler import upload_scheduler
+from pathlib import Path
+from PIL import Image, features
+from datetime import datetime
+from typing import BinaryIO, Iterable, List, Optional, Tuple
+import asyncio
+import bisect
+import functools
+import glob
+import hashlib
+import hmac
+import os
+import re
+import secrets
+import tempfile
+import time
+
+# 依檔案開頭的 magic bytes 判斷圖片類型（本機儲存不另外記錄 content type）
+_MAGIC_TYPES = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+]
+
+# 衍生圖的編碼參數（本機後端上傳時用 Pillow 產生）
+_VARIANT_SAVE_OPTIONS = {
+    "webp": {"format": "WEBP", "quality": 80, "method": 4},
+    "avif": {"format": "AVIF", "quality": 60, "speed": 8},
+}
+
+# 衍生圖（{public_id}__w{寬度}.{格式}）與上傳中的暫存檔不是原始檔案，列出檔案時略過
+_NOT_ORIGINAL = re.compile(r"__w\d+\.[A-Za-z0-9]+$|(^|/)\.upload-[^/]*$")
+
+class LocalStorageService(StorageBackend):
+    """
+    本機檔案系統儲存後端
+
+    檔案存放在 LOCAL_STORAGE_DIR/{public_id}，由 /api/files/{public_id} 提供下載
+    （見 app/routers/files.py）。適合自架部署與離線壓力測試
+
+    衍生圖在上傳時產生，存成 {public_id}__w{寬度}.{格式}
+
+    直接上傳模擬 Cloudinary 的 signed upload：客戶端帶簽章 POST 到 /api/files/direct-upload，
+    回應帶有結果簽章，finalize 時由 verify_direct_upload 驗證（HMAC-SHA256）
+    """
+
+    supports_direct_upload = True
+    supports_listing = True
+
+    def __init__(self, root: str, public_base_url: str):
+        self.root = Path(root).resolve()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.public_base_url = public_base_url.rstrip("/")
+        self.configured = True
+        self._signing_key = (settings.direct_upload_secret or secrets.token_hex(32)).encode()
+
+    def path_for(self, public_id: str) -> Path:
+        """public_id 對應的檔案路徑（不允許跳出儲存目錄）"""
+        path = (self.root / public_id).resolve()
+        if self.root not in path.parents:
+            raise ValueError(f"無效的 public_id: {public_id}")
+        return path
+
+    def _upload_file_sync(self, file_obj: BinaryIO, public_id: str, max_size: Optional[int]) -> str:
+        """逐塊複製到暫存檔，完成後再原子性地 rename，讀取端不會看到寫到一半的檔案"""
+        path = self.path_for(public_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        file_obj.seek(0)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".upload-")
+        try:
+            written = 0
+            with os.fdopen(fd, "wb") as out:
+                while True:
+                    chunk = file_obj.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    written += len(chunk)
+                    if max_size is not None and written > max_size:
+                        raise FileTooLargeError(f"檔案超過 {max_size} bytes 限制")
+                    out.write(chunk)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        if settings.image_eager_variants:
+            self._generate_variants_sync(public_id)
+        return self.get_file_url(public_id)
+
+    @staticmethod
+    def variant_public_id(public_id: str, width: int, fmt: str) -> str:
+        return f"{public_id}__w{width}.{fmt}"
+
+    def _generate_variants_sync(self, public_id: str) -> None:
+        """
+        產生所有衍生圖（縮小到不超過設定寬度，不放大）
+
+        失敗（例如不是 Pillow 能解碼的圖片）只記錄錯誤，原始檔案仍然可以使用
+        """
+        formats = [
+            fmt for fmt in settings.image_variant_formats
+            if fmt in _VARIANT_SAVE_OPTIONS and features.check(fmt)
+        ]
+        if not formats:
+            return
+        try:
+            with Image.open(self.path_for(public_id)) as image:
+                image.load()
+                if image.mode not in ("RGB", "RGBA"):
+                    image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+                for width in sorted(settings.image_variant_widths):
+                    resized = image
+                    if image.width > width:
+                        resized = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+                    for fmt in formats:
+                        path = self.path_for(self.variant_public_id(public_id, width, fmt))
+                        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".variant-")
+                        try:
+                            with os.fdopen(fd, "wb") as out:
+                                resized.save(out, **_VARIANT_SAVE_OPTIONS[fmt])
+                            os.replace(tmp_path, path)
+                        except BaseException:
+                            if os.path.exists(tmp_path):
+                                os.unlink(tmp_path)
+                            raise
+        except Exception as e:
+            print(f"產生衍生圖失敗（{public_id}）: {str(e)}")
+
+    async def upload_file(self, file_obj: BinaryIO, public_id: str, content_type: str,
+                          max_size: Optional[int] = None) -> str:
+        """在上傳排程器的執行緒池中寫入檔案"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            upload_scheduler.executor,
+            functools.partial(self._upload_file_sync, file_obj, public_id, max_size)
+        )
+
+    def _delete_file_sync(self, public_id: str) -> bool:
+        """刪除檔案與衍生圖，檔案不存在時回傳 False，其他錯誤拋出例外"""
+        path = self.path_for(public_id)
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            return False
+        for variant in path.parent.glob(f"{glob.escape(path.name)}__w*"):
+            variant.unlink(True)
+        return True
+
+    async def delete_file(self, public_id: str) -> bool:
+        """刪除本機檔案（連同衍生圖）"""
+        try:
+            return await asyncio.to_thread(self._delete_file_sync, public_id)
+        except ValueError:
+            return False
+        except Exception as e:
+            print(f"刪除本機檔案失敗: {str(e)}")
+            return False
+
+    async def delete_files(self, public_ids: Iterable[str]) -> int:
+        """逐一刪除，全部處理完後以 StorageDeleteError 回報刪除失敗的檔案（不存在的檔案不算失敗）"""
+        deleted = 0
+        failed = []
+        for public_id in public_ids:
+            try:
+                deleted += await asyncio.to_thread(self._delete_file_sync, public_id)
+            except ValueError:
+                continue
+            except Exception as e:
+                print(f"刪除本機檔案失敗: {str(e)}")
+                failed.append(public_id)
+        if failed:
+            raise StorageDeleteError(failed, deleted)
+        return deleted
+
+    def _sign(self, *parts) -> str:
+        message = "\n".join(str(part) for part in parts).encode()
+        return hmac.new(self._signing_key, message, hashlib.sha256).hexdigest()
+
+    def create_direct_upload(self, public_id: str, expires_at: int) -> dict:
+        return {
+            "upload_url": f"{self.public_base_url}/api/files/direct-upload",
+            "fields": {
+                "public_id": public_id,
+                "expires_at": str(expires_at),
+                "signature": self._sign("upload", public_id, expires_at)
+            }
+        }
+
+    def verify_upload_params(self, public_id: str, expires_at: int, signature: str) -> bool:
+        """確認直接上傳的參數是由 create_direct_upload 簽署且尚未過期"""
+        expected = self._sign("upload", public_id, expires_at)
+        return hmac.compare_digest(expected, signature) and time.time() <= expires_at
+
+    @staticmethod
+    def _describe_sync(path: Path) -> dict:
+        """檔案大小、MIME type 與寬高（不是 Pillow 能解碼的圖片時拋出例外）"""
+        with Image.open(path) as image:
+            width, height = image.size
+        return {
+            "bytes": path.stat().st_size,
+            "mime_type": LocalStorageService.content_type_for(path),
+            "width": width,
+            "height": height,
+        }
+
+    async def receive_direct_upload(self, file_obj: BinaryIO, public_id: str, max_size: Optional[int]) -> dict:
+        """
+        儲存直接上傳的檔案，回傳與 Cloudinary 類似的結果（帶結果簽章）
+
+        與 Cloudinary 的 overwrite=false 相同，同一組參數不能覆寫已上傳的檔案（拋出 FileExistsError）；
+        不是圖片的檔案會被刪除並拋出 ValueError
+        """
+        if self.path_for(public_id).exists():
+            raise FileExistsError(f"檔案已存在: {public_id}")
+        url = await self.upload_file(file_obj, public_id, "application/octet-stream", max_size)
+        try:
+            info = await asyncio.to_thread(self._describe_sync, self.path_for(public_id))
+        except Exception:
+            await self.delete_file(public_id)
+            raise ValueError("不是可以辨識的圖片檔案")
+        signature = self._sign("result", public_id, info["bytes"], info["mime_type"], info["width"], info["height"])
+        return {"public_id": public_id, "url": url, **info, "signature": signature}
+
+    async def verify_direct_upload(self, result: dict) -> Optional[dict]:
+        # 結果中的大小、類型與寬高由 receive_direct_upload 簽署；到期時間在上傳時已由 verify_upload_params 檢查
+        try:
+            public_id = result["public_id"]
+            expected = self._sign(
+                "result", public_id, result["bytes"], result["mime_type"], result["width"], result["height"]
+            )
+            if not hmac.compare_digest(expected, str(result["signature"])) or not self.path_for(public_id).exists():
+                return None
+        except (KeyError, ValueError):
+            return None
+        return {
+            "public_id": public_id,
+            "url": self.get_file_url(public_id),
+            "file_size": int(result["bytes"]),
+            "mime_type": result["mime_type"],
+            "width": result["width"],
+            "height": result["height"],
+        }
+
+    def _list_entry(self, public_id: str) -> dict:
+        path = self.path_for(public_id)
+        stat_result = path.stat()
+        try:
+            with Image.open(path) as image:
+                width, height = image.size
+        except Exception:
+            width = height = None
+        return {
+            "public_id": public_id,
+            "bytes": stat_result.st_size,
+            "mime_type": self.content_type_for(path),
+            "width": width,
+            "height": height,
+            "created_at": datetime.utcfromtimestamp(stat_result.st_mtime),
+        }
+
+    def _list_files_sync(self, prefix: str, start_after: Optional[str], limit: int) -> Tuple[List[dict], Optional[str]]:
+        # 本機後端每頁都重新掃描目錄（只用於自架與測試），cursor 就是上一頁最後一個 public_id
+        base = self.root / prefix
+        if not base.is_dir():
+            return [], None
+        public_ids = sorted(
+            public_id
+            for public_id in (path.relative_to(self.root).as_posix() for path in base.rglob("*") if path.is_file())
+            if not _NOT_ORIGINAL.search(public_id)
+        )
+        start = bisect.bisect_right(public_ids, start_after) if start_after else 0
+        page = public_ids[start:start + limit]
+        next_cursor = page[-1] if start + limit < len(public_ids) else None
+        return [self._list_entry(public_id) for public_id in page], next_cursor
+
+    async def list_files(self, prefix: str, cursor: Optional[str] = None,
+                         limit: int = 500) -> Tuple[List[dict], Optional[str]]:
+        return await asyncio.to_thread(self._list_files_sync, prefix, cursor, limit)
+
+    def get_file_url(self, public_id: str) -> str:
+        return f"{self.public_base_url}/api/files/{public_id}"
+
+    async def read_file(self, public_id: str) -> bytes:
+        return await asyncio.to_thread(self.path_for(public_id).read_bytes)
+
+    def variant_url(self, public_id: str, width: int, fmt: str) -> Optional[str]:
+        """已產生的衍生圖 URL（沒有產生的格式或尺寸回傳 None）"""
+        variant_id = self.variant_public_id(public_id, width, fmt)
+        try:
+            if not self.path_for(variant_id).exists():
+                return None
+        except ValueError:
+            return None
+        return self.get_file_url(variant_id)
+
+    @staticmethod
+    def content_type_for(path: Path) -> str:
+        with open(path, "rb") as f:
+            head = f.read(16)
+        for magic, content_type in _MAGIC_TYPES:
+            if head.startswith(magic):
+                return content_type
+        if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+            return "image/webp"
+        if head[4:12] == b"ftypavif":
+            return "image/avif"
+        return "application/octet-stream"
+
+    @staticmethod
+    def etag_for(public_id: str, stat_result: os.stat_result) -> str:
+        """
+        強 ETag
+
+        每次上傳都會產生新的 public_id（含 uuid），檔案寫入後不會再被修改，
+        所以 public_id + 大小 + 修改時間足以唯一識別內容
+        """
+        base = f"{public_id}:{stat_result.st_size}:{stat_result.st_mtime_ns}"
+        return f'"{hashlib.sha1(base.encode()).hexdigest()}"'
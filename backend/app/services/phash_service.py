@@ -0,0 +1,173 @@
+from app.services import index_generation_service
+from app.services.upload_scheduler import upload_scheduler
+from bson import ObjectId
+from typing import BinaryIO, Dict, List, Optional, Tuple
+import asyncio
+import numpy as np
+from PIL import Image
+
+# dHash 的寬高：9x8 灰階縮圖，比較左右相鄰像素得到 64 bits
+DHASH_SIZE = 8
+
+# 每個 byte 的 bit 數（numpy < 2.0 沒有 bitwise_count 時使用）
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+def _popcount(values: np.ndarray) -> np.ndarray:
+    """計算每個 uint64 的 bit 數"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    return _POPCOUNT_TABLE[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+def _dhash_sync(file_obj: BinaryIO) -> Optional[int]:
+    """計算 64-bit dHash，無法解碼的圖片回傳 None；讀完後倒回開頭"""
+    file_obj.seek(0)
+    try:
+        with Image.open(file_obj) as image:
+            image.draft("L", (DHASH_SIZE * 4, DHASH_SIZE * 4))  # JPEG 可以直接用縮小的解碼
+            small = image.convert("L").resize((DHASH_SIZE + 1, DHASH_SIZE), Image.Resampling.LANCZOS)
+            pixels = np.asarray(small, dtype=np.int16)
+    except Exception:
+        return None
+    finally:
+        file_obj.seek(0)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int(np.packbits(bits).view(">u8")[0])
+
+async def compute_phash(file_obj: BinaryIO) -> Optional[str]:
+    """在上傳執行緒池中計算感知雜湊，回傳 16 位十六進位字串（存進 MongoDB 用）"""
+    loop = asyncio.get_running_loop()
+    value = await loop.run_in_executor(upload_scheduler.executor, _dhash_sync, file_obj)
+    return None if value is None else f"{value:016x}"
+
+class _StarHashes:
+    """單一明星的感知雜湊：連續的 uint64 陣列 + image_id 對照"""
+
+    def __init__(self):
+        self.hashes = np.empty(1024, dtype=np.uint64)
+        self.image_ids: List[str] = []
+        self.positions: Dict[str, int] = {}
+
+    def add(self, image_id: str, value: int) -> None:
+        if image_id in self.positions:
+            self.hashes[self.positions[image_id]] = value
+            return
+        size = len(self.image_ids)
+        if size == len(self.hashes):
+            self.hashes = np.concatenate([self.hashes, np.empty(size, dtype=np.uint64)])
+        self.hashes[size] = value
+        self.image_ids.append(image_id)
+        self.positions[image_id] = size
+
+    def remove(self, image_id: str) -> None:
+        """用最後一筆填補被刪除的位置（O(1)）"""
+        position = self.positions.pop(image_id, None)
+        if position is None:
+            return
+        last = len(self.image_ids) - 1
+        if position != last:
+            moved = self.image_ids[last]
+            self.hashes[position] = self.hashes[last]
+            self.image_ids[position] = moved
+            self.positions[moved] = position
+        self.image_ids.pop()
+
+    def search(self, value: int, max_distance: int, limit: int, exclude: Optional[str]) -> List[Tuple[str, int]]:
+        """向量化計算 Hamming 距離，回傳距離最近的 (image_id, distance)"""
+        size = len(self.image_ids)
+        if size == 0:
+            return []
+        distances = _popcount(self.hashes[:size] ^ np.uint64(value))
+        candidates = np.flatnonzero(distances <= max_distance)
+        if len(candidates) > limit + 1:
+            nearest = np.argpartition(distances[candidates], limit)[:limit + 1]
+            candidates = candidates[nearest]
+        candidates = candidates[np.argsort(distances[candidates], kind="stable")]
+        results = []
+        for position in candidates:
+            image_id = self.image_ids[position]
+            if image_id == exclude:
+                continue
+            results.append((image_id, int(distances[position])))
+            if len(results) >= limit:
+                break
+        return results
+
+def _generation_key(star_id: str) -> str:
+    """index_generations 中某個明星的感知雜湊世代計數器"""
+    return f"phash:{star_id}"
+
+class PhashService:
+    """
+    每個明星一份記憶體內的感知雜湊索引
+
+    第一次查詢某個明星時才從 MongoDB 載入，之後由上傳與刪除同步更新。
+    多 worker 模式下每次查詢都先確認該明星的世代計數器，其他 process 新增或刪除過圖片時重新載入，
+    近似重複的判斷不會漏掉其他 worker 上傳的圖片
+    """
+
+    def __init__(self):
+        self._stars: Dict[str, _StarHashes] = {}
+        # star_id -> 已載入索引對應的世代
+        self._generations: Dict[str, int] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def _get(self, db, star_id) -> _StarHashes:
+        star_id = str(star_id)
+        generation = await index_generation_service.current(db, _generation_key(star_id))
+        if star_id in self._stars and self._generations.get(star_id) == generation:
+            return self._stars[star_id]
+        lock = self._locks.setdefault(star_id, asyncio.Lock())
+        async with lock:
+            if star_id not in self._stars or self._generations.get(star_id) != generation:
+                hashes = _StarHashes()
+                cursor = db.images.find(
+                    {"star_id": ObjectId(star_id), "phash": {"$exists": True}},
+                    {"phash": 1}
+                )
+                async for image in cursor:
+                    hashes.add(str(image["_id"]), int(image["phash"], 16))
+                self._stars[star_id] = hashes
+                self._generations[star_id] = generation
+        self._locks.pop(star_id, None)
+        return self._stars[star_id]
+
+    async def _publish(self, db, star_id: str) -> None:
+        """
+        本 process 更新索引後把世代加一
+
+        世代剛好只加一表示中間沒有其他 process 的寫入，自己的索引仍是最新的；否則下次查詢時重新載入
+        """
+        generation = await index_generation_service.bump(db, _generation_key(star_id))
+        if star_id in self._stars and self._generations.get(star_id) == generation - 1:
+            self._generations[star_id] = generation
+        else:
+            self._generations.pop(star_id, None)
+
+    async def add(self, db, star_id, image_id, phash: Optional[str]) -> None:
+        """新增圖片（該明星的索引尚未載入時只更新世代，之後載入會從 MongoDB 讀到）"""
+        if not phash:
+            return
+        hashes = self._stars.get(str(star_id))
+        if hashes is not None:
+            hashes.add(str(image_id), int(phash, 16))
+        await self._publish(db, str(star_id))
+
+    async def remove(self, db, star_id, image_id) -> None:
+        hashes = self._stars.get(str(star_id))
+        if hashes is not None:
+            hashes.remove(str(image_id))
+        await self._publish(db, str(star_id))
+
+    async def drop_star(self, db, star_id) -> None:
+        self._stars.pop(str(star_id), None)
+        self._generations.pop(str(star_id), None)
+        await db[index_generation_service.COLLECTION].delete_one({"_id": _generation_key(str(star_id))})
+
+    async def find_similar(self, db, star_id, phash: str, max_distance: int, limit: int,
+                           exclude: Optional[str] = None) -> List[Tuple[str, int]]:
+        """找出該明星中與 phash 的 Hamming 距離 <= max_distance 的圖片"""
+        hashes = await self._get(db, star_id)
+        return hashes.search(int(phash, 16), max_distance, limit, exclude)
+
+# 建立全域實例
+phash_service = PhashService()
@@ -0,0 +1,221 @@
+from app.config import settings
+from app.services.upload_scheduler import upload_scheduler
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from PIL import Image, ImageOps
+from typing import BinaryIO, Dict, Optional, Union
+import asyncio
+import io
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+# 重新編碼的格式：設定值 -> (Pillow 格式, MIME type, 編碼參數)
+OUTPUT_FORMATS = {
+    # method 0：編碼速度約為預設（4）的 3 倍，檔案大小差異很小
+    "webp": ("WEBP", "image/webp", {"method": 0}),
+    "jpeg": ("JPEG", "image/jpeg", {"optimize": True, "progressive": True}),
+}
+
+# 不處理的類型（GIF 可能是動畫，重新編碼會只剩第一格）；
+# 動畫 WebP / APNG 要解碼後才知道，由 _preprocess_sync 依 is_animated 略過
+SKIP_TYPES = {"image/gif"}
+
+# 記憶體中的上傳檔案（還沒寫到磁碟的 SpooledTemporaryFile）不超過這個大小時直接傳位元組給子 process，
+# 超過時逐塊複製到暫存檔、只傳路徑，不會把整個檔案讀進記憶體
+INLINE_MAX_BYTES = 1024 * 1024
+COPY_CHUNK_SIZE = 1024 * 1024
+
+@dataclass
+class PreprocessResult:
+    """前處理結果；changed 為 False 時沿用原始檔案"""
+    changed: bool
+    data: bytes = b""
+    content_type: str = ""
+    width: int = 0
+    height: int = 0
+    timings: Dict[str, float] = field(default_factory=dict)
+
+def _preprocess_sync(source: Union[bytes, str], size: int, max_dimension: int, output_format: str,
+                     quality: int) -> PreprocessResult:
+    """
+    在子 process 中執行：解碼 -> 依 EXIF 轉正 -> 縮小到 max_dimension 以內 -> 重新編碼（不含 metadata）
+
+    source 是檔案內容或檔案路徑（由 Pillow 直接從檔案讀取），size 是原始檔案大小。
+    各階段耗時（毫秒）記錄在 timings；無法解碼或是動畫（WebP / APNG）時回傳 changed=False
+    """
+    timings = {}
+    started = time.perf_counter()
+    try:
+        image = Image.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+        # 動畫重新編碼會只剩第一格
+        if getattr(image, "is_animated", False):
+            image.close()
+            return PreprocessResult(changed=False)
+        has_metadata = bool(image.info.get("exif") or image.info.get("icc_profile") or image.info.get("xmp"))
+        # JPEG 可以直接以縮小的尺寸解碼，大幅減少解碼時間與記憶體
+        if max(image.size) > max_dimension * 2:
+            image.draft("RGB", (max_dimension, max_dimension))
+        image.load()
+    except Exception:
+        return PreprocessResult(changed=False)
+    timings["decode"] = (time.perf_counter() - started) * 1000
+
+    step = time.perf_counter()
+    oriented = ImageOps.exif_transpose(image)
+    rotated = oriented is not image
+    image = oriented
+    timings["orient"] = (time.perf_counter() - step) * 1000
+
+    step = time.perf_counter()
+    resized = max(image.size) > max_dimension
+    if resized:
+        image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+    if output_format == "jpeg" and image.mode == "RGBA":
+        image = image.convert("RGB")
+    timings["resize"] = (time.perf_counter() - step) * 1000
+
+    step = time.perf_counter()
+    pil_format, content_type, options = OUTPUT_FORMATS[output_format]
+    out = io.BytesIO()
+    # 不傳 exif / icc_profile，輸出的檔案不含 metadata（GPS 位置等）
+    image.save(out, pil_format, quality=quality, **options)
+    timings["encode"] = (time.perf_counter() - step) * 1000
+
+    output = out.getvalue()
+    # 不需要轉正、縮小或移除 metadata，而且重新編碼反而變大時，保留原始檔案
+    if not (rotated or resized or has_metadata) and len(output) >= size:
+        return PreprocessResult(changed=False, timings=timings)
+    return PreprocessResult(
+        changed=True,
+        data=output,
+        content_type=content_type,
+        width=image.width,
+        height=image.height,
+        timings=timings
+    )
+
+def _prepare_source(file_obj: BinaryIO) -> tuple:
+    """
+    子 process 讀取上傳檔案的方式，回傳 (位元組或路徑, 原始大小, 處理完要刪除的暫存檔路徑或 None)
+
+    - 本身就在磁碟上的檔案（背景工作、可續傳上傳的暫存檔）：直接傳路徑
+    - 小檔案（還在記憶體中）：傳位元組
+    - 其他（已經寫到沒有路徑的暫存檔）：逐塊複製到暫存檔後傳路徑
+    """
+    file_obj.seek(0, io.SEEK_END)
+    size = file_obj.tell()
+    file_obj.seek(0)
+    name = getattr(file_obj, "name", None)
+    if isinstance(name, str) and os.path.isfile(name):
+        return name, size, None
+    if size <= INLINE_MAX_BYTES:
+        data = file_obj.read()
+        file_obj.seek(0)
+        return data, size, None
+    with tempfile.NamedTemporaryFile(prefix="preprocess-", delete=False) as out:
+        shutil.copyfileobj(file_obj, out, COPY_CHUNK_SIZE)
+    file_obj.seek(0)
+    return out.name, size, out.name
+
+def _remove(path: str) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+class PreprocessService:
+    """
+    上傳前的圖片前處理（IMAGE_PREPROCESS=true 時啟用）
+
+    解碼與重新編碼是 CPU 密集的工作，放在 ProcessPoolExecutor 中執行，
+    可以使用所有 CPU 核心，也不會因為 GIL 卡住事件循環與上傳執行緒。
+    同時進行的數量受上傳排程器的名額限制（process_single_file 在 batch.run 中執行）；
+    上傳檔案以路徑交給子 process（見 _prepare_source），不會整個讀進 API process 的記憶體
+    """
+
+    def __init__(self, workers: int):
+        # 多 worker 模式下每個 process 各有一個 process pool，合計不超過 CPU 核心數
+        self.workers = workers or max(1, (os.cpu_count() or 1) // max(1, settings.web_concurrency))
+        self._pool: Optional[ProcessPoolExecutor] = None
+        # 統計數據
+        self._processed = 0
+        self._unchanged = 0
+        self._bytes_in = 0
+        self._bytes_out = 0
+        self._stage_totals: Dict[str, float] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return settings.image_preprocess
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        # 第一次使用時才建立；使用 spawn，子 process 不會繼承事件循環與執行緒的狀態
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    async def preprocess(self, file_obj: BinaryIO, content_type: str) -> PreprocessResult:
+        """前處理一個上傳檔案，回傳結果（不支援的類型回傳 changed=False）"""
+        if content_type in SKIP_TYPES:
+            return PreprocessResult(changed=False)
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        source, size, temp_path = await loop.run_in_executor(upload_scheduler.executor, _prepare_source, file_obj)
+        read_ms = (time.perf_counter() - started) * 1000
+        try:
+            result = await loop.run_in_executor(
+                self._get_pool(),
+                _preprocess_sync,
+                source,
+                size,
+                settings.preprocess_max_dimension,
+                settings.preprocess_format,
+                settings.preprocess_quality
+            )
+        finally:
+            if temp_path:
+                await asyncio.to_thread(_remove, temp_path)
+        result.timings = {"read": read_ms, **result.timings}
+        self._record(result, size)
+        return result
+
+    def _record(self, result: PreprocessResult, size: int) -> None:
+        if result.changed:
+            self._processed += 1
+            self._bytes_in += size
+            self._bytes_out += len(result.data)
+        else:
+            self._unchanged += 1
+        for stage, ms in result.timings.items():
+            self._stage_totals[stage] = self._stage_totals.get(stage, 0.0) + ms
+
+    def stats(self) -> dict:
+        """處理數量、節省的位元組數與各階段平均耗時"""
+        total = self._processed + self._unchanged
+        return {
+            "enabled": self.enabled,
+            "workers": self.workers,
+            "processed": self._processed,
+            "unchanged": self._unchanged,
+            "bytes_in": self._bytes_in,
+            "bytes_out": self._bytes_out,
+            "avg_stage_ms": {
+                stage: round(ms / total, 2) for stage, ms in self._stage_totals.items()
+            } if total else {},
+        }
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+# 建立全域實例
+preprocess_service = PreprocessService(workers=settings.preprocess_workers)
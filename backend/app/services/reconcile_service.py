@@ -0,0 +1,294 @@
+"""
+儲存空間與 MongoDB 的對帳（孤兒檔案清理）
+
+刪除圖片時先刪儲存空間再刪記錄、儲存後端的刪除失敗只記錄錯誤、上傳中途失敗等情況，
+會留下沒有圖片記錄的檔案（孤兒），長期下來浪費儲存空間。
+
+做法（merge-join）：
+- 儲存空間以 list_files 依 public_id 排序、一次一頁列出 kpop_gallery/stars/ 底下的檔案
+- MongoDB 以 s3_key 索引依相同順序讀取同一段範圍的圖片記錄（cursor，不一次載入）
+- 兩邊同時往前走：只在儲存空間的是孤兒檔案，只在 MongoDB 的是檔案已遺失的記錄（只回報）
+- 每處理完一頁就把位置（儲存後端的 cursor 與最後一個 public_id）記在 reconcile_state，
+  下一次從那裡繼續，每次最多檢查 RECONCILE_MAX_FILES 個檔案，走完一輪後從頭開始
+
+記憶體用量只有一頁（最多 500 個檔案）。上傳後 RECONCILE_GRACE_SECONDS 內的檔案不處理
+（上傳中、直接上傳還沒 finalize），處理前也會再確認一次沒有記錄。
+孤兒檔案預設刪除；relink 時所屬明星還在的檔案改為重新建立圖片記錄。
+dry_run 只回報，不刪除、不建立記錄，也不移動位置
+"""
+from app.config import settings
+from app.services import star_summary_service
+from app.services.response_cache import response_cache
+from app.services.storage import storage_service
+from app.services.storage_backend import InvalidListCursorError, StorageBackend, StorageDeleteError
+from bson import ObjectId
+from datetime import datetime, timedelta
+from pymongo.errors import DuplicateKeyError
+from typing import Awaitable, Callable, List, Optional
+import os
+import re
+
+STATE_ID = "storage_orphans"
+# 所有明星檔案的共同前綴（StorageBackend.public_id_prefix 去掉 star_id 與其後的 /）
+STARS_PREFIX = StorageBackend.public_id_prefix("")[:-1]
+# 每頁列出的檔案數（Cloudinary Search API 一次最多 500 個）
+LIST_PAGE_SIZE = 500
+# 每批刪除的檔案數（Cloudinary delete_resources 一次最多 100 個 public_id）
+ACTION_BATCH_SIZE = 100
+# 報告中每種問題最多列出的範例數
+SAMPLE_LIMIT = 50
+# 對帳執行中的租約（每處理一頁更新一次），避免兩個對帳同時移動位置
+LEASE_SECONDS = 600
+
+# generate_public_id 的格式：{prefix}{star_id}/{uuid}_{檔名}
+_PUBLIC_ID = re.compile(r"^(?P<star_id>[0-9a-f]{24})/[0-9a-f-]{36}_(?P<name>.+)$")
+
+_EXTENSIONS = {"image/jpeg": ".jpg", "image/png": ".png", "image/gif": ".gif", "image/webp": ".webp"}
+
+class ReconcileBusyError(Exception):
+    """另一個對帳正在執行"""
+    pass
+
+class ReconcileUnsupportedError(Exception):
+    """目前的儲存後端無法列出檔案，不能對帳"""
+    pass
+
+def _prefix_end(prefix: str) -> str:
+    """字串排序中緊接在所有以 prefix 開頭的字串之後的值"""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+def _new_report(dry_run: bool, relink: bool, started_after: Optional[str]) -> dict:
+    return {
+        "dry_run": dry_run,
+        "relink": relink,
+        "started_after": started_after,
+        "scanned": 0,
+        "matched": 0,
+        # 沒有記錄的檔案（不含 recent）與大小
+        "orphans": 0,
+        "orphan_bytes": 0,
+        # 還在寬限期內、這次不處理的孤兒檔案
+        "recent": 0,
+        "deleted": 0,
+        "relinked": 0,
+        # 有記錄但檔案已不在儲存空間
+        "dangling": 0,
+        "pass_completed": False,
+        "checkpoint": started_after,
+        "samples": {"orphans": [], "dangling": []},
+    }
+
+def _sample(report: dict, kind: str, value: str) -> None:
+    if len(report["samples"][kind]) < SAMPLE_LIMIT:
+        report["samples"][kind].append(value)
+
+async def _claim(db) -> None:
+    """取得對帳租約（reconcile_state 文件不存在時建立）"""
+    now = datetime.utcnow()
+    try:
+        await db.reconcile_state.update_one(
+            {"_id": STATE_ID, "$or": [{"lease_until": None}, {"lease_until": {"$lt": now}}]},
+            {"$set": {"lease_until": now + timedelta(seconds=LEASE_SECONDS)}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        raise ReconcileBusyError("另一個對帳正在執行")
+
+async def _save_checkpoint(db, cursor: Optional[str], last_key: Optional[str], pass_completed: bool) -> None:
+    now = datetime.utcnow()
+    update = {"$set": {
+        "cursor": cursor,
+        "last_key": last_key,
+        "updated_at": now,
+        "lease_until": now + timedelta(seconds=LEASE_SECONDS),
+    }}
+    if pass_completed:
+        update["$set"]["last_pass_completed_at"] = now
+        update["$inc"] = {"passes": 1}
+    await db.reconcile_state.update_one({"_id": STATE_ID}, update)
+
+async def _release(db) -> None:
+    await db.reconcile_state.update_one({"_id": STATE_ID}, {"$set": {"lease_until": None}})
+
+async def _merge_page(db, files: List[dict], last_key: Optional[str], upper: Optional[str], report: dict) -> List[dict]:
+    """
+    比對一頁檔案與同一段範圍 (last_key, upper] 的圖片記錄，回傳沒有記錄的檔案
+
+    upper 為 None 表示到前綴的結尾（最後一頁）
+    """
+    key_range = {"$gt": last_key} if last_key else {"$gte": STARS_PREFIX}
+    if upper is None:
+        key_range["$lt"] = _prefix_end(STARS_PREFIX)
+    else:
+        key_range["$lte"] = upper
+    records = db.images.find({"s3_key": key_range}, {"s3_key": 1, "_id": 0}).sort("s3_key", 1)
+
+    orphans = []
+    remaining = iter(files)
+    remote = next(remaining, None)
+    previous = None
+    async for record in records:
+        key = record["s3_key"]
+        # 共用檔案（global 去重）會有多筆記錄指向同一個 s3_key
+        if key == previous:
+            continue
+        previous = key
+        while remote is not None and remote["public_id"] < key:
+            orphans.append(remote)
+            remote = next(remaining, None)
+        if remote is not None and remote["public_id"] == key:
+            report["matched"] += 1
+            remote = next(remaining, None)
+        else:
+            report["dangling"] += 1
+            _sample(report, "dangling", key)
+    while remote is not None:
+        orphans.append(remote)
+        remote = next(remaining, None)
+    return orphans
+
+def _relinked_image(file: dict, star_id: str, name: str) -> dict:
+    """由儲存空間的檔案資訊重新建立圖片記錄（沒有內容雜湊與感知雜湊）"""
+    stem, ext = os.path.splitext(name)
+    expected = _EXTENSIONS.get(file["mime_type"])
+    image_dict = {
+        "star_id": ObjectId(star_id),
+        "s3_key": file["public_id"],
+        "s3_url": storage_service.get_file_url(file["public_id"]),
+        "filename": name if ext or not expected else f"{stem}{expected}",
+        "file_size": file["bytes"],
+        "mime_type": file["mime_type"],
+        "uploaded_at": file["created_at"],
+        "variants": storage_service.variants_for(file["public_id"]),
+    }
+    if file.get("width") and file.get("height"):
+        image_dict.update({
+            "width": file["width"],
+            "height": file["height"],
+            "aspect_ratio": round(file["width"] / file["height"], 4)
+        })
+    return image_dict
+
+async def _resolve_orphans(db, orphans: List[dict], relink: bool, report: dict) -> None:
+    """刪除孤兒檔案，或（relink）為所屬明星還在的檔案重新建立記錄"""
+    # 處理前再確認一次（比對之後可能剛好寫入了記錄）
+    keys = [file["public_id"] for file in orphans]
+    recorded = set(await db.images.distinct("s3_key", {"s3_key": {"$in": keys}}))
+    orphans = [file for file in orphans if file["public_id"] not in recorded]
+
+    to_relink = {}
+    if relink:
+        owners = {}
+        for file in orphans:
+            match = _PUBLIC_ID.match(file["public_id"][len(STARS_PREFIX):])
+            if match:
+                owners[file["public_id"]] = match
+        star_ids = {ObjectId(match["star_id"]) for match in owners.values()}
+        live = set()
+        if star_ids:
+            cursor = db.stars.find({"_id": {"$in": list(star_ids)}, "deleting": {"$ne": True}}, {"_id": 1})
+            live = {str(star["_id"]) async for star in cursor}
+        for file in orphans:
+            match = owners.get(file["public_id"])
+            if match and match["star_id"] in live:
+                to_relink.setdefault(match["star_id"], []).append(_relinked_image(file, match["star_id"], match["name"]))
+
+    relinked_keys = set()
+    for star_id, images in to_relink.items():
+        result = await db.images.insert_many(images)
+        for image_dict, image_id in zip(images, result.inserted_ids):
+            image_dict["_id"] = image_id
+            relinked_keys.add(image_dict["s3_key"])
+        await star_summary_service.record_bulk_upload(db, star_id, images)
+        response_cache.invalidate("stars", f"star:{star_id}", f"images:{star_id}")
+    report["relinked"] += len(relinked_keys)
+
+    to_delete = [file["public_id"] for file in orphans if file["public_id"] not in relinked_keys]
+    for start in range(0, len(to_delete), ACTION_BATCH_SIZE):
+        batch = to_delete[start:start + ACTION_BATCH_SIZE]
+        # global 去重留下的 asset 記錄已經沒有圖片引用
+        await db.assets.delete_many({"s3_key": {"$in": batch}})
+        try:
+            report["deleted"] += await storage_service.delete_files(batch)
+        except StorageDeleteError as e:
+            # 刪除失敗的檔案下一輪對帳時還是孤兒，會再處理一次
+            print(f"⚠️  對帳時 {len(e.failed)} 個孤兒檔案刪除失敗")
+            report["deleted"] += e.deleted
+
+async def reconcile_storage(
+    db,
+    dry_run: bool = True,
+    relink: bool = False,
+    max_files: Optional[int] = None,
+    progress: Optional[Callable[[dict], Awaitable[None]]] = None
+) -> dict:
+    """
+    從上次的位置繼續對帳，最多檢查 max_files（預設 RECONCILE_MAX_FILES）個檔案，回傳報告
+
+    progress 在每頁處理完後以目前的報告呼叫（背景工作用來更新進度）；
+    儲存後端不支援列出檔案時拋出 ReconcileUnsupportedError
+    """
+    if not storage_service.supports_listing:
+        raise ReconcileUnsupportedError(f"儲存後端 {type(storage_service).__name__} 不支援列出檔案，無法對帳")
+    max_files = max_files or settings.reconcile_max_files
+    grace = timedelta(seconds=settings.reconcile_grace_seconds)
+    if not dry_run:
+        await _claim(db)
+    state = await db.reconcile_state.find_one({"_id": STATE_ID}) or {}
+    cursor = state.get("cursor")
+    last_key = state.get("last_key")
+    report = _new_report(dry_run, relink, last_key)
+
+    try:
+        while report["scanned"] < max_files:
+            try:
+                files, next_cursor = await storage_service.list_files(
+                    STARS_PREFIX, cursor, min(LIST_PAGE_SIZE, max_files - report["scanned"])
+                )
+            except InvalidListCursorError:
+                if cursor is None:
+                    raise
+                print("⚠️  對帳位置已失效，從頭開始")
+                cursor = last_key = None
+                continue
+
+            # cursor 之前的檔案已經處理過（儲存後端重新列出時可能重疊）
+            if last_key:
+                files = [file for file in files if file["public_id"] > last_key]
+            if not files and next_cursor:
+                cursor = next_cursor
+                continue
+            upper = files[-1]["public_id"] if next_cursor else None
+
+            orphans = await _merge_page(db, files, last_key, upper, report)
+            cutoff = datetime.utcnow() - grace
+            actionable = [file for file in orphans if file["created_at"] < cutoff]
+            report["recent"] += len(orphans) - len(actionable)
+            report["orphans"] += len(actionable)
+            report["orphan_bytes"] += sum(file["bytes"] or 0 for file in actionable)
+            for file in actionable:
+                _sample(report, "orphans", file["public_id"])
+            if actionable and not dry_run:
+                await _resolve_orphans(db, actionable, relink, report)
+
+            report["scanned"] += len(files)
+            pass_completed = next_cursor is None
+            cursor, last_key = (None, None) if pass_completed else (next_cursor, upper)
+            report["checkpoint"] = last_key
+            if not dry_run:
+                await _save_checkpoint(db, cursor, last_key, pass_completed)
+            if progress:
+                await progress(report)
+            if pass_completed:
+                report["pass_completed"] = True
+                break
+    finally:
+        if not dry_run:
+            await _release(db)
+
+    print(
+        f"🧹 對帳{'（dry run）' if dry_run else ''}：檢查 {report['scanned']} 個檔案，"
+        f"孤兒 {report['orphans']} 個（刪除 {report['deleted']}、重新連結 {report['relinked']}），"
+        f"檔案遺失的記錄 {report['dangling']} 筆"
+    )
+    return report
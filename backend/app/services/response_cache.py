@@ -0,0 +1,167 @@
+from app.config import settings
+from app.serialization import FastJSONResponse, dumps
+from collections import OrderedDict
+from fastapi import Request, Response
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Set, Tuple
+import asyncio
+import hashlib
+import time
+
+# 快取的內容：(JSON bytes, 額外的 response headers, 弱 ETag)
+CachedBody = Tuple[bytes, Dict[str, str], str]
+Loader = Callable[[], Awaitable[Tuple[Any, Dict[str, str]]]]
+
+class ResponseCache:
+    """
+    GET 回應的記憶體內快取（LRU + TTL）
+
+    - 快取已序列化的 JSON，命中時不查詢 MongoDB，也不重新序列化
+    - 同一個 key 同時有多個請求未命中時，只有第一個會查詢資料庫，其他請求等待同一個結果
+    - 每筆快取帶有 tag（例如 star:{id}），寫入路徑依 tag 精準地清除
+    - 回應帶弱 ETag，If-None-Match 相符時回應 304
+
+    快取只在單一 process 內有效；多個 process 之間依 TTL 過期
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, CachedBody, Tuple[str, ...]]]" = OrderedDict()
+        self._tags: Dict[str, Set[str]] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # 每次清除都加一，查詢期間有清除發生時結果不寫入快取（避免寫入過期資料）
+        self._generation = 0
+        # tag -> 最後一次寫入（清除）的時間，列表端點依此決定是否要從 primary 讀取
+        self._written_at: Dict[str, float] = {}
+        self._cleared_at = float("-inf")
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+
+    def _get(self, key: str) -> Optional[CachedBody]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, body, _ = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return body
+
+    def _set(self, key: str, body: CachedBody, tags: Tuple[str, ...]) -> None:
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, body, tags)
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def invalidate(self, *tags: str) -> None:
+        """清除帶有任一個 tag 的快取（由寫入路徑呼叫）"""
+        self._generation += 1
+        self.invalidations += 1
+        now = time.monotonic()
+        for tag in tags:
+            self._written_at[tag] = now
+            for key in list(self._tags.get(tag, ())):
+                self._remove(key)
+        if len(self._written_at) > self.max_entries:
+            # 只需要保留 read_your_writes 時間內的寫入紀錄
+            window = settings.mongo_read_your_writes_seconds
+            self._written_at = {tag: at for tag, at in self._written_at.items() if now - at < window}
+
+    def recently_written(self, *tags: str) -> bool:
+        """任一個 tag 在 read_your_writes 時間內被寫入過（只知道這個 process 的寫入）"""
+        since = time.monotonic() - settings.mongo_read_your_writes_seconds
+        if self._cleared_at > since:
+            return True
+        return any(self._written_at.get(tag, float("-inf")) > since for tag in tags)
+
+    def clear(self) -> None:
+        """清除所有快取（大量修改資料後使用）"""
+        self._generation += 1
+        self.invalidations += 1
+        self._cleared_at = time.monotonic()
+        self._entries.clear()
+        self._tags.clear()
+
+    async def get_or_load(self, key: str, tags: Iterable[str], loader: Loader) -> CachedBody:
+        """取得快取內容，未命中時呼叫 loader 並合併同時間的相同請求"""
+        body = self._get(key)
+        if body is not None:
+            self.hits += 1
+            return body
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        generation = self._generation
+        try:
+            content, headers = await loader()
+            data = dumps(content)
+            etag = f'W/"{hashlib.sha1(data).hexdigest()[:20]}"'
+            body = (data, headers, etag)
+            if generation == self._generation:
+                self._set(key, body, tuple(tags))
+            future.set_result(body)
+            return body
+        except BaseException as e:
+            future.set_exception(e)
+            # 沒有其他請求在等待時，避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "invalidations": self.invalidations,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+async def cached_json_response(request: Request, key: str, tags: Iterable[str], loader: Loader) -> Response:
+    """
+    以快取回應 GET 請求
+
+    loader 回傳 (可 JSON 序列化的內容, 額外 headers)；快取停用時每次都呼叫 loader
+    """
+    if not settings.response_cache_enabled:
+        content, headers = await loader()
+        return FastJSONResponse(content=content, headers=headers)
+
+    data, headers, etag = await response_cache.get_or_load(key, tags, loader)
+    headers = {**headers, "ETag": etag}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=data, media_type="application/json", headers=headers)
+
+# 建立全域實例
+response_cache = ResponseCache(
+    max_entries=settings.response_cache_max_entries,
+    ttl_seconds=settings.response_cache_ttl_seconds
+)
@@ -0,0 +1,125 @@
+from app.config import settings
+from app.services import dedup_service, star_summary_service
+from app.services.storage import storage_service
+from app.services.storage_backend import StorageDeleteError
+from bson import ObjectId
+from typing import Awaitable, Callable, List, Optional
+import asyncio
+
+# 每批處理的圖片數（Cloudinary delete_resources 一次最多 100 個 public_id）
+DELETE_BATCH_SIZE = 100
+
+async def _delete_batch(db, star_id: str, images: List[dict]) -> int:
+    """
+    刪除一批圖片：先刪儲存空間的檔案，再刪 MongoDB 記錄
+
+    順序很重要：中途中斷時 MongoDB 記錄還在，重新執行會再刪一次檔案（刪除是冪等的），
+    不會留下沒有記錄的孤兒檔案。儲存後端回報部分檔案刪除失敗時，只刪除其他記錄，
+    再拋出 StorageDeleteError，重新執行時重試剩下的
+    """
+    ids = [image["_id"] for image in images]
+
+    # 先標記已釋放引用再釋放，中斷後重跑不會重複扣引用次數
+    # （最壞情況是少扣一次，共用檔案不會被提早刪除）
+    to_release = [image for image in images if not image.get("asset_released")]
+    s3_keys = [image["s3_key"] for image in images if image.get("delete_remote")]
+    if to_release:
+        await db.images.update_many(
+            {"_id": {"$in": [image["_id"] for image in to_release]}},
+            {"$set": {"asset_released": True}}
+        )
+        released_keys = await dedup_service.release_assets(db, to_release)
+        # 記錄哪些檔案需要刪除，中斷後重跑時仍然知道要刪哪些
+        if released_keys:
+            await db.images.update_many(
+                {"_id": {"$in": ids}, "s3_key": {"$in": released_keys}},
+                {"$set": {"delete_remote": True}}
+            )
+        s3_keys.extend(released_keys)
+
+    delete_error = None
+    if s3_keys:
+        try:
+            await storage_service.delete_files(s3_keys)
+        except StorageDeleteError as e:
+            delete_error = e
+    if delete_error:
+        # 檔案沒有刪除的記錄保留（已標記 delete_remote），重新執行時會再刪一次檔案
+        failed = set(delete_error.failed)
+        images = [image for image in images if image["s3_key"] not in failed]
+        ids = [image["_id"] for image in images]
+
+    deleted_count = 0
+    if images:
+        result = await db.images.delete_many({"_id": {"$in": ids}})
+        deleted_count = result.deleted_count
+        # 刪除過程中明星列表的圖片數也跟著減少
+        if deleted_count == len(images):
+            total_bytes = sum(image.get("file_size", 0) for image in images)
+            await star_summary_service.record_bulk_delete(db, star_id, deleted_count, total_bytes)
+        else:
+            # 其中有些圖片同時被其他請求刪除（那邊已經扣過統計），無法得知是哪些，改為重新計算
+            await star_summary_service.repair_summaries(db, [star_id])
+    if delete_error:
+        raise delete_error
+    return deleted_count
+
+async def delete_star_images(
+    db,
+    star_id: str,
+    on_progress: Optional[Callable[[int], Awaitable[None]]] = None
+) -> int:
+    """
+    串流刪除明星的所有圖片，回傳刪除的圖片數
+
+    - 只投影需要的欄位，用 cursor 逐批讀取，記憶體用量與圖片總數無關
+    - 每批用儲存後端的批次刪除，最多 STAR_DELETE_CONCURRENCY 批同時進行
+    - 可重複執行：中斷後再呼叫一次，會從剩下的圖片繼續
+    """
+    semaphore = asyncio.Semaphore(settings.star_delete_concurrency)
+    pending = set()
+    errors: List[Exception] = []
+    deleted = 0
+
+    async def run_batch(images: List[dict]) -> None:
+        nonlocal deleted
+        try:
+            deleted += await _delete_batch(db, star_id, images)
+            if on_progress:
+                await on_progress(deleted)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            semaphore.release()
+
+    async def submit(images: List[dict]) -> None:
+        # 同時進行的批次達到上限時，等待其中一批完成才繼續讀取
+        await semaphore.acquire()
+        task = asyncio.create_task(run_batch(images))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+
+    cursor = db.images.find(
+        {"star_id": ObjectId(star_id)},
+        {"s3_key": 1, "content_hash": 1, "file_size": 1, "asset_released": 1, "delete_remote": 1}
+    ).batch_size(DELETE_BATCH_SIZE)
+
+    batch: List[dict] = []
+    try:
+        async for image in cursor:
+            batch.append(image)
+            if len(batch) == DELETE_BATCH_SIZE:
+                await submit(batch)
+                batch = []
+            if errors:
+                break
+        if batch and not errors:
+            await submit(batch)
+    finally:
+        # 出錯時也要等進行中的批次結束
+        if pending:
+            await asyncio.gather(*pending)
+
+    if errors:
+        raise errors[0]
+    return deleted
@@ -0,0 +1,200 @@
+import bisect
+import time
+import unicodedata
+from app.config import settings
+from app.services import index_generation_service
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+# index_generations 中搜尋索引的世代計數器
+GENERATION_KEY = "star_search"
+
+def normalize_name(name: str) -> str:
+    """正規化名字：NFKC（全形轉半形）+ casefold（不區分大小寫）+ 去除前後空白"""
+    return unicodedata.normalize("NFKC", name).casefold().strip()
+
+def _bigrams(text: str) -> Set[str]:
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+def _word_suffixes(text: str) -> List[str]:
+    """名字中第二個以後每個單字開頭到結尾的字串，例如 "kim ji min" -> ["ji min", "min"]"""
+    return [text[i:] for i in range(1, len(text)) if text[i].isalnum() and not text[i - 1].isalnum()]
+
+def _remove_sorted(sorted_list: list, item: tuple) -> None:
+    index = bisect.bisect_left(sorted_list, item)
+    if index < len(sorted_list) and sorted_list[index] == item:
+        del sorted_list[index]
+
+class StarSearchService:
+    """
+    明星名字的記憶體內搜尋索引（typeahead 用）
+
+    - 前綴比對：已排序的 (正規化名字, star_id) 清單 + bisect，O(log n + k)
+    - 單字開頭比對：名字中第二個以後的單字也放進另一個已排序清單（"jimin" 可找到 "kim jimin"）
+    - 子字串比對：bigram 倒排索引，從最小的 posting 集合逐一確認，找滿就停止
+    - 由 create_star / update_star / delete_star 同步更新，啟動時從 MongoDB 載入
+    - 多 worker 模式下其他 process 的寫入以世代計數器得知（最多延遲 STAR_SEARCH_SYNC_SECONDS），
+      計數器改變時重新載入整個索引
+
+    使用者輸入只會被當成純文字比對，不會被解讀成正規表示式
+    """
+
+    def __init__(self):
+        # star_id -> (正規化名字, 原始名字, 建立時間)
+        self._entries: Dict[str, Tuple[str, str, datetime]] = {}
+        # 依正規化名字排序，用於前綴搜尋
+        self._sorted: List[Tuple[str, str]] = []
+        # 名字中第二個以後的單字開頭 -> 剩下的字串，用於單字開頭搜尋
+        self._word_sorted: List[Tuple[str, str]] = []
+        # bigram -> star_id 集合，用於子字串搜尋
+        self._grams: Dict[str, Set[str]] = {}
+        self.loaded = False
+        # 目前索引對應的世代與上次確認世代的時間
+        self._generation = 0
+        self._checked_at = float("-inf")
+
+    async def load(self, db) -> None:
+        """從 MongoDB 重建整個索引（建好後才替換，載入期間的搜尋仍使用舊的索引）"""
+        # 先讀世代再讀資料：載入期間有寫入時世代會改變，下次 refresh 會再載入一次
+        generation = await index_generation_service.current(db, GENERATION_KEY)
+        fresh = StarSearchService()
+        cursor = db.stars.find({}, {"name": 1, "created_at": 1})
+        async for star in cursor:
+            fresh._index(str(star["_id"]), star["name"], star["created_at"])
+        fresh._sorted.sort()
+        fresh._word_sorted.sort()
+        self._entries, self._sorted, self._word_sorted, self._grams = (
+            fresh._entries, fresh._sorted, fresh._word_sorted, fresh._grams
+        )
+        self._generation = generation
+        self._checked_at = time.monotonic()
+        self.loaded = True
+        print(f"✅ 已建立明星搜尋索引（{len(self._entries)} 筆）")
+
+    async def refresh(self, db) -> None:
+        """搜尋前呼叫：距離上次確認超過 STAR_SEARCH_SYNC_SECONDS 時檢查世代，其他 process 寫入過就重新載入"""
+        now = time.monotonic()
+        if now - self._checked_at < settings.star_search_sync_seconds:
+            return
+        self._checked_at = now
+        if await index_generation_service.current(db, GENERATION_KEY) != self._generation:
+            await self.load(db)
+
+    async def publish(self, db) -> None:
+        """
+        本 process 更新索引（add / update / remove）後呼叫，讓其他 process 重新載入
+
+        世代剛好只加一表示中間沒有其他 process 的寫入，自己的索引已經是最新的；
+        否則下次 refresh 時重新載入
+        """
+        generation = await index_generation_service.bump(db, GENERATION_KEY)
+        if generation == self._generation + 1:
+            self._generation = generation
+        else:
+            self._checked_at = float("-inf")
+
+    def _index(self, star_id: str, name: str, created_at: datetime) -> None:
+        """加入索引但不維持排序清單的順序（批次載入用，載入完再排序）"""
+        normalized = normalize_name(name)
+        self._entries[star_id] = (normalized, name, created_at)
+        self._sorted.append((normalized, star_id))
+        for word_suffix in _word_suffixes(normalized):
+            self._word_sorted.append((word_suffix, star_id))
+        for gram in _bigrams(normalized):
+            self._grams.setdefault(gram, set()).add(star_id)
+
+    def add(self, star_id: str, name: str, created_at: datetime) -> None:
+        """新增明星到索引"""
+        if star_id in self._entries:
+            self.remove(star_id)
+        normalized = normalize_name(name)
+        self._entries[star_id] = (normalized, name, created_at)
+        bisect.insort(self._sorted, (normalized, star_id))
+        for word_suffix in _word_suffixes(normalized):
+            bisect.insort(self._word_sorted, (word_suffix, star_id))
+        for gram in _bigrams(normalized):
+            self._grams.setdefault(gram, set()).add(star_id)
+
+    def update(self, star_id: str, name: str) -> None:
+        """明星改名時更新索引"""
+        entry = self._entries.get(star_id)
+        created_at = entry[2] if entry else datetime.utcnow()
+        self.add(star_id, name, created_at)
+
+    def remove(self, star_id: str) -> None:
+        """從索引移除明星"""
+        entry = self._entries.pop(star_id, None)
+        if entry is None:
+            return
+        normalized = entry[0]
+        _remove_sorted(self._sorted, (normalized, star_id))
+        for word_suffix in _word_suffixes(normalized):
+            _remove_sorted(self._word_sorted, (word_suffix, star_id))
+        for gram in _bigrams(normalized):
+            ids = self._grams.get(gram)
+            if ids is not None:
+                ids.discard(star_id)
+                if not ids:
+                    del self._grams[gram]
+
+    @staticmethod
+    def _scan_prefix(sorted_list: List[Tuple[str, str]], query: str, seen: Set[str], results: List[str],
+                     limit: Optional[int]) -> None:
+        """從已排序清單中依序取出前綴相符且尚未出現過的 star_id"""
+        index = bisect.bisect_left(sorted_list, (query, ""))
+        while index < len(sorted_list) and sorted_list[index][0].startswith(query):
+            if limit is not None and len(results) >= limit:
+                return
+            star_id = sorted_list[index][1]
+            if star_id not in seen:
+                seen.add(star_id)
+                results.append(star_id)
+            index += 1
+
+    def _scan_substring(self, query: str, seen: Set[str], results: List[str], limit: Optional[int]) -> None:
+        """從最小的 bigram posting 集合逐一確認子字串，找滿 limit 筆就停止"""
+        postings = []
+        for gram in _bigrams(query):
+            ids = self._grams.get(gram)
+            if not ids:
+                return
+            postings.append(ids)
+        # 單一字元沒有 bigram，只能逐筆確認（例如中文名字中間的一個字）
+        candidates = min(postings, key=len) if postings else self._entries
+        found = []
+        need = None if limit is None else limit - len(results)
+        for star_id in candidates:
+            if star_id in seen or query not in self._entries[star_id][0]:
+                continue
+            found.append(star_id)
+            if need is not None and len(found) >= need:
+                break
+        # 子字串相符的結果依名字長度排序（越短越接近使用者要找的）
+        found.sort(key=lambda star_id: (len(self._entries[star_id][0]), self._entries[star_id][0]))
+        results.extend(found)
+
+    def search(self, query: str, limit: Optional[int] = 10) -> List[str]:
+        """
+        搜尋名字包含 query 的明星，回傳依相關度排序的 star_id
+
+        排序：前綴相符（完全相同的會排第一）> 某個單字的開頭相符 > 其他子字串相符
+        """
+        query = normalize_name(query)
+        if not query:
+            return []
+
+        results: List[str] = []
+        seen: Set[str] = set()
+        self._scan_prefix(self._sorted, query, seen, results, limit)
+        self._scan_prefix(self._word_sorted, query, seen, results, limit)
+        if limit is None or len(results) < limit:
+            self._scan_substring(query, seen, results, limit)
+        return results
+
+    def get(self, star_id: str) -> Optional[Tuple[str, datetime]]:
+        """回傳 (名字, 建立時間)"""
+        entry = self._entries.get(star_id)
+        return (entry[1], entry[2]) if entry else None
+
+# 建立全域實例
+star_search_service = StarSearchService()
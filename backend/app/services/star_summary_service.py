@@ -0,0 +1,143 @@
+from bson import ObjectId
+from pymongo import UpdateOne
+from typing import List, Optional
+
+# 明星文件上的統計欄位（沒有圖片時的值）
+EMPTY_SUMMARY = {
+    "image_count": 0,
+    "total_bytes": 0,
+    "last_uploaded_at": None,
+    "cover_image": None
+}
+
+# repair 時每次 bulk_write 的明星數
+REPAIR_BATCH_SIZE = 500
+
+def cover_for(image: dict) -> dict:
+    """封面圖片（明星列表顯示用，只保留需要的欄位）"""
+    return {"id": str(image["_id"]), "s3_url": image["s3_url"], "variants": image.get("variants", [])}
+
+async def record_upload(db, star_id: str, image: dict) -> None:
+    """
+    新增圖片後更新明星的統計欄位
+
+    封面是最新上傳的圖片：只有在這張圖片比目前的 last_uploaded_at 新時才換封面，
+    兩種情況各是一次原子更新，並發上傳時結果與上傳順序無關
+    """
+    await _record_added(db, star_id, {"image_count": 1, "total_bytes": image["file_size"]}, image)
+
+async def record_bulk_upload(db, star_id: str, images: List[dict]) -> None:
+    """一次新增多張圖片（insert_many）後更新明星的統計欄位，封面是其中最新的一張"""
+    if not images:
+        return
+    latest = max(images, key=lambda image: (image["uploaded_at"], image["_id"]))
+    inc = {"image_count": len(images), "total_bytes": sum(image["file_size"] for image in images)}
+    await _record_added(db, star_id, inc, latest)
+
+async def _record_added(db, star_id: str, inc: dict, latest: dict) -> None:
+    result = await db.stars.update_one(
+        {
+            "_id": ObjectId(star_id),
+            "$or": [
+                {"last_uploaded_at": None},
+                {"last_uploaded_at": {"$lte": latest["uploaded_at"]}}
+            ]
+        },
+        {
+            "$inc": inc,
+            "$set": {"last_uploaded_at": latest["uploaded_at"], "cover_image": cover_for(latest)}
+        }
+    )
+    if result.matched_count == 0:
+        # 已經有更新的圖片（並發上傳時較晚完成的舊圖片），只更新數量
+        await db.stars.update_one({"_id": ObjectId(star_id)}, {"$inc": inc})
+
+async def record_delete(db, star_id: str, image: dict) -> None:
+    """刪除單張圖片後更新明星的統計欄位；刪除的是封面時改用剩下最新的圖片"""
+    await db.stars.update_one(
+        {"_id": ObjectId(star_id)},
+        {"$inc": {"image_count": -1, "total_bytes": -image["file_size"]}}
+    )
+    latest = await db.images.find_one(
+        {"star_id": ObjectId(star_id)},
+        {"s3_url": 1, "variants": 1, "uploaded_at": 1},
+        sort=[("uploaded_at", -1), ("_id", -1)]
+    )
+    if latest:
+        await db.stars.update_one(
+            {"_id": ObjectId(star_id), "cover_image.id": str(image["_id"])},
+            {"$set": {"last_uploaded_at": latest["uploaded_at"], "cover_image": cover_for(latest)}}
+        )
+    else:
+        await db.stars.update_one(
+            {"_id": ObjectId(star_id), "cover_image.id": str(image["_id"])},
+            {"$set": {"last_uploaded_at": None, "cover_image": None}}
+        )
+
+async def record_bulk_delete(db, star_id: str, count: int, total_bytes: int) -> None:
+    """刪除明星時每刪完一批圖片更新數量（封面在明星刪除前保持不變）"""
+    await db.stars.update_one(
+        {"_id": ObjectId(star_id)},
+        {"$inc": {"image_count": -count, "total_bytes": -total_bytes}}
+    )
+
+async def repair_summaries(db, star_ids: Optional[List[str]] = None) -> int:
+    """
+    以 aggregation 從 images collection 重新計算統計欄位並寫回明星文件，回傳更新的明星數
+
+    star_ids 為 None 時修復所有明星。計算期間若有新的上傳，數字可能短暫落後，再執行一次即可
+    """
+    match = {}
+    star_filter = {}
+    if star_ids is not None:
+        object_ids = [ObjectId(star_id) for star_id in star_ids]
+        match = {"star_id": {"$in": object_ids}}
+        star_filter = {"_id": {"$in": object_ids}}
+
+    # 依 (star_id, uploaded_at desc) 排序可以使用 star_id_uploaded_at_id 索引，
+    # 每組的第一筆就是最新的圖片
+    pipeline = [
+        {"$match": match},
+        {"$sort": {"star_id": 1, "uploaded_at": -1, "_id": -1}},
+        {"$group": {
+            "_id": "$star_id",
+            "image_count": {"$sum": 1},
+            "total_bytes": {"$sum": "$file_size"},
+            "last_uploaded_at": {"$first": "$uploaded_at"},
+            "cover_id": {"$first": "$_id"},
+            "cover_url": {"$first": "$s3_url"},
+            "cover_variants": {"$first": "$variants"}
+        }}
+    ]
+
+    summaries = {}
+    async for group in db.images.aggregate(pipeline, allowDiskUse=True):
+        summaries[group["_id"]] = {
+            "image_count": group["image_count"],
+            "total_bytes": group["total_bytes"],
+            "last_uploaded_at": group["last_uploaded_at"],
+            "cover_image": cover_for({
+                "_id": group["cover_id"],
+                "s3_url": group["cover_url"],
+                "variants": group.get("cover_variants") or []
+            })
+        }
+
+    updated = 0
+    operations = []
+    async for star in db.stars.find(star_filter, {"_id": 1}):
+        operations.append(UpdateOne({"_id": star["_id"]}, {"$set": summaries.get(star["_id"], EMPTY_SUMMARY)}))
+        if len(operations) == REPAIR_BATCH_SIZE:
+            await db.stars.bulk_write(operations, ordered=False)
+            updated += len(operations)
+            operations = []
+    if operations:
+        await db.stars.bulk_write(operations, ordered=False)
+        updated += len(operations)
+
+    print(f"✅ 已重新計算明星統計（{updated} 筆）")
+    return updated
+
+async def needs_repair(db) -> bool:
+    """是否有還沒有統計欄位的明星（例如升級前建立的明星）"""
+    return await db.stars.find_one({"image_count": {"$exists": False}}, {"_id": 1}) is not None
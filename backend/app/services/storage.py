@@ -0,0 +1,15 @@
+from app.config import settings
+from app.services.storage_backend import StorageBackend
+
+def create_storage_service() -> StorageBackend:
+    """依 STORAGE_BACKEND 設定建立儲存後端（cloudinary 或 local）"""
+    if settings.storage_backend == "local":
+        from app.services.local_storage_service import LocalStorageService
+        return LocalStorageService(settings.local_storage_dir, settings.public_base_url)
+    if settings.storage_backend == "cloudinary":
+        from app.services.cloudinary_service import cloudinary_service
+        return cloudinary_service
+    raise ValueError(f"不支援的 STORAGE_BACKEND: {settings.storage_backend}")
+
+# 建立全域實例
+storage_service = create_storage_service()
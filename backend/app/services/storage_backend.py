@@ -0,0 +1,130 @@
+from abc import ABC, abstractmethod
+from app.config import settings
+from typing import BinaryIO, Iterable, List, Optional, Tuple
+import uuid
+
+# 串流上傳時每次讀取的大小
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+class FileTooLargeError(Exception):
+    """串流上傳時檔案超過大小限制"""
+    pass
+
+class StorageDeleteError(Exception):
+    """批次刪除時有檔案刪除失敗（原本就不存在的檔案不算失敗）"""
+
+    def __init__(self, failed: List[str], deleted: int):
+        super().__init__(f"{len(failed)} 個檔案刪除失敗")
+        # 刪除失敗的 public_id 與成功刪除的數量
+        self.failed = failed
+        self.deleted = deleted
+
+class InvalidListCursorError(Exception):
+    """list_files 的 cursor 已失效（需要從頭重新列出）"""
+    pass
+
+class StorageBackend(ABC):
+    """
+    圖片儲存後端介面
+
+    router 只透過這個介面存取儲存空間，實作有 Cloudinary 與本機檔案系統兩種，
+    由 STORAGE_BACKEND 設定選擇（見 app/services/storage.py）
+    """
+
+    configured: bool = False
+    # 是否支援客戶端直接上傳（create_direct_upload / verify_direct_upload）
+    supports_direct_upload: bool = False
+    # 是否支援列出檔案（list_files，儲存空間對帳需要）
+    supports_listing: bool = False
+
+    @staticmethod
+    def public_id_prefix(star_id: str) -> str:
+        """某個明星所有檔案的 public_id 前綴"""
+        return f"kpop_gallery/stars/{star_id}/"
+
+    def generate_public_id(self, star_id: str, filename: str) -> str:
+        """生成 public_id（路徑）"""
+        # 格式：kpop_gallery/stars/{star_id}/{uuid}
+        unique_id = str(uuid.uuid4())
+        # 移除檔案副檔名，Cloudinary 會自動處理
+        name_without_ext = filename.rsplit('.', 1)[0] if '.' in filename else filename
+        safe_name = name_without_ext.replace(' ', '_').replace('/', '_').replace('\\', '_')
+        public_id = f"{self.public_id_prefix(star_id)}{unique_id}_{safe_name}"
+        return public_id
+
+    @abstractmethod
+    async def upload_file(self, file_obj: BinaryIO, public_id: str, content_type: str,
+                          max_size: Optional[int] = None) -> str:
+        """從檔案物件串流上傳，回傳公開 URL；超過 max_size 時拋出 FileTooLargeError"""
+
+    @abstractmethod
+    async def delete_file(self, public_id: str) -> bool:
+        """刪除單一檔案，成功回傳 True"""
+
+    async def delete_files(self, public_ids: Iterable[str]) -> int:
+        """
+        批次刪除檔案，回傳成功刪除的數量（預設逐一刪除，後端可覆寫成批次 API）
+
+        後端能分辨刪除失敗時，處理完所有檔案後以 StorageDeleteError 回報失敗的 public_id，
+        呼叫端只刪除檔案已經刪除的記錄，之後再重試其他的
+        """
+        deleted = 0
+        for public_id in public_ids:
+            if await self.delete_file(public_id):
+                deleted += 1
+        return deleted
+
+    @abstractmethod
+    def get_file_url(self, public_id: str) -> str:
+        """取得檔案 URL（使用 public_id）"""
+
+    @abstractmethod
+    async def read_file(self, public_id: str) -> bytes:
+        """讀取檔案內容（回填既有圖片的資料等維護工作使用）"""
+
+    async def list_files(self, prefix: str, cursor: Optional[str] = None,
+                         limit: int = 500) -> Tuple[List[dict], Optional[str]]:
+        """
+        依 public_id 排序（與 MongoDB 的字串排序相同）列出 prefix 底下的原始檔案，不含衍生圖
+
+        回傳 (一頁檔案, 下一頁的 cursor)，最後一頁的 cursor 為 None；
+        檔案為 {"public_id", "bytes", "mime_type", "width", "height", "created_at"}。
+        cursor 失效時拋出 InvalidListCursorError；supports_listing 為 False 的後端不實作
+        """
+        raise NotImplementedError
+
+    def create_direct_upload(self, public_id: str, expires_at: int) -> dict:
+        """
+        讓客戶端直接上傳到儲存空間的簽章參數（檔案不經過 API）
+
+        回傳 {"upload_url", "fields"}：客戶端以 multipart POST 到 upload_url，
+        fields 原樣帶上、檔案放在 "file" 欄位，儲存空間的回應交給 verify_direct_upload 驗證
+        """
+        raise NotImplementedError
+
+    async def verify_direct_upload(self, result: dict) -> Optional[dict]:
+        """
+        驗證直接上傳後儲存空間回傳的結果（簽章與上傳參數的到期時間）
+
+        大小、MIME type 與寬高必須來自儲存後端本身（有簽章或向儲存空間查詢），不能採用客戶端送來的值。
+        通過時回傳 {"public_id", "url", "file_size", "mime_type", "width", "height"}，否則回傳 None
+        """
+        raise NotImplementedError
+
+    def variant_url(self, public_id: str, width: int, fmt: str) -> Optional[str]:
+        """衍生圖 URL（最大寬度 width、格式 fmt），後端不支援時回傳 None"""
+        return None
+
+    def variants_for(self, public_id: str) -> List[dict]:
+        """
+        依 IMAGE_VARIANT_WIDTHS / IMAGE_VARIANT_FORMATS 產生所有衍生圖
+
+        回傳 [{"width", "format", "url"}]，存在圖片文件上，讓前端組成 srcset
+        """
+        variants = []
+        for fmt in settings.image_variant_formats:
+            for width in sorted(settings.image_variant_widths):
+                url = self.variant_url(public_id, width, fmt)
+                if url:
+                    variants.append({"width": width, "format": fmt, "url": url})
+        return variants
@@ -0,0 +1,226 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+from typing import Optional
+from app.config import settings
+
+class UploadQueueFullError(Exception):
+    """上傳佇列已滿（應回應 429）"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"上傳佇列已滿，請 {retry_after} 秒後再試")
+        self.retry_after = retry_after
+
+class UploadSchedulerDrainingError(Exception):
+    """服務正在關閉，不再接受新的上傳（應回應 503）"""
+
+class UploadBatch:
+    """
+    一個上傳請求的所有檔案
+
+    用 async with 包住整個請求，batch.run() 會等到拿到執行名額才開始處理檔案
+    """
+
+    def __init__(self, scheduler: "UploadScheduler", batch_id: int, size: int):
+        self._scheduler = scheduler
+        self.batch_id = batch_id
+        # 預留的佇列名額（建立 batch 時就佔用，避免通過檢查後又超過上限）
+        self.reserved = size
+        self.waiting: deque = deque()
+        self.running = 0
+
+    async def __aenter__(self) -> "UploadBatch":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        self._scheduler._close(self)
+
+    async def run(self, fn, *args, **kwargs):
+        """排隊等待執行名額，拿到後執行 await fn(*args, **kwargs)"""
+        scheduler = self._scheduler
+        loop = asyncio.get_running_loop()
+        slot = loop.create_future()
+        entry = (slot, time.monotonic())
+        self.waiting.append(entry)
+        if self.reserved > 0:
+            self.reserved -= 1
+        else:
+            scheduler._queued += 1
+        scheduler._dispatch()
+
+        try:
+            await slot
+        except asyncio.CancelledError:
+            if slot.done() and not slot.cancelled():
+                # 已經拿到名額才被取消，要把名額還回去
+                scheduler._release(self)
+            elif entry in self.waiting:
+                self.waiting.remove(entry)
+                scheduler._queued -= 1
+            raise
+
+        started = time.monotonic()
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            scheduler._record_duration(time.monotonic() - started)
+            scheduler._release(self)
+
+class UploadScheduler:
+    """
+    上傳排程器
+
+    - 專用的執行緒池：上傳不再佔用 asyncio.to_thread 的預設執行緒池，
+      delete_file 等其他操作不會被大批上傳卡住
+    - 全域並發上限（process 內同時上傳的檔案數）與每個請求的並發上限
+    - 多個請求之間輪流分配名額（round-robin），大批上傳不會讓小批上傳一直等
+    - 排隊中的檔案超過上限時直接拒絕，由 router 回應 429 + Retry-After
+    - 關閉時先 drain()：不再接受新的上傳，等進行中的上傳完成
+
+    執行緒池在第一次使用時才建立，多 worker 模式下每個 process 各自擁有一個
+    """
+
+    def __init__(self, max_workers: int, per_request_limit: int, max_queued: int):
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.max_workers = max_workers
+        self.global_limit = max_workers
+        self.per_request_limit = per_request_limit
+        self.max_queued = max_queued
+        self._batches: "OrderedDict[int, UploadBatch]" = OrderedDict()
+        self._batch_ids = count(1)
+        self._queued = 0
+        self._running = 0
+        # 統計數據
+        self._started = 0
+        self._completed = 0
+        self._rejected = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._total_duration = 0.0
+        self.draining = False
+        self._idle: Optional[asyncio.Event] = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="upload")
+        return self._executor
+
+    def queue_depth(self) -> int:
+        """執行緒池中排隊等待執行緒的工作數"""
+        return self._executor._work_queue.qsize() if self._executor else 0
+
+    def batch(self, size: int) -> UploadBatch:
+        """建立一個新的上傳 batch，佇列已滿時拋出 UploadQueueFullError，關閉中拋出 UploadSchedulerDrainingError"""
+        if self.draining:
+            raise UploadSchedulerDrainingError("服務正在關閉，請稍後再試")
+        if self._queued + size > self.max_queued:
+            self._rejected += 1
+            raise UploadQueueFullError(self._retry_after())
+        batch = UploadBatch(self, next(self._batch_ids), size)
+        self._queued += size
+        self._batches[batch.batch_id] = batch
+        return batch
+
+    def _retry_after(self) -> int:
+        """依目前排隊數量與平均上傳時間估計需要等多久（秒）"""
+        return self.estimate_wait(self._queued)
+
+    def estimate_wait(self, queued: int) -> int:
+        """依平均上傳時間估計 queued 個檔案上傳完需要多久（秒，至少 1）"""
+        average = self._total_duration / self._completed if self._completed else 1.0
+        return max(1, math.ceil(queued / self.global_limit * average))
+
+    def _dispatch(self) -> None:
+        """有空出的名額時，依 round-robin 順序分配給等待中的 batch"""
+        while self._running < self.global_limit:
+            picked = None
+            for batch in self._batches.values():
+                if batch.waiting and batch.running < self.per_request_limit:
+                    picked = batch
+                    break
+            if picked is None:
+                return
+            # 被選中的 batch 移到最後，下一個名額輪到其他 batch
+            self._batches.move_to_end(picked.batch_id)
+            slot, enqueued_at = picked.waiting.popleft()
+            self._queued -= 1
+            self._running += 1
+            picked.running += 1
+            wait = time.monotonic() - enqueued_at
+            self._started += 1
+            self._total_wait += wait
+            self._max_wait = max(self._max_wait, wait)
+            slot.set_result(None)
+
+    def _release(self, batch: UploadBatch) -> None:
+        self._running -= 1
+        batch.running -= 1
+        self._completed += 1
+        self._dispatch()
+        self._check_idle()
+
+    def _record_duration(self, seconds: float) -> None:
+        self._total_duration += seconds
+
+    def _close(self, batch: UploadBatch) -> None:
+        """請求結束：歸還沒用到的預留名額，取消還在排隊的檔案（例如其他檔案已失敗）"""
+        self._queued -= batch.reserved + len(batch.waiting)
+        batch.reserved = 0
+        for slot, _ in batch.waiting:
+            slot.cancel()
+        batch.waiting.clear()
+        self._batches.pop(batch.batch_id, None)
+        self._check_idle()
+
+    def _check_idle(self) -> None:
+        if self._idle is not None and not self._batches and self._running == 0:
+            self._idle.set()
+
+    async def drain(self, timeout: float) -> bool:
+        """
+        停止接受新的上傳，等待進行中的請求全部結束（最多 timeout 秒）
+
+        回傳是否在時間內全部完成；沒完成的上傳會在 shutdown 時被中斷
+        """
+        self.draining = True
+        self._idle = asyncio.Event()
+        self._check_idle()
+        if self._idle.is_set():
+            return True
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def stats(self) -> dict:
+        """佇列深度與等待時間"""
+        return {
+            "queued": self._queued,
+            "running": self._running,
+            "active_requests": len(self._batches),
+            "completed": self._completed,
+            "rejected": self._rejected,
+            "avg_wait_ms": round(self._total_wait / self._started * 1000, 2) if self._started else 0.0,
+            "max_wait_ms": round(self._max_wait * 1000, 2),
+            "global_limit": self.global_limit,
+            "per_request_limit": self.per_request_limit,
+            "max_queued": self.max_queued,
+            "draining": self.draining,
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+# 建立全域實例
+upload_scheduler = UploadScheduler(
+    max_workers=settings.upload_max_workers,
+    per_request_limit=settings.upload_per_request_limit,
+    max_queued=settings.upload_max_queued
+)
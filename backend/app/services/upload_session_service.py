@@ -0,0 +1,223 @@
+from app.config import settings
+from bson import ObjectId
+from pymongo import ReturnDocument
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Optional
+import asyncio
+import os
+import shutil
+import time
+import uuid
+
+# 上傳階段狀態
+SESSION_UPLOADING = "uploading"
+SESSION_FINALIZING = "finalizing"
+SESSION_COMPLETED = "completed"
+
+# finalize 超過這個時間還沒完成（例如 process 當掉）就允許重新 finalize（秒）
+FINALIZE_STALE_SECONDS = 600
+
+# 最多每隔多久清理一次過期的上傳階段（秒）
+SWEEP_INTERVAL_SECONDS = 300
+
+# PATCH 寫入的租約（秒）；寫入中每隔 WRITE_LEASE_SECONDS / 3 延長一次，process 當掉時租約過期後可以續傳
+WRITE_LEASE_SECONDS = 60
+
+class UploadOffsetMismatchError(Exception):
+    """PATCH 的起始位置與目前已收到的大小不同（應回應 409，客戶端以 HEAD 取得正確位置）"""
+
+    def __init__(self, offset: int):
+        super().__init__(f"目前已收到 {offset} bytes")
+        self.offset = offset
+
+class UploadTooLargeError(Exception):
+    """收到的內容超過宣告的檔案大小"""
+    pass
+
+class UploadBusyError(Exception):
+    """另一個 PATCH 正在寫入同一個上傳階段（可能在其他 worker process）"""
+    pass
+
+class UploadNotWritableError(Exception):
+    """上傳階段已經完成或正在 finalize，不能再附加內容"""
+    pass
+
+class UploadSessionService:
+    """
+    可續傳上傳（tus 風格）
+
+    - 建立上傳階段：記錄檔名、類型與總大小，檔案內容存在 RESUMABLE_UPLOAD_DIR/{upload_id}
+    - PATCH：從指定位置附加內容；連線中斷時已寫入的部分會保留，客戶端以 HEAD 取得目前位置後續傳
+    - 目前位置（offset）記在 MongoDB 的上傳階段文件：PATCH 以 find_one_and_update 原子地認領
+      「offset 等於 Upload-Offset 且沒有其他寫入」的上傳階段，寫完（或中斷）後才更新 offset 並釋放，
+      同時送到不同 worker process 的 PATCH 只有一個會寫入
+    - 過期（RESUMABLE_UPLOAD_EXPIRES_SECONDS）的上傳階段與檔案會被清理
+
+    檔案存在本機磁碟，多個 worker process 要共用同一個目錄；
+    多台主機時要讓同一個上傳階段的請求送到同一台（或使用共用的 volume）
+    """
+
+    def __init__(self):
+        self._last_sweep = 0.0
+
+    def path_for(self, session: dict) -> str:
+        return os.path.join(settings.resumable_upload_dir, str(session["_id"]), "data")
+
+    def offset_of(self, session: dict) -> int:
+        """目前已收到的大小"""
+        if session["status"] == SESSION_COMPLETED:
+            return session["size"]
+        return session.get("offset", 0)
+
+    async def create(self, db, star_id: str, filename: str, content_type: str, size: int) -> dict:
+        """建立上傳階段與空的資料檔"""
+        await self.sweep(db)
+        now = datetime.utcnow()
+        session = {
+            "star_id": ObjectId(star_id),
+            "filename": filename,
+            "content_type": content_type,
+            "size": size,
+            "status": SESSION_UPLOADING,
+            "offset": 0,
+            "writing_until": None,
+            "image_id": None,
+            "created_at": now,
+            "expires_at": now + timedelta(seconds=settings.resumable_upload_expires_seconds),
+        }
+        result = await db.upload_sessions.insert_one(session)
+        session["_id"] = result.inserted_id
+        path = self.path_for(session)
+        await asyncio.to_thread(os.makedirs, os.path.dirname(path), exist_ok=True)
+        await asyncio.to_thread(lambda: open(path, "wb").close())
+        return session
+
+    async def get(self, db, star_id: str, upload_id: str) -> Optional[dict]:
+        """取得上傳階段（不存在、不屬於這個明星或已過期時回傳 None）"""
+        if not ObjectId.is_valid(upload_id):
+            return None
+        session = await db.upload_sessions.find_one({"_id": ObjectId(upload_id), "star_id": ObjectId(star_id)})
+        if not session or session["expires_at"] < datetime.utcnow():
+            return None
+        return session
+
+    async def append(self, db, session: dict, offset: int, chunks: AsyncIterator[bytes]) -> int:
+        """
+        從 offset 開始附加內容，回傳新的位置
+
+        offset 必須等於目前已收到的大小；串流中途中斷時已寫入的部分會保留。
+        寫入前先在 MongoDB 認領這個上傳階段，沒有認領到時拋出
+        UploadOffsetMismatchError（位置不符）、UploadBusyError 或 UploadNotWritableError
+        """
+        token = uuid.uuid4().hex
+        now = datetime.utcnow()
+        claimed = await db.upload_sessions.find_one_and_update(
+            {
+                "_id": session["_id"],
+                "status": SESSION_UPLOADING,
+                "offset": offset,
+                "$or": [{"writing_until": None}, {"writing_until": {"$lt": now}}]
+            },
+            {"$set": {"writing_until": now + timedelta(seconds=WRITE_LEASE_SECONDS), "write_token": token}},
+            return_document=ReturnDocument.AFTER
+        )
+        if claimed is None:
+            current = await db.upload_sessions.find_one({"_id": session["_id"]})
+            if current is None or current["status"] != SESSION_UPLOADING:
+                raise UploadNotWritableError("上傳已經完成或正在處理中")
+            if current.get("offset", 0) != offset:
+                raise UploadOffsetMismatchError(current.get("offset", 0))
+            raise UploadBusyError("另一個請求正在寫入這個上傳")
+
+        current = offset
+        renewed_at = time.monotonic()
+        lost = False
+        # 上次寫入中斷（process 當掉）時檔案可能比記錄的位置長，先截掉沒有記錄的部分
+        out = await asyncio.to_thread(open, self.path_for(session), "r+b")
+        try:
+            await asyncio.to_thread(out.truncate, offset)
+            await asyncio.to_thread(out.seek, offset)
+            async for chunk in chunks:
+                if not chunk:
+                    continue
+                if current + len(chunk) > session["size"]:
+                    raise UploadTooLargeError(f"內容超過宣告的大小 {session['size']} bytes")
+                if time.monotonic() - renewed_at > WRITE_LEASE_SECONDS / 3:
+                    renewed_at = time.monotonic()
+                    result = await db.upload_sessions.update_one(
+                        {"_id": session["_id"], "write_token": token},
+                        {"$set": {"writing_until": datetime.utcnow() + timedelta(seconds=WRITE_LEASE_SECONDS)}}
+                    )
+                    if result.modified_count == 0:
+                        # 租約已過期並被其他請求認領，停止寫入
+                        lost = True
+                        raise UploadBusyError("寫入時間過長，上傳已被其他請求接手")
+                await asyncio.to_thread(out.write, chunk)
+                current += len(chunk)
+        finally:
+            await asyncio.to_thread(out.close)
+            if not lost:
+                # 中斷或失敗時也記錄已寫入的部分，客戶端從這裡續傳
+                await db.upload_sessions.update_one(
+                    {"_id": session["_id"], "write_token": token},
+                    {"$set": {"offset": current, "writing_until": None}, "$unset": {"write_token": ""}}
+                )
+        return current
+
+    async def claim_finalize(self, db, session: dict) -> bool:
+        """原子地把上傳階段標記為處理中，同時送出的 finalize 只有一個會成功"""
+        now = datetime.utcnow()
+        result = await db.upload_sessions.update_one(
+            {
+                "_id": session["_id"],
+                "offset": session["size"],
+                "$or": [
+                    {"status": SESSION_UPLOADING},
+                    {"status": SESSION_FINALIZING,
+                     "finalizing_at": {"$lt": now - timedelta(seconds=FINALIZE_STALE_SECONDS)}}
+                ]
+            },
+            {"$set": {"status": SESSION_FINALIZING, "finalizing_at": now}}
+        )
+        return result.modified_count == 1
+
+    async def release_finalize(self, db, session: dict) -> None:
+        """finalize 失敗：放回上傳中，檔案保留，客戶端可以重新 finalize"""
+        await db.upload_sessions.update_one(
+            {"_id": session["_id"], "status": SESSION_FINALIZING},
+            {"$set": {"status": SESSION_UPLOADING}}
+        )
+
+    async def complete(self, db, session: dict, image_id: str) -> None:
+        """交給儲存空間上傳完成：記錄圖片 ID 並刪除暫存的檔案（重送 finalize 時回傳同一張圖片）"""
+        await db.upload_sessions.update_one(
+            {"_id": session["_id"]},
+            {"$set": {"status": SESSION_COMPLETED, "image_id": image_id}}
+        )
+        await self._remove_files(session["_id"])
+
+    async def delete(self, db, session: dict) -> None:
+        """取消上傳"""
+        await db.upload_sessions.delete_one({"_id": session["_id"]})
+        await self._remove_files(session["_id"])
+
+    async def _remove_files(self, upload_id) -> None:
+        await asyncio.to_thread(shutil.rmtree, os.path.join(settings.resumable_upload_dir, str(upload_id)), True)
+
+    async def sweep(self, db, force: bool = False) -> int:
+        """刪除過期的上傳階段與檔案（最多每 SWEEP_INTERVAL_SECONDS 秒執行一次），回傳刪除的數量"""
+        if not force and time.monotonic() - self._last_sweep < SWEEP_INTERVAL_SECONDS:
+            return 0
+        self._last_sweep = time.monotonic()
+        expired = await db.upload_sessions.find(
+            {"expires_at": {"$lt": datetime.utcnow()}}, {"_id": 1}
+        ).to_list(length=None)
+        for session in expired:
+            await self._remove_files(session["_id"])
+        if expired:
+            await db.upload_sessions.delete_many({"_id": {"$in": [session["_id"] for session in expired]}})
+            print(f"🧹 已清理 {len(expired)} 個過期的上傳階段")
+        return len(expired)
+
+# 建立全域實例
+upload_session_service = UploadSessionService()
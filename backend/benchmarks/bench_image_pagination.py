@@ -0,0 +1,103 @@
+"""
+圖片分頁效能測試：skip/limit 分頁 vs keyset（游標）分頁
+
+比較 page 1 與 page 500 在兩種模式下的回應時間。
+需要一個可連線的 MongoDB（例如 docker-compose 中的 mongodb），
+測試資料會寫入獨立的 benchmark 資料庫，結束後整個刪除。
+
+使用方式（在 backend 目錄下執行）：
+    BENCH_MONGODB_URI=mongodb://localhost:27017/kpop_gallery_bench \\
+        python -m benchmarks.bench_image_pagination --images 20000 --limit 20
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from app.config import settings
+from app.database import connect_to_mongo, close_mongo_connection, get_database
+from app.routers.images import load_star_images
+
+DEFAULT_URI = "mongodb://localhost:27017/kpop_gallery_bench"
+
+async def seed(db, image_count: int) -> str:
+    """建立一個測試明星與 image_count 張圖片，回傳 star_id"""
+    star = await db.stars.insert_one({"name": "bench-star", "created_at": datetime.utcnow()})
+    star_id = star.inserted_id
+    base = datetime.utcnow()
+    batch = []
+    for i in range(image_count):
+        batch.append({
+            "star_id": star_id,
+            "s3_key": f"kpop_gallery/stars/{star_id}/bench_{i}",
+            "s3_url": f"https://example.com/bench_{i}.jpg",
+            "filename": f"bench_{i}.jpg",
+            "file_size": 1024,
+            "mime_type": "image/jpeg",
+            # 每 10 張共用同一個時間，確保游標的 _id 次要排序有被測到
+            "uploaded_at": base - timedelta(seconds=i // 10)
+        })
+        if len(batch) == 5000:
+            await db.images.insert_many(batch)
+            batch = []
+    if batch:
+        await db.images.insert_many(batch)
+    return str(star_id)
+
+async def timed(repeat: int, **kwargs) -> list:
+    """重複呼叫 load_star_images（不經過回應快取），回傳每次的耗時（毫秒）"""
+    db = get_database()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await load_star_images(db, **kwargs)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+async def cursor_for_page(star_id: str, page: int, limit: int):
+    """沿著 X-Next-Cursor 走到指定頁數，回傳該頁的游標"""
+    cursor = None
+    for _ in range(page - 1):
+        _, cursor = await load_star_images(get_database(), star_id=star_id, limit=limit, cursor=cursor)
+        if cursor is None:
+            raise SystemExit(f"圖片數量不足 {page} 頁，請增加 --images")
+    return cursor
+
+def report(label: str, samples: list) -> None:
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{label:<22} median={statistics.median(samples):8.2f}ms  p95={p95:8.2f}ms")
+
+async def database_cleanup(db):
+    """刪除整個 benchmark 資料庫"""
+    await db.client.drop_database(db.name)
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=20000)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--deep-page", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    settings.mongodb_uri = os.environ.get("BENCH_MONGODB_URI", DEFAULT_URI)
+    await connect_to_mongo()
+    db = get_database()
+    try:
+        star_id = await seed(db, args.images)
+        deep_cursor = await cursor_for_page(star_id, args.deep_page, args.limit)
+
+        report("page  mode, page 1", await timed(args.repeat, star_id=star_id, page=1, limit=args.limit))
+        report(f"page  mode, page {args.deep_page}",
+               await timed(args.repeat, star_id=star_id, page=args.deep_page, limit=args.limit))
+        report("cursor mode, page 1", await timed(args.repeat, star_id=star_id, limit=args.limit))
+        report(f"cursor mode, page {args.deep_page}",
+               await timed(args.repeat, star_id=star_id, limit=args.limit, cursor=deep_cursor))
+    finally:
+        await database_cleanup(db)
+        await close_mongo_connection()
+
+if __name__ == "__main__":
+    asyncio.run(main())
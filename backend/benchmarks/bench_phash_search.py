@@ -0,0 +1,52 @@
+"""
+近似重複圖片搜尋效能測試（感知雜湊 + 向量化 Hamming 距離）
+
+在單一明星的索引中放入 50k 個 64-bit dHash，其中一部分是某張圖片的
+近似版本（翻轉少數 bits），量測 find_similar 的延遲。不需要 MongoDB。
+
+使用方式（在 backend 目錄下執行）：
+    python -m benchmarks.bench_phash_search --images 50000
+"""
+import argparse
+import random
+import statistics
+import time
+
+from app.services.phash_service import _StarHashes
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=50000)
+    parser.add_argument("--near-duplicates", type=int, default=50)
+    parser.add_argument("--max-distance", type=int, default=10)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    hashes = _StarHashes()
+    query = rng.getrandbits(64)
+    for i in range(args.images - args.near_duplicates):
+        hashes.add(f"img{i}", rng.getrandbits(64))
+    # 近似重複：從 query 翻轉 0~8 個 bits
+    for i in range(args.near_duplicates):
+        value = query
+        for bit in rng.sample(range(64), rng.randint(0, 8)):
+            value ^= 1 << bit
+        hashes.add(f"near{i}", value)
+
+    samples = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        results = hashes.search(query, args.max_distance, args.limit, exclude=None)
+        samples.append((time.perf_counter() - start) * 1000)
+
+    samples.sort()
+    p99 = samples[int(len(samples) * 0.99) - 1]
+    found = sum(1 for image_id, _ in results if image_id.startswith("near"))
+    print(f"{args.images} 張圖片，找到 {len(results)} 筆（其中 {found} 筆為近似重複）")
+    print(f"find_similar median={statistics.median(samples):.3f}ms  p99={p99:.3f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+上傳前處理效能測試：原始檔案直接上傳 vs 前處理後上傳
+
+產生一批類似手機照片的 JPEG（4032x3024、帶 EXIF 方向與 GPS），
+模擬一個批次上傳請求（同時上傳數與 UPLOAD_PER_REQUEST_LIMIT 相同），比較：
+- 上傳的總位元組數
+- 整批完成的時間（上傳以 --bandwidth-mbps 模擬到儲存服務的頻寬，同一批的檔案共用頻寬）
+- 前處理各階段（read / decode / orient / resize / encode）的平均耗時
+
+前處理使用與 API 相同的 preprocess_service（ProcessPoolExecutor），不會連到儲存服務。
+
+使用方式（在 backend 目錄下執行）：
+    python -m benchmarks.bench_preprocess --files 12 --bandwidth-mbps 20 100
+"""
+import argparse
+import asyncio
+import io
+import time
+
+import numpy as np
+from PIL import Image
+
+from app.config import settings
+from app.services.preprocess_service import preprocess_service
+
+def make_photo(seed: int) -> bytes:
+    """產生一張類似手機照片的 JPEG（漸層 + 雜訊，EXIF 方向 = 6，含 GPS 資訊）"""
+    rng = np.random.default_rng(seed)
+    height, width = 3024, 4032
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    x = np.linspace(0, 255, width, dtype=np.float32)[None, :]
+    base = np.stack([(x + y) / 2, np.broadcast_to(x, (height, width)), np.broadcast_to(y, (height, width))], axis=-1)
+    pixels = np.clip(base + rng.normal(0, 12, (height, width, 3)), 0, 255).astype(np.uint8)
+    image = Image.fromarray(pixels, "RGB")
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation：需要旋轉 90 度
+    exif[0x8825] = {1: "N", 2: (25.0, 2.0, 0.0), 3: "E", 4: (121.0, 33.0, 0.0)}  # GPSInfo
+    out = io.BytesIO()
+    image.save(out, "JPEG", quality=92, exif=exif)
+    return out.getvalue()
+
+# 模擬上傳時每次送出的大小
+SEND_CHUNK_SIZE = 256 * 1024
+
+async def simulated_upload(size: int, bandwidth: float, link: asyncio.Lock) -> None:
+    """以固定頻寬模擬上傳到儲存服務（逐塊送出，同時上傳的檔案輪流使用同一條連線）"""
+    for offset in range(0, size, SEND_CHUNK_SIZE):
+        async with link:
+            await asyncio.sleep(min(SEND_CHUNK_SIZE, size - offset) / bandwidth)
+
+async def run_batch(photos: list, bandwidth: float, concurrency: int, preprocess: bool) -> tuple:
+    """回傳 (上傳總位元組數, 整批耗時秒數)"""
+    semaphore = asyncio.Semaphore(concurrency)
+    link = asyncio.Lock()
+    uploaded = 0
+
+    async def process(data: bytes) -> None:
+        nonlocal uploaded
+        async with semaphore:
+            size = len(data)
+            if preprocess:
+                result = await preprocess_service.preprocess(io.BytesIO(data), "image/jpeg")
+                if result.changed:
+                    size = len(result.data)
+            uploaded += size
+            await simulated_upload(size, bandwidth, link)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(process(data) for data in photos))
+    return uploaded, time.perf_counter() - started
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=12)
+    parser.add_argument("--bandwidth-mbps", type=float, nargs="+", default=[20.0, 100.0], help="到儲存服務的上傳頻寬（Mbps）")
+    parser.add_argument("--max-dimension", type=int, default=settings.preprocess_max_dimension)
+    parser.add_argument("--format", choices=["webp", "jpeg"], default=settings.preprocess_format)
+    args = parser.parse_args()
+
+    settings.image_preprocess = True
+    settings.preprocess_max_dimension = args.max_dimension
+    settings.preprocess_format = args.format
+    concurrency = settings.upload_per_request_limit
+
+    photos = [make_photo(i) for i in range(args.files)]
+    print(f"{args.files} 張照片，平均 {sum(map(len, photos)) / len(photos) / 1024 / 1024:.2f}MB，"
+          f"同時上傳 {concurrency} 個，前處理 worker {preprocess_service.workers} 個")
+
+    # 先啟動 process pool，避免把 spawn 子 process 的時間算進結果
+    await preprocess_service.preprocess(io.BytesIO(photos[0]), "image/jpeg")
+    preprocess_service._stage_totals.clear()
+    preprocess_service._processed = preprocess_service._unchanged = 0
+
+    try:
+        for mbps in args.bandwidth_mbps:
+            bandwidth = mbps * 1_000_000 / 8
+            for label, preprocess in (("original", False), ("preprocessed", True)):
+                uploaded, elapsed = await run_batch(photos, bandwidth, concurrency, preprocess)
+                print(f"{mbps:6.0f}Mbps  {label:<13} uploaded={uploaded / 1024 / 1024:8.2f}MB  batch={elapsed:6.2f}s")
+        print("各階段平均耗時（ms）:", preprocess_service.stats()["avg_stage_ms"])
+    finally:
+        preprocess_service.shutdown()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,99 @@
+"""
+圖片列表序列化效能測試：Pydantic 模型路徑 vs 精簡讀取路徑
+
+比較一頁圖片從「MongoDB 回傳的 BSON」到「HTTP 回應的 JSON bytes」的 CPU 時間：
+- model：讀取完整文件 -> 每筆建立 ImageResponse -> FastAPI 依 response_model 驗證並序列化
+- lean：只投影回應需要的欄位 -> 每筆直接轉成 dict -> orjson 一次序列化
+
+BSON 解碼也算在內（driver 解碼完整文件與投影後文件的差異），不需要連線 MongoDB。
+
+使用方式（在 backend 目錄下執行）：
+    python -m benchmarks.bench_serialization --rows 20 100 500
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import bson
+from bson import ObjectId
+from fastapi.routing import APIRoute, serialize_response
+
+from app.routers.images import IMAGE_PROJECTION, get_star_images, image_to_response, image_to_row
+from app.serialization import dumps
+
+def make_documents(count: int) -> list:
+    """產生 count 筆與 images collection 相同形狀的完整文件"""
+    star_id = ObjectId()
+    base = datetime.utcnow()
+    documents = []
+    for i in range(count):
+        public_id = f"kpop_gallery/stars/{star_id}/{os.urandom(16).hex()}_photo_{i}"
+        documents.append({
+            "_id": ObjectId(),
+            "star_id": star_id,
+            "s3_key": public_id,
+            "s3_url": f"https://res.cloudinary.com/bench/image/upload/v1/{public_id}.jpg",
+            "filename": f"photo_{i}.jpg",
+            "file_size": 1024 * 1024 + i,
+            "mime_type": "image/jpeg",
+            "content_hash": os.urandom(32).hex(),
+            "phash": os.urandom(8).hex(),
+            "uploaded_at": base - timedelta(seconds=i)
+        })
+    return documents
+
+def encode_batch(documents: list, projection: dict = None) -> bytes:
+    """模擬 MongoDB 回傳的 BSON（有投影時只保留投影欄位與 _id）"""
+    if projection:
+        documents = [{k: v for k, v in doc.items() if k == "_id" or k in projection} for doc in documents]
+    return b"".join(bson.encode(doc) for doc in documents)
+
+def response_field():
+    """取得 get_star_images 的 response_model 欄位（FastAPI 驗證與序列化用）"""
+    from app.routers.images import router
+    for route in router.routes:
+        if isinstance(route, APIRoute) and route.endpoint is get_star_images:
+            return route.response_field
+    raise RuntimeError("找不到 get_star_images 路由")
+
+async def model_path(raw: bytes, field) -> bytes:
+    documents = bson.decode_all(raw)
+    models = [image_to_response(doc) for doc in documents]
+    return await serialize_response(field=field, response_content=models, dump_json=True)
+
+async def lean_path(raw: bytes, field) -> bytes:
+    documents = bson.decode_all(raw)
+    return dumps([image_to_row(doc) for doc in documents])
+
+async def timed(path, raw: bytes, field, repeat: int) -> list:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await path(raw, field)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[20, 100, 500])
+    parser.add_argument("--repeat", type=int, default=500)
+    args = parser.parse_args()
+
+    field = response_field()
+    for rows in args.rows:
+        documents = make_documents(rows)
+        full = encode_batch(documents)
+        projected = encode_batch(documents, IMAGE_PROJECTION)
+        # 兩種路徑輸出的 JSON 必須完全相同
+        assert await model_path(full, field) == await lean_path(projected, field)
+
+        model = statistics.median(await timed(model_path, full, field, args.repeat))
+        lean = statistics.median(await timed(lean_path, projected, field, args.repeat))
+        print(f"{rows:>4} 筆  model={model:7.3f}ms  lean={lean:7.3f}ms  "
+              f"x{model / lean:4.1f}  BSON {len(full) / 1024:7.1f}KB -> {len(projected) / 1024:7.1f}KB")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,71 @@
+"""
+明星搜尋索引效能測試（typeahead）
+
+在記憶體中建立 100k 筆明星名字，量測 star_search_service.search()
+對前綴、子字串、單一字元與不存在的查詢的延遲。不需要 MongoDB。
+
+使用方式（在 backend 目錄下執行）：
+    python -m benchmarks.bench_star_search --stars 100000
+"""
+import argparse
+import random
+import statistics
+import string
+import time
+from datetime import datetime
+
+from app.services.star_search_service import StarSearchService
+
+SYLLABLES = ["ji", "min", "soo", "yeon", "na", "eun", "ha", "jung", "kook", "tae",
+             "hyun", "seo", "yoon", "woo", "lisa", "rose", "jen", "nie", "won", "young"]
+
+def random_name(rng: random.Random) -> str:
+    given = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).capitalize()
+    family = rng.choice(["Kim", "Lee", "Park", "Choi", "Jung", "Kang", "Cho", "Yoon", "Jang", "Lim"])
+    suffix = "".join(rng.choice(string.ascii_lowercase) for _ in range(3))
+    return f"{family} {given} {suffix}"
+
+def build(star_count: int, seed: int) -> StarSearchService:
+    rng = random.Random(seed)
+    index = StarSearchService()
+    now = datetime.utcnow()
+    for i in range(star_count):
+        index._index(f"{i:024x}", random_name(rng), now)
+    index._sorted.sort()
+    return index
+
+def report(label: str, samples: list) -> None:
+    samples = sorted(samples)
+    p99 = samples[int(len(samples) * 0.99) - 1]
+    print(f"{label:<28} median={statistics.median(samples) * 1000:7.1f}µs  p99={p99 * 1000:7.1f}µs")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stars", type=int, default=100000)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = build(args.stars, args.seed)
+    print(f"建立索引：{args.stars} 筆，{time.perf_counter() - start:.2f}s")
+
+    queries = {
+        "prefix (1 char)": "k",
+        "prefix (family name)": "kim",
+        "prefix (full word)": "kim jimin",
+        "substring (common)": "min",
+        "substring (rare)": "kookrose",
+        "no match": "zzzz",
+    }
+    for label, query in queries.items():
+        samples = []
+        for _ in range(args.repeat):
+            t = time.perf_counter()
+            index.search(query, limit=args.limit)
+            samples.append((time.perf_counter() - t) * 1000)
+        report(f"{label} '{query}'", samples)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+上傳路徑記憶體效能測試：整檔讀入 vs 串流上傳
+
+模擬一個批次上傳請求（預設 20 個 10MB 檔案，並發上傳），
+用 tracemalloc 量測 Python 端的記憶體峰值：
+- buffered：舊的做法，await file.read() + io.BytesIO + SDK 組出完整 multipart 內容
+- streaming：CloudinaryService._upload_file_sync 從暫存檔逐塊串流
+
+HTTP 請求由一個只會把內容讀完丟掉的假連線池處理，不會真的連到 Cloudinary。
+
+使用方式（在 backend 目錄下執行）：
+    python -m benchmarks.bench_upload_memory --files 20 --size-mb 10
+"""
+import argparse
+import io
+import json
+import os
+import tempfile
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import cloudinary
+import urllib3
+
+from app.services.cloudinary_service import CloudinaryService
+
+# 與 Starlette multipart 解析相同：超過 1MB 的檔案寫到磁碟
+SPOOL_MAX_SIZE = 1024 * 1024
+
+class _SinkResponse:
+    data = json.dumps({"secure_url": "https://example.com/bench.jpg"}).encode()
+
+class SinkPoolManager:
+    """假的 urllib3 連線池：把請求內容讀完後丟棄"""
+
+    def request(self, method, url, body=None, headers=None, **kwargs):
+        if isinstance(body, (bytes, bytearray)):
+            return _SinkResponse()
+        for _ in body:
+            pass
+        return _SinkResponse()
+
+def make_upload_files(count: int, size: int) -> list:
+    """建立 count 個與 UploadFile.file 相同型態的暫存檔"""
+    files = []
+    block = os.urandom(1024 * 1024)
+    for _ in range(count):
+        spooled = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        for _ in range(size // len(block)):
+            spooled.write(block)
+        spooled.seek(0)
+        files.append(spooled)
+    return files
+
+def upload_buffered(file_obj, public_id: str) -> None:
+    """舊的上傳路徑：整檔讀入記憶體，再交給 SDK 組成 multipart 內容"""
+    file_content = file_obj.read()
+    wrapped = io.BytesIO(file_content)
+    body, _ = urllib3.encode_multipart_formdata([
+        ("public_id", public_id),
+        ("file", ("stream", wrapped.read()))
+    ])
+    SinkPoolManager().request("POST", "https://example.com", body=body)
+
+def measure(label: str, upload, files: list, workers: int) -> None:
+    for f in files:
+        f.seek(0)
+    tracemalloc.start()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(lambda item: upload(item[1], f"bench/{item[0]}"), enumerate(files)))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<10} peak={peak / 1024 / 1024:8.2f} MB")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--size-mb", type=int, default=10)
+    args = parser.parse_args()
+
+    cloudinary.config(cloud_name="bench", api_key="bench", api_secret="bench")
+    service = CloudinaryService()
+    service._http = SinkPoolManager()
+
+    files = make_upload_files(args.files, args.size_mb * 1024 * 1024)
+    print(f"{args.files} 個檔案 × {args.size_mb}MB，並發上傳")
+    measure("buffered", upload_buffered, files, args.files)
+    measure("streaming", lambda f, pid: service._upload_file_sync(f, pid, "image/jpeg"), files, args.files)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+多 worker 擴展性測試：1 / 2 / 4 / 8 個 uvicorn worker 的吞吐量
+
+每個 worker 數都啟動一次真正的 uvicorn（--workers N），由多個負載產生 process 同時送出請求：
+- GET /api/stars（整個明星列表，JSON 編碼為主）
+- GET /api/stars/{id}/images（一頁圖片）
+- POST /api/stars/{id}/images/upload（小張 JPEG 的 multipart 上傳，比例由 --upload-ratio 決定）
+
+回應快取關閉，每個請求都會查詢 MongoDB 並重新編碼；儲存後端使用暫存目錄中的 local 後端。
+需要一個可連線的 MongoDB，測試資料會寫入獨立的 benchmark 資料庫，結束後整個刪除。
+負載產生 process 與 server 在同一台機器上，CPU 核心數要夠多才看得出擴展性。
+
+使用方式（在 backend 目錄下執行）：
+    BENCH_MONGODB_URI=mongodb://localhost:27017/kpop_gallery_bench \\
+        python -m benchmarks.bench_workers --workers 1 2 4 8 --duration 15 --concurrency 64
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import httpx
+from PIL import Image
+from pymongo import MongoClient
+
+from app.database import database_name
+
+DEFAULT_URI = "mongodb://localhost:27017/kpop_gallery_bench"
+
+def seed(uri: str, star_count: int, images_per_star: int) -> list:
+    """建立 star_count 個明星，每個 images_per_star 張圖片，回傳 star_id 清單"""
+    db = MongoClient(uri)[database_name(uri)]
+    now = datetime.utcnow()
+    stars = [
+        {"name": f"bench star {i}", "created_at": now - timedelta(seconds=i), "image_count": images_per_star,
+         "total_bytes": images_per_star * 1024, "last_uploaded_at": now, "cover_image": None}
+        for i in range(star_count)
+    ]
+    star_ids = db.stars.insert_many(stars).inserted_ids
+    images = [
+        {"star_id": star_id, "s3_key": f"bench/{star_id}/{i}", "s3_url": f"https://example.com/{star_id}/{i}.jpg",
+         "filename": f"{i}.jpg", "file_size": 1024, "mime_type": "image/jpeg", "uploaded_at": now - timedelta(seconds=i),
+         "variants": [], "width": 800, "height": 1200, "aspect_ratio": 0.6667, "dominant_color": "#808080"}
+        for star_id in star_ids for i in range(images_per_star)
+    ]
+    if images:
+        db.images.insert_many(images)
+    return [str(star_id) for star_id in star_ids]
+
+def drop(uri: str) -> None:
+    MongoClient(uri).drop_database(database_name(uri))
+
+def start_server(workers: int, port: int, uri: str, storage_dir: str) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "MONGODB_URI": uri,
+        "STORAGE_BACKEND": "local",
+        "LOCAL_STORAGE_DIR": storage_dir,
+        "PUBLIC_BASE_URL": f"http://127.0.0.1:{port}",
+        "RESPONSE_CACHE_ENABLED": "false",
+        "IMAGE_EAGER_VARIANTS": "false",
+        "WEB_CONCURRENCY": str(workers),
+    }
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+        env=env
+    )
+
+def wait_ready(base_url: str, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/api/health", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit("server 沒有在時間內啟動")
+
+def stop_server(server: subprocess.Popen) -> None:
+    server.send_signal(signal.SIGTERM)
+    try:
+        server.wait(timeout=60)
+    except subprocess.TimeoutExpired:
+        server.kill()
+
+def make_jpeg() -> bytes:
+    out = io.BytesIO()
+    Image.frombytes("RGB", (64, 64), os.urandom(64 * 64 * 3)).save(out, "JPEG", quality=85)
+    return out.getvalue()
+
+async def _client_loop(base_url: str, duration: float, concurrency: int, star_ids: list,
+                       upload_ratio: float, seed_value: int) -> dict:
+    rng = random.Random(seed_value)
+    jpeg = make_jpeg()
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + duration
+
+    async def worker(client: httpx.AsyncClient) -> None:
+        nonlocal errors
+        while time.monotonic() < deadline:
+            star_id = rng.choice(star_ids)
+            roll = rng.random()
+            started = time.perf_counter()
+            try:
+                if roll < upload_ratio:
+                    # 結尾加上隨機位元組，內容去重不會略過上傳
+                    response = await client.post(
+                        f"/api/stars/{star_id}/images/upload",
+                        files=[("files", ("bench.jpg", jpeg + os.urandom(16), "image/jpeg"))]
+                    )
+                elif roll < upload_ratio + (1 - upload_ratio) / 2:
+                    response = await client.get("/api/stars")
+                else:
+                    response = await client.get(f"/api/stars/{star_id}/images", params={"limit": 50})
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            latencies.append((time.perf_counter() - started) * 1000)
+            errors += failed
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=30, limits=limits) as client:
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+    return {"latencies": latencies, "errors": errors}
+
+def client_process(*args) -> dict:
+    """一個負載產生 process（各自有自己的 event loop）"""
+    return asyncio.run(_client_loop(*args))
+
+def percentile(samples: list, p: float) -> float:
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+def run_load(base_url: str, args, star_ids: list) -> dict:
+    per_client = max(1, args.concurrency // args.clients)
+    with ProcessPoolExecutor(max_workers=args.clients) as pool:
+        futures = [
+            pool.submit(client_process, base_url, args.duration, per_client, star_ids, args.upload_ratio, i)
+            for i in range(args.clients)
+        ]
+        results = [future.result() for future in futures]
+    latencies = sorted(sample for result in results for sample in result["latencies"])
+    return {
+        "requests": len(latencies),
+        "errors": sum(result["errors"] for result in results),
+        "throughput_rps": round(len(latencies) / args.duration, 1),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--duration", type=float, default=15.0, help="每個 worker 數的量測秒數")
+    parser.add_argument("--warmup", type=float, default=3.0)
+    parser.add_argument("--concurrency", type=int, default=64, help="所有負載產生 process 合計的並發連線數")
+    parser.add_argument("--clients", type=int, default=max(1, (os.cpu_count() or 2) // 2), help="負載產生 process 數")
+    parser.add_argument("--stars", type=int, default=200)
+    parser.add_argument("--images-per-star", type=int, default=100)
+    parser.add_argument("--upload-ratio", type=float, default=0.1)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--output", help="把結果寫成 JSON")
+    args = parser.parse_args()
+
+    uri = os.environ.get("BENCH_MONGODB_URI", DEFAULT_URI)
+    base_url = f"http://127.0.0.1:{args.port}"
+    star_ids = seed(uri, args.stars, args.images_per_star)
+    results = []
+    print(f"CPU 核心數 {os.cpu_count()}，負載產生 process {args.clients} 個，並發連線 {args.concurrency}")
+    try:
+        for workers in args.workers:
+            with tempfile.TemporaryDirectory() as storage_dir:
+                server = start_server(workers, args.port, uri, storage_dir)
+                try:
+                    wait_ready(base_url)
+                    warmup = argparse.Namespace(**{**vars(args), "duration": args.warmup})
+                    run_load(base_url, warmup, star_ids)
+                    result = {"workers": workers, **run_load(base_url, args, star_ids)}
+                finally:
+                    stop_server(server)
+            baseline = results[0]["throughput_rps"] if results else result["throughput_rps"]
+            result["speedup"] = round(result["throughput_rps"] / baseline, 2) if baseline else 0.0
+            results.append(result)
+            print(f"workers={workers:<3} {result['throughput_rps']:>9.1f} req/s  x{result['speedup']:<5}  "
+                  f"p50={result['p50_ms']:8.2f}ms  p95={result['p95_ms']:8.2f}ms  p99={result['p99_ms']:8.2f}ms  "
+                  f"errors={result['errors']}")
+    finally:
+        drop(uri)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"cpu_count": os.cpu_count(), "args": vars(args), "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+測試用的假儲存後端與記憶體內 MongoDB
+
+- FakeStorageBackend：不連網路，可設定延遲與錯誤率（模擬 Cloudinary 變慢或失敗）
+- memory_client()：以 mongomock-motor 提供與 Motor 相同介面的記憶體內資料庫
+"""
+import asyncio
+import importlib
+import random
+from typing import Dict, Iterable, Optional
+
+from app.services.storage_backend import StorageBackend, FileTooLargeError, UPLOAD_CHUNK_SIZE
+from app.services.upload_scheduler import upload_scheduler
+
+# 以 from app.services.storage import storage_service 取得全域實例的模組（替換後端時要一起換掉）
+STORAGE_SERVICE_MODULES = [
+    "app.services.storage",
+    "app.services.dedup_service",
+    "app.services.star_deletion_service",
+    "app.services.export_service",
+    "app.services.reconcile_service",
+    "app.routers.images",
+    "app.routers.files",
+]
+
+class InjectedStorageError(Exception):
+    """FakeStorageBackend 依錯誤率注入的失敗"""
+
+class FakeStorageBackend(StorageBackend):
+    """
+    假的儲存後端
+
+    上傳時與真正的後端一樣從檔案物件逐塊讀完（在上傳執行緒池中），
+    再等待 latency_ms ± jitter_ms；每次操作有 error_rate 的機率失敗。
+    下載回傳與記錄大小相同的隨機內容
+    """
+
+    def __init__(self, latency_ms: float = 50.0, jitter_ms: float = 10.0, error_rate: float = 0.0,
+                 seed: Optional[int] = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.configured = True
+        self._random = random.Random(seed)
+        self.files: Dict[str, int] = {}
+        self._payload = b""
+        self.uploads = 0
+        self.deletes = 0
+        self.errors = 0
+
+    async def _delay(self) -> None:
+        delay = max(0.0, self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms))
+        await asyncio.sleep(delay / 1000)
+        if self.error_rate and self._random.random() < self.error_rate:
+            self.errors += 1
+            raise InjectedStorageError("注入的儲存後端錯誤")
+
+    @staticmethod
+    def _consume_sync(file_obj, max_size: Optional[int]) -> int:
+        file_obj.seek(0)
+        size = 0
+        while True:
+            chunk = file_obj.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                return size
+            size += len(chunk)
+            if max_size is not None and size > max_size:
+                raise FileTooLargeError(f"檔案超過 {max_size} bytes 限制")
+
+    async def upload_file(self, file_obj, public_id: str, content_type: str,
+                          max_size: Optional[int] = None) -> str:
+        loop = asyncio.get_running_loop()
+        size = await loop.run_in_executor(upload_scheduler.executor, self._consume_sync, file_obj, max_size)
+        await self._delay()
+        self.files[public_id] = size
+        self.uploads += 1
+        return self.get_file_url(public_id)
+
+    async def delete_file(self, public_id: str) -> bool:
+        await self._delay()
+        self.deletes += 1
+        return self.files.pop(public_id, None) is not None
+
+    async def delete_files(self, public_ids: Iterable[str]) -> int:
+        """批次刪除（與 Cloudinary 一樣一次請求刪除一批）"""
+        public_ids = list(public_ids)
+        await self._delay()
+        self.deletes += len(public_ids)
+        return sum(1 for public_id in public_ids if self.files.pop(public_id, None) is not None)
+
+    def get_file_url(self, public_id: str) -> str:
+        return f"https://fake-storage.invalid/{public_id}"
+
+    async def read_file(self, public_id: str) -> bytes:
+        await self._delay()
+        size = self.files.get(public_id)
+        if size is None:
+            raise FileNotFoundError(public_id)
+        if len(self._payload) <= size:
+            self._payload = self._random.randbytes(size + 1)
+        # 每次回傳新的 bytes 物件（與真正下載一樣配置記憶體）
+        return self._payload[1:size + 1]
+
+def install_storage(backend: StorageBackend) -> StorageBackend:
+    """把 app 使用的儲存後端換成 backend，回傳原本的後端"""
+    original = importlib.import_module("app.services.storage").storage_service
+    for module_name in STORAGE_SERVICE_MODULES:
+        module = importlib.import_module(module_name)
+        module.storage_service = backend
+    return original
+
+def memory_client():
+    """
+    記憶體內的 Motor 替代品（mongomock-motor）
+
+    mongomock 的 bulk_write 不接受新版 pymongo 傳入的 sort 參數，這裡忽略它
+    （app 的 bulk_write 不使用 sort）；create_indexes 會丟掉 IndexModel 的 partialFilterExpression
+    （images 的 (star_id, content_hash) 唯一索引只涵蓋有雜湊的圖片），這裡改成逐一以 create_index 建立
+    """
+    from mongomock.collection import BulkOperationBuilder, Collection
+    from mongomock_motor import AsyncMongoMockClient
+
+    add_update = BulkOperationBuilder.add_update
+    if not getattr(add_update, "_ignores_sort", False):
+        def add_update_without_sort(self, *args, sort=None, **kwargs):
+            return add_update(self, *args, **kwargs)
+        add_update_without_sort._ignores_sort = True
+        BulkOperationBuilder.add_update = add_update_without_sort
+    if not getattr(Collection.create_indexes, "_keeps_partial_filter", False):
+        def create_indexes(self, indexes, session=None):
+            return [
+                self.create_index(
+                    list(index.document["key"].items()),
+                    session=session,
+                    **{option: value for option, value in index.document.items() if option != "key"}
+                )
+                for index in indexes
+            ]
+        create_indexes._keeps_partial_filter = True
+        Collection.create_indexes = create_indexes
+    return AsyncMongoMockClient()
@@ -0,0 +1,423 @@
+"""
+API 效能測試套件
+
+透過 ASGI 直接呼叫 API（不經過網路），量測各情境的吞吐量與 p50 / p95 / p99：
+- star_search：GET /api/stars?search=...（依明星數量）
+- image_paging：GET /api/stars/{id}/images 以游標翻頁（依圖片數量）
+- batch_upload：POST /api/stars/{id}/images/upload，一次 1 / 10 / 50 個檔案
+- star_delete：DELETE /api/stars/{id}（依圖片數量）
+- gallery_export：GET /api/stars/{id}/images/export 串流下載整個圖庫的 ZIP（依圖片數量），
+  另外記錄 MB/s 與匯出期間 Python 配置的記憶體峰值（tracemalloc，應與圖片數量無關）
+
+資料庫可以是記憶體內的 Motor 替代品（--db memory，不需要 mongod）或真正的 MongoDB
+（--db mongodb://...，測試資料寫入指定的資料庫，結束後整個刪除）。
+儲存後端固定使用 FakeStorageBackend，可設定延遲與錯誤率。
+回應快取預設關閉，量測的是資料庫查詢路徑（--cache 可開啟）。
+
+結果寫成 JSON，--compare 可與之前的結果比較，p95 變慢超過門檻時標示為退步。
+
+使用方式（在 backend 目錄下執行）：
+    python -m benchmarks.suite.run --db memory --sizes 100 1000
+    python -m benchmarks.suite.run --db mongodb://localhost:27017/kpop_gallery_bench \\
+        --output benchmarks/results/mongo.json --compare benchmarks/results/base.json
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Awaitable, Callable, List, Optional
+
+import httpx
+from bson import ObjectId
+from PIL import Image
+
+from app.config import settings
+from app.database import database, connect_to_mongo, close_mongo_connection, get_database
+from app.indexes import ensure_indexes
+from app.main import app
+from app.services.star_search_service import star_search_service
+from benchmarks.suite.fakes import FakeStorageBackend, install_storage, memory_client
+
+SYLLABLES = ["ji", "min", "soo", "yeon", "hye", "jin", "woo", "seo", "na", "ra", "kim", "park",
+             "lee", "choi", "jung", "kang", "yoon", "jang", "han", "song", "ha", "eun", "bin", "young"]
+
+UPLOAD_BATCH_SIZES = [1, 10, 50]
+PAGE_LIMIT = 20
+
+def percentile(sorted_samples: List[float], p: float) -> float:
+    """nearest-rank 百分位數"""
+    if not sorted_samples:
+        return 0.0
+    index = max(0, min(len(sorted_samples) - 1, int(round(p / 100 * len(sorted_samples) + 0.5)) - 1))
+    return sorted_samples[index]
+
+def summarize(scenario: str, size: Optional[int], params: dict, latencies: List[float],
+              errors: int, wall_seconds: float, items_per_request: int = 1) -> dict:
+    samples = sorted(latencies)
+    count = len(samples)
+    result = {
+        "scenario": scenario,
+        "size": size,
+        "params": params,
+        "requests": count,
+        "errors": errors,
+        "throughput_rps": round(count / wall_seconds, 2) if wall_seconds else 0.0,
+        "mean_ms": round(sum(samples) / count, 3) if count else 0.0,
+        "p50_ms": round(percentile(samples, 50), 3),
+        "p95_ms": round(percentile(samples, 95), 3),
+        "p99_ms": round(percentile(samples, 99), 3),
+        "max_ms": round(samples[-1], 3) if samples else 0.0,
+    }
+    if items_per_request != 1:
+        result["items_per_second"] = round(count * items_per_request / wall_seconds, 2) if wall_seconds else 0.0
+    label = f"{scenario}[size={size}]" if size is not None else scenario
+    if params:
+        label += "".join(f"[{k}={v}]" for k, v in params.items())
+    print(f"{label:<44} n={count:<5} err={errors:<3} {result['throughput_rps']:>9.1f} req/s  "
+          f"p50={result['p50_ms']:8.2f}ms  p95={result['p95_ms']:8.2f}ms  p99={result['p99_ms']:8.2f}ms")
+    return result
+
+async def drive(calls: List[Callable[[], Awaitable[httpx.Response]]], concurrency: int,
+                ok_statuses=(200, 201, 204)) -> tuple:
+    """以 concurrency 個 worker 依序執行 calls，回傳 (每次的延遲毫秒, 錯誤數, 總耗時秒數)"""
+    queue = list(reversed(calls))
+    latencies: List[float] = []
+    errors = 0
+
+    async def worker() -> None:
+        nonlocal errors
+        while queue:
+            call = queue.pop()
+            started = time.perf_counter()
+            try:
+                response = await call()
+                failed = response.status_code not in ok_statuses
+            except Exception:
+                failed = True
+            latencies.append((time.perf_counter() - started) * 1000)
+            errors += failed
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+# ---------------------------------------------------------------- 測試資料
+
+def random_name(rng: random.Random, index: int) -> str:
+    given = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 2)))
+    family = rng.choice(SYLLABLES)
+    return f"{family} {given} {index}"
+
+async def reset(db) -> None:
+    for collection in ("stars", "images", "assets", "jobs"):
+        await db[collection].delete_many({})
+    await star_search_service.load(db)
+
+async def seed_stars(db, count: int, rng: random.Random) -> List[str]:
+    now = datetime.utcnow()
+    stars = [
+        {"name": random_name(rng, i), "created_at": now - timedelta(seconds=i), "image_count": 0,
+         "total_bytes": 0, "last_uploaded_at": None, "cover_image": None}
+        for i in range(count)
+    ]
+    result = await db.stars.insert_many(stars)
+    for star, star_id in zip(stars, result.inserted_ids):
+        star_search_service.add(str(star_id), star["name"], star["created_at"])
+    return [str(star_id) for star_id in result.inserted_ids]
+
+async def seed_images(db, star_id: str, count: int, storage: FakeStorageBackend, file_size: int = 1024) -> None:
+    base = datetime.utcnow()
+    batch = []
+    for i in range(count):
+        public_id = f"kpop_gallery/stars/{star_id}/bench_{i}"
+        storage.files[public_id] = file_size
+        batch.append({
+            "star_id": ObjectId(star_id),
+            "s3_key": public_id,
+            "s3_url": storage.get_file_url(public_id),
+            "filename": f"bench_{i}.jpg",
+            "file_size": file_size,
+            "mime_type": "image/jpeg",
+            "content_hash": os.urandom(32).hex(),
+            "uploaded_at": base - timedelta(seconds=i // 10),
+            "variants": [],
+            "width": 800,
+            "height": 1200,
+            "aspect_ratio": 0.6667,
+            "dominant_color": "#808080",
+            "blurhash": "L00000fQfQfQfQfQfQfQfQfQfQfQ",
+        })
+        if len(batch) == 5000:
+            await db.images.insert_many(batch)
+            batch = []
+    if batch:
+        await db.images.insert_many(batch)
+    await db.stars.update_one({"_id": ObjectId(star_id)}, {"$set": {"image_count": count, "total_bytes": count * file_size}})
+
+def make_jpeg(rng: random.Random) -> bytes:
+    """約 30KB 的 JPEG"""
+    image = Image.frombytes("RGB", (160, 160), rng.randbytes(160 * 160 * 3))
+    out = io.BytesIO()
+    image.save(out, "JPEG", quality=85)
+    return out.getvalue()
+
+# ---------------------------------------------------------------- 情境
+
+async def star_search(client, db, size: int, args, rng) -> dict:
+    await reset(db)
+    await seed_stars(db, size, rng)
+    queries = [rng.choice(SYLLABLES)[:rng.randint(1, 3)] for _ in range(args.requests)]
+    calls = [lambda q=q: client.get("/api/stars", params={"search": q}) for q in queries]
+    latencies, errors, wall = await drive(calls, args.concurrency)
+    return summarize("star_search", size, {}, latencies, errors, wall)
+
+async def image_paging(client, db, size: int, args, rng, storage) -> dict:
+    await reset(db)
+    star_id = (await seed_stars(db, 1, rng))[0]
+    await seed_images(db, star_id, size, storage)
+    # 先走一遍取得每一頁的游標（不計時），再隨機請求各頁
+    cursors = [None]
+    while True:
+        response = await client.get(f"/api/stars/{star_id}/images", params={"limit": PAGE_LIMIT, "cursor": cursors[-1]}
+                                    if cursors[-1] else {"limit": PAGE_LIMIT})
+        next_cursor = response.headers.get("x-next-cursor")
+        if not next_cursor:
+            break
+        cursors.append(next_cursor)
+    picks = [rng.choice(cursors) for _ in range(args.requests)]
+    calls = [
+        lambda cursor=cursor: client.get(
+            f"/api/stars/{star_id}/images",
+            params={"limit": PAGE_LIMIT, **({"cursor": cursor} if cursor else {})}
+        )
+        for cursor in picks
+    ]
+    latencies, errors, wall = await drive(calls, args.concurrency)
+    return summarize("image_paging", size, {"pages": len(cursors)}, latencies, errors, wall)
+
+async def batch_upload(client, db, files_per_request: int, args, rng) -> dict:
+    await reset(db)
+    star_ids = await seed_stars(db, args.upload_requests, rng)
+    payload = make_jpeg(rng)
+
+    def request_files():
+        # 每個檔案內容都不同（JPEG 結尾後加上隨機位元組），不會被內容去重略過
+        return [
+            ("files", (f"{i}.jpg", payload + os.urandom(16), "image/jpeg"))
+            for i in range(files_per_request)
+        ]
+
+    calls = [
+        lambda star_id=star_id: client.post(f"/api/stars/{star_id}/images/upload", files=request_files())
+        for star_id in star_ids
+    ]
+    latencies, errors, wall = await drive(calls, args.upload_concurrency)
+    return summarize("batch_upload", None, {"files": files_per_request}, latencies, errors, wall,
+                     items_per_request=files_per_request)
+
+async def star_delete(client, db, size: int, args, rng, storage) -> dict:
+    await reset(db)
+    latencies: List[float] = []
+    errors = 0
+    wall = 0.0
+    for _ in range(args.delete_requests):
+        star_id = (await seed_stars(db, 1, rng))[0]
+        await seed_images(db, star_id, size, storage)
+        call_latencies, call_errors, call_wall = await drive([lambda: client.delete(f"/api/stars/{star_id}")], 1)
+        latencies.extend(call_latencies)
+        errors += call_errors
+        wall += call_wall
+    return summarize("star_delete", size, {}, latencies, errors, wall)
+
+async def stream_get(path: str) -> tuple:
+    """
+    直接以 ASGI 呼叫 GET path，收到的內容只計算大小後丟棄，回傳 (狀態碼, 位元組數)
+
+    httpx 的 ASGITransport 會把整個回應存在記憶體中，量測串流回應的記憶體時不能使用
+    """
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+        "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 0), "server": ("bench", 80),
+    }
+    requested = False
+    finished = asyncio.Event()
+    status = 0
+    received = 0
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status, received
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            received += len(message.get("body", b""))
+            if not message.get("more_body", False):
+                finished.set()
+
+    await app(scope, receive, send)
+    finished.set()
+    return status, received
+
+async def gallery_export(db, size: int, args, rng, storage) -> dict:
+    await reset(db)
+    star_id = (await seed_stars(db, 1, rng))[0]
+    file_size = args.export_file_kb * 1024
+    await seed_images(db, star_id, size, storage, file_size)
+    path = f"/api/stars/{star_id}/images/export"
+
+    latencies: List[float] = []
+    errors = 0
+    archive_bytes = 0
+    started = time.perf_counter()
+    for _ in range(args.export_requests):
+        request_started = time.perf_counter()
+        status, received = await stream_get(path)
+        latencies.append((time.perf_counter() - request_started) * 1000)
+        errors += status != 200 or received < size * file_size
+        archive_bytes = received
+    wall = time.perf_counter() - started
+
+    # 另外跑一次量測記憶體（tracemalloc 會拖慢速度，不和計時混在一起）
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    await stream_get(path)
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+
+    result = summarize("gallery_export", size, {"file_kb": args.export_file_kb}, latencies, errors, wall)
+    result["archive_mb"] = round(archive_bytes / 1024 / 1024, 2)
+    result["mb_per_second"] = round(archive_bytes * len(latencies) / 1024 / 1024 / wall, 2) if wall else 0.0
+    result["peak_memory_mb"] = round(peak / 1024 / 1024, 2)
+    print(f"{'':<44} archive={result['archive_mb']}MB  {result['mb_per_second']} MB/s  "
+          f"peak memory={result['peak_memory_mb']}MB")
+    return result
+
+# ---------------------------------------------------------------- 結果
+
+def result_key(result: dict) -> str:
+    params = {k: v for k, v in result["params"].items() if k != "pages"}
+    return json.dumps([result["scenario"], result["size"], params], sort_keys=True)
+
+def compare(results: List[dict], baseline_path: str, threshold: float) -> int:
+    """與之前的結果比較 p95，回傳退步的項目數"""
+    baseline = {result_key(r): r for r in json.loads(Path(baseline_path).read_text())["results"]}
+    regressions = 0
+    print(f"\n與 {baseline_path} 比較（p95 變慢超過 {threshold:.0%} 視為退步）")
+    for result in results:
+        before = baseline.get(result_key(result))
+        if not before or not before["p95_ms"]:
+            continue
+        change = result["p95_ms"] / before["p95_ms"] - 1
+        flag = "⚠️  退步" if change > threshold else ""
+        regressions += change > threshold
+        print(f"{result_key(result):<60} p95 {before['p95_ms']:8.2f} -> {result['p95_ms']:8.2f}ms "
+              f"({change:+.1%}) {flag}")
+    return regressions
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return None
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="memory", help="memory 或 MongoDB 連接字串（資料庫會在結束後刪除）")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000], help="明星數 / 每個明星的圖片數")
+    parser.add_argument("--scenarios", nargs="+",
+                        default=["star_search", "image_paging", "batch_upload", "star_delete", "gallery_export"])
+    parser.add_argument("--requests", type=int, default=200, help="search / paging 每個大小的請求數")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--upload-requests", type=int, default=5, help="每種批次大小的上傳請求數")
+    parser.add_argument("--upload-concurrency", type=int, default=2)
+    parser.add_argument("--delete-requests", type=int, default=3)
+    parser.add_argument("--export-requests", type=int, default=3, help="每個大小的匯出請求數")
+    parser.add_argument("--export-file-kb", type=int, default=64, help="匯出測試每張圖片的大小")
+    parser.add_argument("--storage-latency-ms", type=float, default=50.0)
+    parser.add_argument("--storage-jitter-ms", type=float, default=10.0)
+    parser.add_argument("--storage-error-rate", type=float, default=0.0)
+    parser.add_argument("--cache", action="store_true", help="開啟回應快取")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="結果 JSON 的路徑（預設 benchmarks/results/<時間>.json）")
+    parser.add_argument("--compare", help="與之前的結果 JSON 比較")
+    parser.add_argument("--threshold", type=float, default=0.2, help="p95 變慢多少視為退步（0.2 = 20%%）")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    settings.response_cache_enabled = args.cache
+    settings.image_preprocess = False
+    storage = FakeStorageBackend(args.storage_latency_ms, args.storage_jitter_ms, args.storage_error_rate, args.seed)
+    original_storage = install_storage(storage)
+
+    if args.db == "memory":
+        database.client = memory_client()
+        settings.mongodb_uri = "mongodb://memory/kpop_gallery_bench"
+        await ensure_indexes(get_database())
+    else:
+        settings.mongodb_uri = args.db
+        await connect_to_mongo()
+    db = get_database()
+
+    results = []
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for size in args.sizes:
+                if "star_search" in args.scenarios:
+                    results.append(await star_search(client, db, size, args, rng))
+                if "image_paging" in args.scenarios:
+                    results.append(await image_paging(client, db, size, args, rng, storage))
+                if "star_delete" in args.scenarios:
+                    results.append(await star_delete(client, db, size, args, rng, storage))
+                if "gallery_export" in args.scenarios:
+                    results.append(await gallery_export(db, size, args, rng, storage))
+            if "batch_upload" in args.scenarios:
+                for files_per_request in UPLOAD_BATCH_SIZES:
+                    results.append(await batch_upload(client, db, files_per_request, args, rng))
+    finally:
+        if args.db == "memory":
+            database.client = None
+        else:
+            await db.client.drop_database(db.name)
+            await close_mongo_connection()
+        install_storage(original_storage)
+
+    output = Path(args.output or f"benchmarks/results/{datetime.utcnow():%Y%m%dT%H%M%SZ}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "commit": git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "db": "memory" if args.db == "memory" else "mongodb",
+            "args": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        },
+        "results": results,
+    }, indent=2, ensure_ascii=False))
+    print(f"\n結果已寫入 {output}")
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+"""
+回填既有圖片的版面資訊（寬高、長寬比、主色、blurhash）
+
+逐批讀取還沒有 blurhash 的圖片，從儲存空間下載原始檔案後擷取資訊並寫回 MongoDB。
+同時處理的圖片數由 --concurrency 限制；可以重複執行，已經處理過的圖片會被略過，
+無法解碼的圖片會標記 metadata_failed，之後不會再重試。
+
+使用方式（在 backend 目錄下執行，使用與 API 相同的 .env 設定）：
+    python -m scripts.backfill_image_metadata --concurrency 8
+"""
+import argparse
+import asyncio
+import io
+import time
+
+from app.database import connect_to_mongo, close_mongo_connection, get_database
+from app.services.image_metadata_service import image_metadata_service
+from app.services.storage import storage_service
+
+async def backfill(db, concurrency: int, limit: int = 0) -> dict:
+    """處理所有缺少版面資訊的圖片，回傳統計"""
+    semaphore = asyncio.Semaphore(concurrency)
+    pending = set()
+    stats = {"updated": 0, "failed": 0}
+    started = time.perf_counter()
+
+    async def process(image: dict) -> None:
+        try:
+            data = await storage_service.read_file(image["s3_key"])
+            metadata = await image_metadata_service.extract(io.BytesIO(data))
+            if metadata:
+                await db.images.update_one({"_id": image["_id"]}, {"$set": metadata})
+                stats["updated"] += 1
+            else:
+                await db.images.update_one({"_id": image["_id"]}, {"$set": {"metadata_failed": True}})
+                stats["failed"] += 1
+        except Exception as e:
+            # 下載失敗（例如暫時的網路錯誤）不標記，下次執行會再試
+            print(f"處理圖片 {image['_id']} 失敗: {str(e)}")
+            stats["failed"] += 1
+        finally:
+            semaphore.release()
+        done = stats["updated"] + stats["failed"]
+        if done % 100 == 0:
+            print(f"已處理 {done} 張（{done / (time.perf_counter() - started):.1f} 張/秒）")
+
+    cursor = db.images.find(
+        {"blurhash": {"$exists": False}, "metadata_failed": {"$ne": True}},
+        {"s3_key": 1}
+    )
+    if limit:
+        cursor = cursor.limit(limit)
+    try:
+        async for image in cursor:
+            # 同時處理的圖片數達到上限時，等待其中一張完成才繼續讀取
+            await semaphore.acquire()
+            task = asyncio.create_task(process(image))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+    finally:
+        if pending:
+            await asyncio.gather(*pending)
+    return stats
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--limit", type=int, default=0, help="最多處理幾張（0 表示全部）")
+    args = parser.parse_args()
+
+    await connect_to_mongo()
+    try:
+        stats = await backfill(get_database(), args.concurrency, args.limit)
+        print(f"✅ 回填完成：更新 {stats['updated']} 張，失敗 {stats['failed']} 張")
+    finally:
+        await close_mongo_connection()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,78 @@
+"""
+測試共用的 fixture
+
+- 資料庫：記憶體內的 Motor 替代品（mongomock-motor，不需要 mongod），每個測試一個新的資料庫，已建立索引
+- 儲存後端：檔案放在暫存目錄的 LocalStorageService
+- client：啟動整個 app 的 TestClient（lifespan 中的背景工作 worker 與索引載入都會執行）
+
+在 backend 目錄下執行：
+    pip install -r requirements-dev.txt
+    python -m pytest
+"""
+import io
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+import app.main as main
+from app.config import settings
+from app.database import database, get_database
+from app.indexes import ensure_indexes
+from app.services.local_storage_service import LocalStorageService
+from app.services.upload_scheduler import upload_scheduler
+from benchmarks.suite.fakes import install_storage, memory_client
+
+@pytest.fixture
+def storage(tmp_path):
+    backend = LocalStorageService(str(tmp_path / "storage"), "http://testserver")
+    original = install_storage(backend)
+    yield backend
+    install_storage(original)
+
+@pytest.fixture
+def client(storage, tmp_path, monkeypatch):
+    async def connect_to_memory():
+        database.client = memory_client()
+        await ensure_indexes(get_database())
+
+    monkeypatch.setattr(settings, "mongodb_uri", "mongodb://memory/kpop_gallery_test")
+    monkeypatch.setattr(settings, "resumable_upload_dir", str(tmp_path / "upload_sessions"))
+    monkeypatch.setattr(settings, "job_spool_dir", str(tmp_path / "job_spool"))
+    monkeypatch.setattr(settings, "response_cache_enabled", False)
+    monkeypatch.setattr(settings, "image_preprocess", False)
+    monkeypatch.setattr(settings, "image_eager_variants", False)
+    monkeypatch.setattr(main, "connect_to_mongo", connect_to_memory)
+    # 上一個測試的 app 關閉時排程器已經 drain（停止接受上傳）
+    monkeypatch.setattr(upload_scheduler, "draining", False)
+    with TestClient(main.app) as test_client:
+        yield test_client
+    database.client = None
+
+@pytest.fixture
+def db(client):
+    return get_database()
+
+@pytest.fixture
+def call(client):
+    """在 app 的事件循環中執行 coroutine 函式（直接讀寫資料庫、呼叫 service）"""
+    return client.portal.call
+
+@pytest.fixture
+def star_id(client):
+    response = client.post("/api/stars", json={"name": "測試明星"})
+    assert response.status_code == 201
+    return response.json()["id"]
+
+def _make_image(seed: int = 0, size=(64, 48), fmt: str = "PNG") -> bytes:
+    image = Image.new("RGB", size)
+    image.putdata([((x * 7 + seed * 31) % 256, (y * 5 + seed * 17) % 256, (x * y + seed) % 256)
+                   for y in range(size[1]) for x in range(size[0])])
+    output = io.BytesIO()
+    image.save(output, fmt)
+    return output.getvalue()
+
+@pytest.fixture
+def make_image():
+    """產生內容由 seed 決定的圖片（seed 相同時內容完全相同）"""
+    return _make_image
@@ -0,0 +1,48 @@
+"""背景上傳：與直接上傳相同的佇列上限，暫存目錄的磁碟用量有上限"""
+import os
+from datetime import datetime, timedelta
+
+from app.config import settings
+from app.services.job_service import JOB_QUEUED
+
+def upload_background(client, star_id, files):
+    return client.post(
+        f"/api/stars/{star_id}/images/upload",
+        params={"background": True},
+        files=[("files", (name, data, "image/png")) for name, data in files]
+    )
+
+def spooled(tmp_path):
+    root = tmp_path / "job_spool"
+    return sorted(os.listdir(root)) if root.exists() else []
+
+def test_queue_limit_counts_files_of_pending_jobs(client, db, call, star_id, make_image, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "upload_max_queued", 3)
+    # 還沒輪到執行的背景上傳（next_run_at 在未來，worker 不會認領）
+    call(db.jobs.insert_one, {
+        "type": "upload_images", "status": JOB_QUEUED, "next_run_at": datetime.utcnow() + timedelta(hours=1),
+        "params": {"star_id": star_id, "spool_bytes": 100}, "progress": {"total": 2, "succeeded": 0, "failed": 0}
+    })
+
+    response = upload_background(client, star_id, [(f"{seed}.png", make_image(seed)) for seed in range(2)])
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert call(db.jobs.count_documents, {}) == 1
+    assert spooled(tmp_path) == []
+
+    assert upload_background(client, star_id, [("0.png", make_image(0))]).status_code == 202
+
+def test_spool_size_limit_rejects_before_writing_to_disk(client, db, call, star_id, make_image, tmp_path, monkeypatch):
+    data = make_image(1)
+    monkeypatch.setattr(settings, "job_spool_max_bytes", len(data) * 2 - 1)
+
+    response = upload_background(client, star_id, [("a.png", data), ("b.png", make_image(2))])
+
+    assert response.status_code == 429
+    assert call(db.jobs.count_documents, {}) == 0
+    assert spooled(tmp_path) == []
+
+    assert upload_background(client, star_id, [("a.png", data)]).status_code == 202
+    job = call(db.jobs.find_one, {"type": "upload_images"})
+    assert job["params"]["spool_bytes"] == len(data)
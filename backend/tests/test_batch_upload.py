@@ -0,0 +1,62 @@
+"""批次上傳（部分成功）：每個檔案各自回報結果，失敗的檔案不留在儲存空間"""
+from app.routers import images
+
+def upload_batch(client, star_id, files):
+    return client.post(
+        f"/api/stars/{star_id}/images/upload/batch",
+        files=[("files", file) for file in files]
+    )
+
+def stored_files(storage):
+    return [path for path in storage.root.rglob("*") if path.is_file()]
+
+def test_each_file_reports_its_own_result(client, storage, star_id, make_image, monkeypatch):
+    upload_file = storage.upload_file
+
+    async def failing_upload_file(file_obj, public_id, content_type, max_size=None):
+        if public_id.endswith("_broken"):
+            raise ConnectionError("儲存空間無法連線")
+        return await upload_file(file_obj, public_id, content_type, max_size)
+
+    monkeypatch.setattr(storage, "upload_file", failing_upload_file)
+
+    response = upload_batch(client, star_id, [
+        ("good.png", make_image(1), "image/png"),
+        ("notes.txt", b"not an image", "text/plain"),
+        ("broken.png", make_image(2), "image/png"),
+    ])
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [result["status"] for result in body["results"]] == ["ok", "rejected", "failed"]
+    assert (body["succeeded"], body["rejected"], body["failed"]) == (1, 1, 1)
+    assert body["results"][0]["image"]["filename"] == "good.png"
+    assert body["results"][1]["image"] is None and body["results"][1]["error"]
+    assert len(stored_files(storage)) == 1
+    assert client.get(f"/api/stars/{star_id}").json()["image_count"] == 1
+
+def test_same_content_in_one_batch_is_stored_once(client, storage, star_id, make_image):
+    data = make_image(3)
+
+    body = upload_batch(client, star_id, [("a.png", data, "image/png"), ("b.png", data, "image/png")]).json()
+
+    assert [result["status"] for result in body["results"]] == ["ok", "ok"]
+    assert body["results"][0]["image"]["id"] == body["results"][1]["image"]["id"]
+    assert len(stored_files(storage)) == 1
+    assert client.get(f"/api/stars/{star_id}").json()["image_count"] == 1
+
+def test_uploaded_files_are_deleted_when_records_are_not_written(client, storage, star_id, make_image, monkeypatch):
+    async def insert_nothing(db, new_images):
+        for image_dict in new_images:
+            image_dict["_id"] = None
+        return set(), set()
+
+    monkeypatch.setattr(images, "_insert_images", insert_nothing)
+
+    body = upload_batch(client, star_id, [
+        (f"{seed}.png", make_image(seed), "image/png") for seed in range(3)
+    ]).json()
+
+    assert [result["status"] for result in body["results"]] == ["failed"] * 3
+    assert stored_files(storage) == []
+    assert client.get(f"/api/stars/{star_id}").json()["image_count"] == 0
@@ -0,0 +1,91 @@
+"""內容去重：(star_id, content_hash) 唯一索引與 global 模式的引用次數"""
+from bson import ObjectId
+
+from app.config import settings
+from app.routers import images
+
+def upload(client, star_id, files):
+    return client.post(
+        f"/api/stars/{star_id}/images/upload",
+        files=[("files", (name, data, "image/png")) for name, data in files]
+    )
+
+def stored_files(storage):
+    return sorted(path for path in storage.root.rglob("*") if path.is_file())
+
+def test_same_content_in_one_request_creates_one_image(client, storage, star_id, make_image):
+    data = make_image(1)
+    response = upload(client, star_id, [("a.png", data), ("b.png", data)])
+
+    assert response.status_code == 201
+    first, second = response.json()
+    assert first["id"] == second["id"]
+    assert len(stored_files(storage)) == 1
+    assert client.get(f"/api/stars/{star_id}").json()["image_count"] == 1
+
+def test_duplicate_key_on_insert_returns_existing_image_and_discards_upload(
+    client, db, call, storage, star_id, make_image, monkeypatch
+):
+    data = make_image(2)
+    existing = upload(client, star_id, [("first.png", data)]).json()[0]
+    prepare_image = images.prepare_image
+
+    async def racing_prepare_image(file, star_id, db, reject_near_duplicates=False):
+        # 模擬並發的請求：去重檢查時還沒有記錄，寫入前另一個請求先寫入了相同內容的圖片
+        await db.images.delete_one({"_id": ObjectId(existing["id"])})
+        image_dict = await prepare_image(file, star_id, db, reject_near_duplicates)
+        await db.images.insert_one({**racing, "_id": ObjectId(existing["id"])})
+        return image_dict
+
+    racing = call(db.images.find_one, {"_id": ObjectId(existing["id"])})
+    monkeypatch.setattr(images, "prepare_image", racing_prepare_image)
+
+    response = upload(client, star_id, [("second.png", data)])
+
+    assert response.status_code == 201
+    assert response.json()[0]["id"] == existing["id"]
+    assert call(db.images.count_documents, {"star_id": ObjectId(star_id)}) == 1
+    # 這次上傳的檔案已經刪除，只剩先寫入的那張
+    assert stored_files(storage) == [storage.path_for(racing["s3_key"])]
+
+def test_global_dedup_shares_file_until_last_reference_is_deleted(client, db, call, storage, make_image, monkeypatch):
+    monkeypatch.setattr(settings, "dedup_scope", "global")
+    data = make_image(3)
+    star_ids = [client.post("/api/stars", json={"name": name}).json()["id"] for name in ("A", "B")]
+    uploaded = [upload(client, star_id, [("same.png", data)]).json()[0] for star_id in star_ids]
+
+    records = [call(db.images.find_one, {"_id": ObjectId(image["id"])}) for image in uploaded]
+    assert records[0]["s3_key"] == records[1]["s3_key"]
+    asset = call(db.assets.find_one, {"_id": records[0]["content_hash"]})
+    assert asset["ref_count"] == 2
+    path = storage.path_for(records[0]["s3_key"])
+
+    assert client.delete(f"/api/stars/images/{uploaded[0]['id']}").status_code == 204
+    assert call(db.assets.find_one, {"_id": records[0]["content_hash"]})["ref_count"] == 1
+    assert path.exists()
+
+    assert client.delete(f"/api/stars/images/{uploaded[1]['id']}").status_code == 204
+    assert call(db.assets.find_one, {"_id": records[0]["content_hash"]}) is None
+    assert not path.exists()
+
+def test_star_scope_image_does_not_release_global_asset_with_same_content(
+    client, db, call, storage, make_image, monkeypatch
+):
+    data = make_image(4)
+    star_ids = [client.post("/api/stars", json={"name": name}).json()["id"] for name in ("A", "B", "C")]
+    # A 在 DEDUP_SCOPE=star 時上傳（自己的檔案，但也記錄了 content_hash）
+    own = upload(client, star_ids[0], [("same.png", data)]).json()[0]
+    monkeypatch.setattr(settings, "dedup_scope", "global")
+    shared = [upload(client, star_id, [("same.png", data)]).json()[0] for star_id in star_ids[1:]]
+
+    own_key = call(db.images.find_one, {"_id": ObjectId(own["id"])})["s3_key"]
+    shared_key = call(db.images.find_one, {"_id": ObjectId(shared[0]["id"])})["s3_key"]
+    content_hash = call(db.images.find_one, {"_id": ObjectId(own["id"])})["content_hash"]
+    assert own_key != shared_key
+
+    assert client.delete(f"/api/stars/images/{own['id']}").status_code == 204
+
+    # 自己的檔案被刪除，共用檔案的引用次數不變
+    assert not storage.path_for(own_key).exists()
+    assert storage.path_for(shared_key).exists()
+    assert call(db.assets.find_one, {"_id": content_hash})["ref_count"] == 2
@@ -0,0 +1,157 @@
+"""直接上傳的 finalize：大小、類型與寬高必須來自儲存後端，過期或不符合限制的檔案被刪除"""
+import time
+from datetime import datetime, timedelta
+
+import cloudinary.api
+import cloudinary.exceptions
+import cloudinary.uploader
+import cloudinary.utils
+import pytest
+from bson import ObjectId
+
+from app.config import settings
+from app.routers.images import MAX_FILE_SIZE
+from app.services.cloudinary_service import DIRECT_UPLOAD_EXPIRES_CONTEXT, CloudinaryService
+from benchmarks.suite.fakes import install_storage
+
+def request_tickets(client, star_id, files):
+    response = client.post(
+        f"/api/stars/{star_id}/images/direct-uploads",
+        json={"files": [
+            {"filename": name, "content_type": "image/png", "file_size": size} for name, size in files
+        ]}
+    )
+    assert response.status_code == 200
+    return response.json()
+
+def direct_upload(client, ticket, data):
+    return client.post(
+        "/api/files/direct-upload",
+        data=ticket["fields"],
+        files={"file": (ticket["filename"], data, "image/png")}
+    )
+
+def finalize(client, star_id, uploads):
+    return client.post(
+        f"/api/stars/{star_id}/images/direct-uploads/finalize",
+        json={"files": [{"filename": name, "result": result} for name, result in uploads]}
+    )
+
+def test_local_finalize_records_server_side_metadata(client, db, call, star_id, make_image):
+    data = make_image(1, size=(80, 40))
+    # 客戶端申報的大小不可信，以實際收到的檔案為準
+    ticket, = request_tickets(client, star_id, [("a.png", 1)])
+    result = direct_upload(client, ticket, data).json()
+
+    response = finalize(client, star_id, [("a.png", result)])
+
+    assert response.status_code == 201
+    image, = response.json()
+    assert (image["file_size"], image["mime_type"], image["width"], image["height"]) == (len(data), "image/png", 80, 40)
+    # 重送 finalize 回傳同一張圖片，不會重複建立
+    assert finalize(client, star_id, [("a.png", result)]).json()[0]["id"] == image["id"]
+    assert call(db.images.count_documents, {"star_id": ObjectId(star_id)}) == 1
+
+def test_local_finalize_rejects_tampered_result(client, db, call, star_id, make_image):
+    ticket, = request_tickets(client, star_id, [("a.png", 100)])
+    result = direct_upload(client, ticket, make_image(2)).json()
+
+    response = finalize(client, star_id, [("a.png", {**result, "bytes": 1})])
+
+    assert response.status_code == 400
+    assert call(db.images.count_documents, {}) == 0
+
+def test_local_direct_upload_rejects_expired_ticket(client, star_id, make_image, monkeypatch):
+    monkeypatch.setattr(settings, "direct_upload_expires_seconds", -1)
+    ticket, = request_tickets(client, star_id, [("a.png", 100)])
+
+    assert direct_upload(client, ticket, make_image(3)).status_code == 403
+
+@pytest.fixture
+def cloudinary_storage(client, monkeypatch):
+    """已設定的 CloudinaryService，Cloudinary 的 API 換成記憶體中的假資源"""
+    service = CloudinaryService()
+    service.configured = True
+    resources = {}
+    destroyed = []
+
+    def resource(public_id, resource_type="image"):
+        if public_id not in resources:
+            raise cloudinary.exceptions.NotFound(public_id)
+        return resources[public_id]
+
+    def destroy(public_id, resource_type="image"):
+        destroyed.append(public_id)
+        return {"result": "ok" if resources.pop(public_id, None) else "not found"}
+
+    monkeypatch.setattr(cloudinary.utils, "verify_api_response_signature",
+                        lambda public_id, version, signature: signature == f"signed:{public_id}:{version}")
+    monkeypatch.setattr(cloudinary.api, "resource", resource)
+    monkeypatch.setattr(cloudinary.uploader, "destroy", destroy)
+    original = install_storage(service)
+    yield service, resources, destroyed
+    install_storage(original)
+
+def cloudinary_upload(service, resources, star_id, expires_in=900, uploaded_at=None, **fields):
+    """模擬客戶端直接上傳到 Cloudinary，回傳 (Cloudinary 的回應, 客戶端送給 finalize 的結果)"""
+    public_id = service.generate_public_id(star_id, "a.png")
+    created_at = uploaded_at or datetime.utcnow()
+    resources[public_id] = {
+        "public_id": public_id,
+        "version": 1700000000,
+        "format": "png",
+        "bytes": 2048,
+        "width": 30,
+        "height": 20,
+        "secure_url": f"https://res.cloudinary.com/test/image/upload/v1700000000/{public_id}.png",
+        "created_at": created_at.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "context": {"custom": {DIRECT_UPLOAD_EXPIRES_CONTEXT: str(int(time.time()) + expires_in)}},
+        **fields
+    }
+    result = {"public_id": public_id, "version": 1700000000, "signature": f"signed:{public_id}:1700000000"}
+    return resources[public_id], result
+
+def test_cloudinary_finalize_uses_resource_metadata(client, star_id, cloudinary_storage):
+    service, resources, destroyed = cloudinary_storage
+    resource, result = cloudinary_upload(service, resources, star_id)
+
+    # 客戶端在結果中偽造的大小與寬高不會被採用
+    response = finalize(client, star_id, [("a.png", {**result, "bytes": 1, "width": 1, "height": 1})])
+
+    assert response.status_code == 201
+    image, = response.json()
+    assert (image["file_size"], image["mime_type"], image["width"], image["height"]) == (2048, "image/png", 30, 20)
+    assert image["s3_url"] == resource["secure_url"]
+    assert destroyed == []
+
+@pytest.mark.parametrize("fields", [{"bytes": MAX_FILE_SIZE + 1}, {"format": "pdf"}])
+def test_cloudinary_finalize_deletes_file_that_breaks_limits(client, db, call, star_id, cloudinary_storage, fields):
+    service, resources, destroyed = cloudinary_storage
+    resource, result = cloudinary_upload(service, resources, star_id, **fields)
+
+    response = finalize(client, star_id, [("a.png", result)])
+
+    assert response.status_code == 400
+    assert destroyed == [resource["public_id"]]
+    assert call(db.images.count_documents, {}) == 0
+
+def test_cloudinary_finalize_deletes_file_uploaded_after_ticket_expired(client, db, call, star_id, cloudinary_storage):
+    service, resources, destroyed = cloudinary_storage
+    resource, result = cloudinary_upload(
+        service, resources, star_id, expires_in=-600, uploaded_at=datetime.utcnow() - timedelta(seconds=60)
+    )
+
+    response = finalize(client, star_id, [("a.png", result)])
+
+    assert response.status_code == 400
+    assert destroyed == [resource["public_id"]]
+    assert call(db.images.count_documents, {}) == 0
+
+def test_cloudinary_finalize_rejects_bad_signature_and_missing_file(client, star_id, cloudinary_storage):
+    service, resources, destroyed = cloudinary_storage
+    resource, result = cloudinary_upload(service, resources, star_id)
+
+    assert finalize(client, star_id, [("a.png", {**result, "signature": "forged"})]).status_code == 400
+    del resources[resource["public_id"]]
+    assert finalize(client, star_id, [("a.png", result)]).status_code == 400
+    assert destroyed == []
@@ -0,0 +1,28 @@
+"""版面資訊擷取：合併成批的處理保留 task 參照，關閉時可以等待完成"""
+import asyncio
+import io
+
+from app.services.image_metadata_service import ImageMetadataService
+
+def test_batches_are_tracked_until_done_and_drained(make_image):
+    service = ImageMetadataService()
+
+    async def run():
+        extracts = [asyncio.create_task(service.extract(io.BytesIO(make_image(seed)))) for seed in range(3)]
+        await asyncio.sleep(0)
+        # 還在合併視窗內的檔案由 drain 立即送出
+        assert await service.drain(5)
+        assert not service._tasks
+        return await asyncio.gather(*extracts)
+
+    results = asyncio.run(run())
+
+    assert [(result["width"], result["height"]) for result in results] == [(64, 48)] * 3
+
+def test_undecodable_file_returns_none():
+    service = ImageMetadataService()
+
+    async def run():
+        return await service.extract(io.BytesIO(b"not an image"))
+
+    assert asyncio.run(run()) is None
@@ -0,0 +1,88 @@
+"""儲存空間對帳：孤兒檔案的刪除與重新連結，處理前再確認沒有記錄"""
+import uuid
+
+import pytest
+from bson import ObjectId
+
+from app.config import settings
+from app.services import reconcile_service
+from benchmarks.suite.fakes import FakeStorageBackend, install_storage
+
+@pytest.fixture(autouse=True)
+def no_grace(monkeypatch):
+    monkeypatch.setattr(settings, "reconcile_grace_seconds", 0)
+
+def orphan(storage, star_id, data, name="orphan"):
+    """直接寫進儲存空間、沒有圖片記錄的檔案"""
+    public_id = f"{storage.public_id_prefix(star_id)}{uuid.uuid4()}_{name}"
+    path = storage.path_for(public_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return public_id
+
+def upload(client, star_id, data):
+    response = client.post(f"/api/stars/{star_id}/images/upload", files=[("files", ("a.png", data, "image/png"))])
+    assert response.status_code == 201
+    return response.json()[0]
+
+def test_orphans_are_deleted_and_dangling_records_reported(client, db, call, storage, star_id, make_image):
+    kept = upload(client, star_id, make_image(1))
+    lost = upload(client, star_id, make_image(2))
+    lost_key = call(db.images.find_one, {"_id": ObjectId(lost["id"])})["s3_key"]
+    storage.path_for(lost_key).unlink()
+    public_id = orphan(storage, star_id, make_image(3))
+
+    dry = call(reconcile_service.reconcile_storage, db, True)
+    assert (dry["orphans"], dry["deleted"], dry["dangling"]) == (1, 0, 1)
+    assert storage.path_for(public_id).exists()
+
+    report = call(reconcile_service.reconcile_storage, db, False)
+
+    assert (report["orphans"], report["deleted"], report["dangling"], report["pass_completed"]) == (1, 1, 1, True)
+    assert not storage.path_for(public_id).exists()
+    kept_key = call(db.images.find_one, {"_id": ObjectId(kept["id"])})["s3_key"]
+    assert storage.path_for(kept_key).exists()
+
+def test_file_recorded_after_the_merge_is_not_deleted(client, db, call, storage, star_id, make_image, monkeypatch):
+    finalized = orphan(storage, star_id, make_image(1), "finalized")
+    stray = orphan(storage, star_id, make_image(2), "stray")
+    merge_page = reconcile_service._merge_page
+
+    async def merge_then_finalize(db, files, last_key, upper, report):
+        orphans = await merge_page(db, files, last_key, upper, report)
+        # 比對之後、刪除之前，直接上傳的 finalize 剛好寫入了記錄
+        await db.images.insert_one({"star_id": ObjectId(star_id), "s3_key": finalized, "file_size": 1})
+        return orphans
+
+    monkeypatch.setattr(reconcile_service, "_merge_page", merge_then_finalize)
+
+    report = call(reconcile_service.reconcile_storage, db, False)
+
+    assert report["orphans"] == 2
+    assert report["deleted"] == 1
+    assert storage.path_for(finalized).exists()
+    assert not storage.path_for(stray).exists()
+
+def test_relink_restores_records_only_for_live_stars(client, db, call, storage, star_id, make_image):
+    relinked = orphan(storage, star_id, make_image(1, size=(40, 20)), "photo")
+    deleted_star = str(ObjectId())
+    gone = orphan(storage, deleted_star, make_image(2))
+
+    report = call(reconcile_service.reconcile_storage, db, False, True)
+
+    assert (report["relinked"], report["deleted"]) == (1, 1)
+    assert not storage.path_for(gone).exists()
+    image = call(db.images.find_one, {"s3_key": relinked})
+    assert (image["star_id"], image["filename"], image["width"], image["height"]) == (ObjectId(star_id), "photo.png", 40, 20)
+    assert client.get(f"/api/stars/{star_id}").json()["image_count"] == 1
+
+def test_backend_without_listing_is_rejected(client, db, call, storage):
+    install_storage(FakeStorageBackend(latency_ms=0, jitter_ms=0))
+
+    response = client.post("/api/stars/images/reconcile", params={"dry_run": False})
+
+    assert response.status_code == 501
+    assert call(db.jobs.count_documents, {"type": "reconcile_storage"}) == 0
+    with pytest.raises(reconcile_service.ReconcileUnsupportedError):
+        call(reconcile_service.reconcile_storage, db, False)
+    assert call(db.reconcile_state.find_one, {}) is None
@@ -0,0 +1,85 @@
+"""可續傳上傳：Upload-Offset 的認領、續傳與 finalize"""
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from app.services.upload_session_service import upload_session_service
+
+def create_session(client, star_id, data, filename="a.png"):
+    response = client.post(
+        f"/api/stars/{star_id}/uploads",
+        json={"filename": filename, "content_type": "image/png", "size": len(data)}
+    )
+    assert response.status_code == 201
+    return response.json()["id"]
+
+def patch(client, star_id, upload_id, offset, chunk):
+    return client.patch(
+        f"/api/stars/{star_id}/uploads/{upload_id}",
+        content=chunk,
+        headers={"Upload-Offset": str(offset), "Content-Type": "application/offset+octet-stream"}
+    )
+
+def test_chunks_resume_from_offset_and_finalize_once(client, db, call, storage, star_id, make_image):
+    data = make_image(1)
+    upload_id = create_session(client, star_id, data)
+    half = len(data) // 2
+
+    response = patch(client, star_id, upload_id, 0, data[:half])
+    assert response.status_code == 204
+    assert response.headers["Upload-Offset"] == str(half)
+    assert client.head(f"/api/stars/{star_id}/uploads/{upload_id}").headers["Upload-Offset"] == str(half)
+    # 還沒收到全部內容
+    assert client.post(f"/api/stars/{star_id}/uploads/{upload_id}/finalize").status_code == 409
+
+    assert patch(client, star_id, upload_id, half, data[half:]).status_code == 204
+    response = client.post(f"/api/stars/{star_id}/uploads/{upload_id}/finalize")
+
+    assert response.status_code == 201
+    image = response.json()
+    assert image["file_size"] == len(data)
+    record = call(db.images.find_one, {"_id": ObjectId(image["id"])})
+    assert storage.path_for(record["s3_key"]).read_bytes() == data
+    # 重送 finalize 回傳同一張圖片
+    assert client.post(f"/api/stars/{star_id}/uploads/{upload_id}/finalize").json()["id"] == image["id"]
+    assert call(db.images.count_documents, {"star_id": ObjectId(star_id)}) == 1
+
+def test_wrong_offset_is_rejected_with_current_offset(client, star_id, make_image):
+    data = make_image(2)
+    upload_id = create_session(client, star_id, data)
+    assert patch(client, star_id, upload_id, 0, data[:100]).status_code == 204
+
+    for offset in (0, 50, 200):
+        response = patch(client, star_id, upload_id, offset, data[offset:offset + 10])
+        assert response.status_code == 409
+        assert response.headers["Upload-Offset"] == "100"
+
+def test_chunk_is_rejected_while_another_request_holds_the_write_lease(client, db, call, star_id, make_image):
+    data = make_image(3)
+    upload_id = create_session(client, star_id, data)
+    # 模擬另一個 worker process 正在寫入這個上傳
+    call(db.upload_sessions.update_one, {"_id": ObjectId(upload_id)},
+         {"$set": {"writing_until": datetime.utcnow() + timedelta(seconds=60), "write_token": "other"}})
+
+    assert patch(client, star_id, upload_id, 0, data).status_code == 409
+
+    # 租約過期（寫入的 process 當掉）之後可以接手
+    call(db.upload_sessions.update_one, {"_id": ObjectId(upload_id)},
+         {"$set": {"writing_until": datetime.utcnow() - timedelta(seconds=1)}})
+    assert patch(client, star_id, upload_id, 0, data).status_code == 204
+
+def test_bytes_past_the_claimed_offset_are_discarded_on_resume(client, db, call, storage, star_id, make_image):
+    data = make_image(4)
+    upload_id = create_session(client, star_id, data)
+    offset = len(data) - 10
+    assert patch(client, star_id, upload_id, 0, data[:offset]).status_code == 204
+    # 中斷的寫入在暫存檔留下了沒有被記錄的內容
+    session = call(upload_session_service.get, db, star_id, upload_id)
+    with open(upload_session_service.path_for(session), "ab") as f:
+        f.write(b"\x00" * 50)
+
+    assert patch(client, star_id, upload_id, offset, data[offset:]).status_code == 204
+    image = client.post(f"/api/stars/{star_id}/uploads/{upload_id}/finalize").json()
+
+    record = call(db.images.find_one, {"_id": ObjectId(image["id"])})
+    assert storage.path_for(record["s3_key"]).read_bytes() == data
@@ -0,0 +1,60 @@
+"""刪除明星的圖片：統計與併發刪除一致，儲存空間刪除失敗時保留記錄供重試"""
+import pytest
+from bson import ObjectId
+
+from app.services import star_deletion_service
+from app.services.storage_backend import StorageDeleteError
+
+def upload(client, star_id, files):
+    response = client.post(
+        f"/api/stars/{star_id}/images/upload",
+        files=[("files", (name, data, "image/png")) for name, data in files]
+    )
+    assert response.status_code == 201
+    return response.json()
+
+def test_star_totals_stay_exact_when_batch_races_another_delete(client, db, call, star_id, make_image):
+    uploaded = upload(client, star_id, [(f"{seed}.png", make_image(seed)) for seed in range(3)])
+    records = call(db.images.find({"star_id": ObjectId(star_id)}).to_list, None)
+    assert len(records) == 3
+
+    # 另一個請求先刪除了其中一張（已經扣過統計），批次刪除仍然帶著三張
+    assert client.delete(f"/api/stars/images/{uploaded[0]['id']}").status_code == 204
+    deleted = call(star_deletion_service._delete_batch, db, star_id, records)
+
+    assert deleted == 2
+    star = client.get(f"/api/stars/{star_id}").json()
+    assert star["image_count"] == 0
+    assert star["total_bytes"] == 0
+
+def test_records_are_kept_for_files_the_storage_failed_to_delete(
+    client, db, call, storage, star_id, make_image, monkeypatch
+):
+    uploaded = upload(client, star_id, [(f"{seed}.png", make_image(seed)) for seed in range(3)])
+    stuck = call(db.images.find_one, {"_id": ObjectId(uploaded[1]["id"])})
+    delete_file_sync = storage._delete_file_sync
+
+    def flaky_delete_file_sync(public_id):
+        if public_id == stuck["s3_key"]:
+            raise OSError("儲存空間暫時無法連線")
+        return delete_file_sync(public_id)
+
+    monkeypatch.setattr(storage, "_delete_file_sync", flaky_delete_file_sync)
+
+    with pytest.raises(StorageDeleteError) as error:
+        call(star_deletion_service.delete_star_images, db, star_id)
+
+    assert error.value.failed == [stuck["s3_key"]]
+    remaining = call(db.images.find({"star_id": ObjectId(star_id)}).to_list, None)
+    assert [image["_id"] for image in remaining] == [stuck["_id"]]
+    assert remaining[0]["delete_remote"] is True
+    assert storage.path_for(stuck["s3_key"]).exists()
+    star = client.get(f"/api/stars/{star_id}").json()
+    assert (star["image_count"], star["total_bytes"]) == (1, stuck["file_size"])
+
+    # 重新執行時重試剩下的檔案
+    monkeypatch.setattr(storage, "_delete_file_sync", delete_file_sync)
+    assert call(star_deletion_service.delete_star_images, db, star_id) == 1
+    assert call(db.images.count_documents, {"star_id": ObjectId(star_id)}) == 0
+    assert not storage.path_for(stuck["s3_key"]).exists()
+    assert [path for path in storage.root.rglob("*") if path.is_file()] == []
@@ -1,6 +1,9 @@
 import { useState } from 'react';
 import { ConfirmDialog } from './ConfirmDialog';
 
+// 圖片格子的顯示寬度（ImageGallery 的欄寬最小 200px）
+const GRID_IMAGE_SIZES = '(max-width: 600px) 50vw, 300px';
+
 export const ImageCard = ({ image, onDelete, onClick }) => {
   const [imageLoaded, setImageLoaded] = useState(false);
   const [imageError, setImageError] = useState(false);
@@ -41,7 +44,8 @@ export const ImageCard = ({ image, onDelete, onClick }) => {
       style={{
         position: 'relative',
         aspectRatio: '1',
-        backgroundColor: '#f0f0f0',
+        // 圖片下載前先顯示主色（上傳時擷取）
+        backgroundColor: image.dominant_color || '#f0f0f0',
         borderRadius: '8px',
         overflow: 'hidden',
         cursor: 'pointer',
@@ -82,18 +86,27 @@ export const ImageCard = ({ image, onDelete, onClick }) => {
           載入失敗
         </div>
       ) : (
-        <img
-          src={image.s3_url}
-          alt={image.filename}
-          onLoad={() => setImageLoaded(true)}
-          onError={() => setImageError(true)}
-          style={{
-            width: '100%',
-            height: '100%',
-            objectFit: 'cover',
-            display: imageLoaded ? 'block' : 'none'
-          }}
-        />
+        <picture>
+          {/* 依瀏覽器支援的格式與格子寬度下載縮圖，不支援時才使用原圖 */}
+          {Object.entries(image.srcset || {}).map(([format, srcSet]) => (
+            <source key={format} type={`image/${format}`} srcSet={srcSet} sizes={GRID_IMAGE_SIZES} />
+          ))}
+          <img
+            src={image.s3_url}
+            alt={image.filename}
+            width={image.width || undefined}
+            height={image.height || undefined}
+            loading="lazy"
+            onLoad={() => setImageLoaded(true)}
+            onError={() => setImageError(true)}
+            style={{
+              width: '100%',
+              height: '100%',
+              objectFit: 'cover',
+              display: imageLoaded ? 'block' : 'none'
+            }}
+          />
+        </picture>
       )}
 
       <div style={{
@@ -1,36 +1,13 @@
-import { useState, useEffect } from 'react';
+import { useState } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { ConfirmDialog } from './ConfirmDialog';
-import { imagesService } from '../services/images';
+import { buildSrcSet } from '../services/images';
 
 export const StarCard = ({ star, onDelete }) => {
   const navigate = useNavigate();
   const [showConfirmDialog, setShowConfirmDialog] = useState(false);
-  const [previewImage, setPreviewImage] = useState(null);
-  const [loadingImage, setLoadingImage] = useState(true);
-
-  // 獲取明星的圖片（隨機選擇一張）
-  useEffect(() => {
-    const loadPreviewImage = async () => {
-      try {
-        setLoadingImage(true);
-        // 獲取多張圖片以便隨機選擇
-        const images = await imagesService.getStarImages(star.id, 1, 10);
-        if (images && images.length > 0) {
-          // 隨機選擇一張
-          const randomIndex = Math.floor(Math.random() * images.length);
-          setPreviewImage(images[randomIndex]);
-        }
-      } catch (err) {
-        // 如果獲取失敗或沒有圖片，保持 previewImage 為 null
-        console.error('載入預覽圖失敗:', err);
-      } finally {
-        setLoadingImage(false);
-      }
-    };
-
-    loadPreviewImage();
-  }, [star.id]);
+  // 封面圖片與圖片數由明星列表 API 一起回傳，不需要再逐一查詢圖片
+  const previewImage = star.cover_image;
 
   const handleClick = () => {
     navigate(`/stars/${star.id}`);
@@ -72,16 +49,21 @@ export const StarCard = ({ star, onDelete }) => {
     >
       {previewImage ? (
         <>
-          <img
-            src={previewImage.s3_url}
-            alt={star.name}
-            style={{
-              width: '100%',
-              height: '100%',
-              objectFit: 'cover',
-              flex: 1
-            }}
-          />
+          <picture style={{ display: 'flex', flex: 1, minHeight: 0 }}>
+            {Object.entries(buildSrcSet(previewImage.variants)).map(([format, srcSet]) => (
+              <source key={format} type={`image/${format}`} srcSet={srcSet} sizes="300px" />
+            ))}
+            <img
+              src={previewImage.s3_url}
+              alt={star.name}
+              style={{
+                width: '100%',
+                height: '100%',
+                objectFit: 'cover',
+                flex: 1
+              }}
+            />
+          </picture>
           <div style={{
             position: 'absolute',
             bottom: 0,
@@ -94,6 +76,9 @@ export const StarCard = ({ star, onDelete }) => {
             <h3 style={{ margin: 0, fontSize: '1rem', fontWeight: '600' }}>
               {star.name}
             </h3>
+            <p style={{ margin: '0.25rem 0 0', fontSize: '0.75rem', opacity: 0.85 }}>
+              {star.image_count} 張圖片
+            </p>
           </div>
         </>
       ) : (
@@ -106,34 +91,28 @@ export const StarCard = ({ star, onDelete }) => {
             alignItems: 'center',
             justifyContent: 'center'
           }}>
-            {loadingImage ? (
-              <p style={{ color: '#999', fontSize: '0.875rem' }}>載入中...</p>
-            ) : (
-              <p style={{ 
-                color: '#999', 
-                fontSize: '0.875rem',
-                textAlign: 'center',
-                margin: 0
-              }}>
-                尚無圖片<br />快來新增吧
-              </p>
-            )}
-          </div>
-          {!loadingImage && (
-            <div style={{
-              position: 'absolute',
-              bottom: 0,
-              left: 0,
-              right: 0,
-              background: 'linear-gradient(to top, rgba(0,0,0,0.7), transparent)',
-              padding: '0.75rem',
-              color: 'white'
+            <p style={{ 
+              color: '#999', 
+              fontSize: '0.875rem',
+              textAlign: 'center',
+              margin: 0
             }}>
-              <h3 style={{ margin: 0, fontSize: '1rem', fontWeight: '600' }}>
-                {star.name}
-              </h3>
-            </div>
-          )}
+              尚無圖片<br />快來新增吧
+            </p>
+          </div>
+          <div style={{
+            position: 'absolute',
+            bottom: 0,
+            left: 0,
+            right: 0,
+            background: 'linear-gradient(to top, rgba(0,0,0,0.7), transparent)',
+            padding: '0.75rem',
+            color: 'white'
+          }}>
+            <h3 style={{ margin: 0, fontSize: '1rem', fontWeight: '600' }}>
+              {star.name}
+            </h3>
+          </div>
         </>
       )}
 
@@ -14,7 +14,7 @@ export const StarGallery = () => {
   const [loading, setLoading] = useState(true);
   const [loadingMore, setLoadingMore] = useState(false);
   const [error, setError] = useState('');
-  const [page, setPage] = useState(1);
+  const [nextCursor, setNextCursor] = useState(null);
   const [hasMore, setHasMore] = useState(true);
   const [selectedImage, setSelectedImage] = useState(null);
   const [alertMessage, setAlertMessage] = useState('');
@@ -38,7 +38,7 @@ export const StarGallery = () => {
   }, [starId]);
 
   // 載入圖片
-  const loadImages = useCallback(async (pageNum, append = false) => {
+  const loadImages = useCallback(async (cursor, append = false) => {
     if (!starId) return;
 
     try {
@@ -49,7 +49,8 @@ export const StarGallery = () => {
         setLoadingMore(true);
       }
 
-      const newImages = await imagesService.getStarImages(starId, pageNum, limit);
+      const { images: newImages, nextCursor: cursorForNext } =
+        await imagesService.getStarImagesByCursor(starId, cursor, limit);
       
       if (append) {
         setImages(prev => [...prev, ...newImages]);
@@ -57,7 +58,8 @@ export const StarGallery = () => {
         setImages(newImages);
       }
 
-      setHasMore(newImages.length === limit);
+      setNextCursor(cursorForNext);
+      setHasMore(cursorForNext !== null);
     } catch (err) {
       setError(err.response?.data?.detail || '載入圖片失敗');
     } finally {
@@ -68,16 +70,14 @@ export const StarGallery = () => {
 
   useEffect(() => {
     if (starId) {
-      loadImages(1, false);
+      loadImages(null, false);
     }
   }, [starId, loadImages]);
 
   // 載入更多圖片
   const handleLoadMore = () => {
     if (!loadingMore && hasMore) {
-      const nextPage = page + 1;
-      setPage(nextPage);
-      loadImages(nextPage, true);
+      loadImages(nextCursor, true);
     }
   };
 
@@ -88,7 +88,6 @@ export const StarGallery = () => {
     try {
       const newImages = await imagesService.uploadImages(starId, files);
       setImages([...newImages, ...images]);
-      setPage(1); // 重置分頁
     } catch (err) {
       throw err;
     }
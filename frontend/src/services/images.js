@@ -9,6 +9,16 @@ export const imagesService = {
     return response.data;
   },
 
+  // 以游標分頁取得明星的圖片列表（cursor 為 null 時取第一頁）
+  async getStarImagesByCursor(starId, cursor = null, limit = 20) {
+    const params = cursor ? { cursor, limit } : { limit };
+    const response = await api.get(`/api/stars/${starId}/images`, { params });
+    return {
+      images: response.data,
+      nextCursor: response.headers['x-next-cursor'] || null,
+    };
+  },
+
   // 取得單一圖片詳情
   async getImage(imageId) {
     const response = await api.get(`/api/stars/images/${imageId}`);
@@ -37,3 +47,13 @@ export const imagesService = {
 };
 
 
+
+// 衍生圖列表依格式組成 srcset（例如明星封面圖片）
+export const buildSrcSet = (variants = []) => {
+  const srcset = {};
+  variants.forEach(({ format, width, url }) => {
+    const entry = `${url} ${width}w`;
+    srcset[format] = srcset[format] ? `${srcset[format]}, ${entry}` : entry;
+  });
+  return srcset;
+};
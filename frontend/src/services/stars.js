@@ -1,13 +1,21 @@
 import api from './api';
 
 export const starsService = {
-  // 取得明星列表
-  async getStars(search) {
-    const params = search ? { search } : {};
+  // 取得明星列表（sort：created、recent、popular）
+  async getStars(search, sort) {
+    const params = {};
+    if (search) params.search = search;
+    if (sort) params.sort = sort;
     const response = await api.get('/api/stars', { params });
     return response.data;
   },
 
+  // 搜尋建議（typeahead）
+  async suggestStars(q, limit = 10) {
+    const response = await api.get('/api/stars/suggest', { params: { q, limit } });
+    return response.data;
+  },
+
   // 取得明星詳情
   async getStar(starId) {
     const response = await api.get(`/api/stars/${starId}`);